@@ -0,0 +1,60 @@
+"""
+The game engine and tools as one package, imported with no side effects.
+
+The classes live in the package's modules (blackjack.run,
+blackjack.rules, blackjack.simulate, ...) and are only imported when
+first used, so `import blackjack` is nearly free and e.g.
+`blackjack.Table` imports just the engine:
+
+    import blackjack
+    table = blackjack.Table(1000, rules=blackjack.RuleSet(hit_soft_17=True))
+
+Run `python3 -m blackjack` for the command line (see __main__.py), and
+`python3 -m blackjack.<module>` for the tools (simulate, replay, ...).
+"""
+
+# exported name -> module it is defined in
+EXPORTS = {
+    'Table': 'run',
+    'TableState': 'run',
+    'HandResult': 'run',
+    'Deck': 'run',
+    'Shoe': 'run',
+    'Hand': 'run',
+    'evaluate_hand': 'run',
+    'play': 'run',
+    'RuleSet': 'rules',
+    'StrategyTable': 'strategy',
+    'Simulator': 'simulate',
+    'MultiSeatSimulator': 'simulate',
+    'run_parallel': 'simulate',
+    'BatchSimulator': 'batch_sim',
+    'MultiSeatTable': 'multiseat',
+    'HandLogWriter': 'handlog',
+    'HandLogReader': 'handlog',
+    'Replayer': 'replay',
+    'Analytics': 'analytics',
+    'CountingSystem': 'counting',
+    'CountingSimulator': 'counting',
+    'Stream': 'rng',
+    'InfiniteShoe': 'shoes',
+    'ContinuousShuffler': 'shoes',
+}
+
+__all__ = list(EXPORTS)
+
+
+def __getattr__(name):
+    module = EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'blackjack' has no attribute '{name}'")
+    import importlib
+
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    # cache it so later lookups don't come back here
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,69 @@
+"""
+Command line entry point, playing at the terminal by default:
+
+    python3 -m blackjack [play] [--stack N] [--decks N]
+    python3 -m blackjack simulate [hands] [workers] [seed] [seats]
+    python3 -m blackjack bench run|compare ...
+
+Each command imports only the modules it needs once it has been chosen,
+so `play` draws its first frame within STARTUP_BUDGET_MS of the process
+starting. `python3 -m blackjack.bench run startup` measures it.
+"""
+
+import sys
+
+STARTUP_BUDGET_MS = 50
+
+
+def play(args):
+    # parsed by hand: argparse takes a third of the budget to import
+    options = {'--stack': 1000, '--decks': 6}
+    while args:
+        try:
+            if args[0] not in options:
+                raise ValueError
+            options[args[0]] = float(args[1]) if args[0] == '--stack' else int(args[1])
+        except (IndexError, ValueError):
+            print('usage: python3 -m blackjack play [--stack N] [--decks N]', file=sys.stderr)
+            return 2
+        args = args[2:]
+
+    from . import metrics
+    from . import run
+
+    metrics.install()
+    return run.play(options['--stack'], options['--decks'])
+
+
+def simulate(args):
+    from . import simulate
+
+    return simulate.main(args)
+
+
+def bench(args):
+    from . import bench
+
+    return bench.main(args)
+
+
+COMMANDS = {'play': play, 'simulate': simulate, 'bench': bench}
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    command = args[0] if args else 'play'
+    if command in ('-h', '--help'):
+        print(__doc__.strip())
+        return 0
+    if command not in COMMANDS:
+        # options without a command are for play
+        if command.startswith('--'):
+            return play(args)
+        print(f'Unknown command: {command} (expected {", ".join(COMMANDS)})', file=sys.stderr)
+        return 2
+    return COMMANDS[command](args[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""
+Streaming aggregation of player decision quality.
+
+Every decision is a situation (player total, soft flag, pair flag and
+dealer upcard, as keyed in strategy.py), the action taken and the action
+Table.optimal_strategy recommends. For each player, and for all players
+together, a fixed-size set of counters per situation is kept: decisions,
+deviations from the optimal action and the summed EV cost of those
+deviations. Memory depends only on the number of players, never on the
+number of decisions, and queries read the counters instead of history.
+
+The EV cost of a deviation is the EV of the optimal action minus the EV
+of the action taken (ev.situation_evs, from a full shoe less the dealer
+upcard, under the table's rules), in units of the initial bet. It is
+negative where the taken action is the better one (see
+`python3 -m blackjack.ev`).
+
+The EVs of every situation under a rule set are computed together, in a
+few seconds, the first time a deviation under those rules is costed
+(situation_ev_table()). A live service calls prepare() for its rules
+before taking players, so observing a decision is only a few lookups.
+
+Decisions arrive from a live Table (attach()) or by replaying a hand log
+(ingest_log()). Insurance decisions are not counted: they are not
+part of playing the hand. The game server observes every player's
+decisions when BLACKJACK_ANALYTICS is set (from_env()).
+
+Usage: python3 -m blackjack.analytics LOG [--player NAME] [--count N]
+"""
+
+import argparse
+import os
+import sys
+from functools import lru_cache
+
+from . import ev
+from .handlog import HandLogReader, RECORD
+from .replay import Replayer
+from .rules import RuleSet
+from .strategy import TOTALS, UPCARDS, decision_state, reachable_states
+
+SITUATIONS = TOTALS * 2 * 2 * UPCARDS
+
+
+def situation_index(total, soft, pair, upcard):
+    return ((total * 2 + soft) * 2 + pair) * UPCARDS + upcard
+
+
+def situation(index):
+    # (total, soft, pair, upcard) for a situation index
+    index, upcard = divmod(index, UPCARDS)
+    index, pair = divmod(index, 2)
+    total, soft = divmod(index, 2)
+    return total, bool(soft), bool(pair), upcard
+
+
+def situation_evs(rules, state):
+    # EVs of the permitted actions in a decision_state, from a full shoe
+    # less the upcard
+    total, soft, pair, upcard, double, split, surrender = state
+    # any card with the upcard's value
+    upcard_card = 12 if upcard == 11 else upcard - 2
+    comp = ev.remove(ev.full_shoe(rules.num_decks), upcard_card)
+    return ev.situation_evs(total, soft, pair, upcard, comp, double, split, surrender, rules=rules)
+
+
+@lru_cache(maxsize=None)
+def situation_ev_table(rules):
+    """
+    The EVs of every reachable decision_state under a rule set
+    """
+    evs = {}
+    for table, hand in reachable_states(rules, exhaustive=False):
+        state = decision_state(table, hand)
+        if state not in evs:
+            evs[state] = situation_evs(rules, state)
+    return evs
+
+
+@lru_cache(maxsize=None)
+def deviation_cost(rules, total, soft, pair, upcard, double, split, surrender, action, optimal):
+    """
+    EV given up by taking action instead of the optimal action
+    """
+    state = (total, soft, pair, upcard, double, split, surrender)
+    evs = situation_ev_table(rules).get(state) or situation_evs(rules, state)
+    return evs[optimal] - evs[action]
+
+
+class DecisionStats:
+    """
+    Decision, deviation and EV cost totals for every situation
+    """
+
+    def __init__(self):
+        self.decisions = [0] * SITUATIONS
+        self.deviations = [0] * SITUATIONS
+        self.cost = [0.0] * SITUATIONS
+
+    def merge(self, other):
+        for index in range(SITUATIONS):
+            self.decisions[index] += other.decisions[index]
+            self.deviations[index] += other.deviations[index]
+            self.cost[index] += other.cost[index]
+        return self
+
+    def totals(self):
+        decisions = sum(self.decisions)
+        deviations = sum(self.deviations)
+        return {
+            'decisions': decisions,
+            'deviations': deviations,
+            'deviation_rate': deviations / decisions if decisions else 0,
+            'cost': sum(self.cost)
+        }
+
+    def worst(self, count=10, min_decisions=1, key='cost'):
+        """
+        The count situations with the highest total EV cost (or
+        deviation_rate, or deviations), among those seen at least
+        min_decisions times
+        """
+        spots = []
+        for index, decisions in enumerate(self.decisions):
+            if decisions < min_decisions or not self.deviations[index]:
+                continue
+            total, soft, pair, upcard = situation(index)
+            spots += [{
+                'total': total,
+                'soft': soft,
+                'pair': pair,
+                'upcard': upcard,
+                'decisions': decisions,
+                'deviations': self.deviations[index],
+                'deviation_rate': self.deviations[index] / decisions,
+                'cost': self.cost[index]
+            }]
+        spots.sort(key=lambda spot: spot[key], reverse=True)
+        return spots[:count]
+
+
+class Analytics:
+    """
+    DecisionStats for each player and for all players, updated by
+    observe() with one decision at a time
+    """
+
+    def __init__(self):
+        self.players = {}
+        self.overall = DecisionStats()
+
+    def prepare(self, rules):
+        # compute the EVs for a rule set now rather than at its first deviation
+        situation_ev_table(rules)
+        return self
+
+    def observe(self, player, table, hand, action, optimal):
+        # a decision about to be taken on a table
+        if action == 'insure':
+            return
+        self.observe_state(player, decision_state(table, hand), table.rules, action, optimal)
+
+    def observe_state(self, player, state, rules, action, optimal):
+        # a decision given by its strategy.decision_state()
+        total, soft, pair, upcard, double, split, surrender = state
+        index = situation_index(total, soft, pair, upcard)
+        stats = self.players.get(player)
+        if stats is None:
+            stats = self.players[player] = DecisionStats()
+        stats.decisions[index] += 1
+        self.overall.decisions[index] += 1
+        if action == optimal:
+            return
+        cost = deviation_cost(rules, total, soft, pair, upcard, double, split, surrender, action, optimal)
+        for stats in (stats, self.overall):
+            stats.deviations[index] += 1
+            stats.cost[index] += cost
+
+    def attach(self, table, player):
+        """
+        Observe every decision taken on a table as the given player
+        """
+        table.record_actions = True
+        table.on_decision = lambda table, hand, action, optimal: self.observe(player, table, hand, action, optimal)
+        return table
+
+    def ingest_log(self, path, player='log'):
+        """
+        Observe every decision in a hand log by replaying it, counting
+        them all as the given player. Returns the number of hands that
+        couldn't be replayed, whose decisions are skipped.
+        """
+        replayer = Replayer()
+        decisions = []
+
+        def on_decision(table, hand, action, optimal):
+            # hold each hand's decisions until its replay is known to succeed
+            if action != 'insure':
+                decisions.append((decision_state(table, hand), table.rules, action, optimal))
+
+        replayer.on_decision = on_decision
+        size = RECORD.size
+        skipped = 0
+        with HandLogReader(path) as log:
+            count = len(log)
+            block_size = 100000
+            for start in range(0, count, block_size):
+                data = log.records[start:start + block_size].tobytes()
+                for offset in range(0, len(data), size):
+                    decisions.clear()
+                    try:
+                        replayer.replay(data[offset:offset + size])
+                    except (ValueError, IndexError):
+                        # a record that doesn't match its shoe, or whose
+                        # hand runs the redealt shoe dry
+                        skipped += 1
+                        continue
+                    for state, rules, action, optimal in decisions:
+                        self.observe_state(player, state, rules, action, optimal)
+        return skipped
+
+    def worst_spots(self, player=None, count=10, min_decisions=1, key='cost'):
+        """
+        The situations the player (or all players, if None) gets wrong
+        most, by total EV cost unless another DecisionStats.worst key
+        is given
+        """
+        stats = self.overall if player is None else self.players.get(player, DecisionStats())
+        return stats.worst(count, min_decisions, key)
+
+    def merge(self, other):
+        for player, stats in other.players.items():
+            self.players.setdefault(player, DecisionStats()).merge(stats)
+        self.overall.merge(other.overall)
+        return self
+
+
+def from_env(rules=None):
+    """
+    Analytics prepared for rules (the default rules if None), reporting
+    the overall totals and worst spots to stderr on exit, or None if
+    BLACKJACK_ANALYTICS isn't set
+    """
+    if not os.environ.get('BLACKJACK_ANALYTICS'):
+        return None
+    import atexit
+
+    analytics = Analytics().prepare(rules or RuleSet())
+    atexit.register(print_report, analytics, file=sys.stderr)
+    return analytics
+
+
+def spot_label(spot):
+    if spot['pair']:
+        hand = f'pair of {"A" if spot["soft"] else spot["total"] // 2}s'
+    else:
+        hand = f'{"soft" if spot["soft"] else "hard"} {spot["total"]}'
+    upcard = 'A' if spot['upcard'] == 11 else spot['upcard']
+    return f'{hand} vs {upcard}'
+
+
+def print_report(analytics, count=10, skipped=0, file=None):
+    totals = analytics.overall.totals()
+    print(f'Decisions: {totals["decisions"]}  Deviations: {totals["deviations"]} '
+          f'({totals["deviation_rate"]:.2%})  EV cost: {totals["cost"]:.2f} units'
+          f'{f"  Skipped hands: {skipped}" if skipped else ""}', file=file)
+    for spot in analytics.worst_spots(count=count):
+        print(f'{spot_label(spot):20} {spot["deviations"]:>8}/{spot["decisions"]:<8} '
+              f'{spot["deviation_rate"]:>7.1%} {spot["cost"]:>10.2f}', file=file)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Show the spots a hand log's player gets wrong most")
+    parser.add_argument('log', help='hand log written by handlog.py')
+    parser.add_argument('--player', default='log', help='name to record the decisions under')
+    parser.add_argument('--count', type=int, default=10)
+    args = parser.parse_args(args)
+
+    analytics = Analytics()
+    skipped = analytics.ingest_log(args.log, args.player)
+    print_report(analytics, args.count, skipped)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,397 @@
+"""
+Risk of ruin and session length for a starting stack and betting scheme,
+by Monte Carlo over whole sessions played on a Table with
+Table.optimal_strategy.
+
+A session starts with `stack` chips and plays hands, betting what the
+scheme asks for (at least min_bet, at most the stack), until the stack
+falls below min_bet (ruin), reaches `target`, or max_hands have been
+played. Risk of ruin is the fraction of sessions ruined within
+max_hands.
+
+Two variance reduction techniques are available:
+
+    common random numbers   every scheme plays session i from the same
+                            stream of shoes, so hand k of a session has
+                            the same cards under every scheme for as long
+                            as the play is the same, and the paired
+                            difference in ruin from the first scheme has
+                            a smaller variance than two independent
+                            estimates would (reported as crn_gain)
+    antithetic shoes        with antithetic=True, session i is also
+                            played on the antithetic (mirror image) shoes
+                            of the same stream (see run.Shoe) and the
+                            pair's mean is one observation. The gain is
+                            measured and reported (antithetic_gain); the
+                            mirror shoes barely correlate with the
+                            originals in this game, so it is off by
+                            default
+
+Sessions are played in blocks across a process pool and the estimates,
+with confidence intervals, are streamed after every block. The run stops
+once every scheme's risk of ruin is known to within `precision` (the
+confidence interval half-width) or max_sessions have been played. Blocks
+are merged in order and session i is always seeded with (seed, i), so the
+estimates don't depend on the number of workers.
+
+Usage: python3 -m blackjack.bankroll --stack 50 --target 100 --scheme flat:1 --scheme proportional:0.02
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from .rules import RuleSet
+from .run import Table, Shoe
+
+# normal quantiles for two-sided confidence levels
+Z_SCORES = {0.9: 1.645, 0.95: 1.96, 0.99: 2.576}
+
+# the largest target that keeps every stack within the Table limit of
+# 999999: a hand can at most return 2.5 times the stack
+MAX_TARGET = 399999
+
+
+class Flat:
+    """
+    The same bet every hand
+    """
+
+    def __init__(self, units=1):
+        self.units = units
+
+    def __call__(self, stack, last_bet, last_net):
+        return self.units
+
+    def __repr__(self):
+        return f'flat:{self.units:g}'
+
+
+class Proportional:
+    """
+    A fixed fraction of the current stack
+    """
+
+    def __init__(self, fraction):
+        if not 0 < fraction <= 1:
+            raise ValueError("Fraction of stack must be between 0 and 1")
+        self.fraction = fraction
+
+    def __call__(self, stack, last_bet, last_net):
+        return stack * self.fraction
+
+    def __repr__(self):
+        return f'proportional:{self.fraction:g}'
+
+
+class Martingale:
+    """
+    Double the bet after every loss, back to the base bet after a win or
+    push, up to `limit` doublings in a row
+    """
+
+    def __init__(self, base=1, limit=6):
+        self.base = base
+        self.limit = limit
+
+    def __call__(self, stack, last_bet, last_net):
+        if last_bet is None or last_net >= 0 or last_bet >= self.base * 2 ** self.limit:
+            return self.base
+        return last_bet * 2
+
+    def __repr__(self):
+        return f'martingale:{self.base:g}:{self.limit}'
+
+
+SCHEMES = {'flat': Flat, 'proportional': Proportional, 'martingale': Martingale}
+
+
+def parse_scheme(text):
+    # e.g. 'flat:5', 'proportional:0.02', 'martingale:1:6'
+    name, *args = text.split(':')
+    if name not in SCHEMES:
+        raise ValueError(f"Unknown betting scheme: {name}")
+    return SCHEMES[name](*[float(arg) if '.' in arg else int(arg) for arg in args])
+
+
+def play_session(scheme, seed, stack, target, min_bet=1, max_hands=100000, rules=None, antithetic=False):
+    """
+    Play one session and return (outcome, hands played), where outcome
+    is 'ruin', 'target' or 'limit' (max_hands reached)
+    """
+    rules = rules or RuleSet()
+    rng = random.Random(seed)
+    table = Table(stack, rng=rng, rules=rules)
+    if antithetic:
+        table.shoe = Shoe(rules.num_decks, seed=table.shoe.seed, antithetic=True)
+    policy = Table.optimal_strategy
+    last_bet = None
+    last_net = 0
+    for hands in range(max_hands):
+        stack = table.player_stack
+        if stack < min_bet:
+            return 'ruin', hands
+        if stack >= target:
+            return 'target', hands
+        if table.reshuffle:
+            table.shoe = Shoe(rules.num_decks, rng, antithetic=antithetic)
+            table.reshuffle = False
+        bet = min(max(scheme(stack, last_bet, last_net), min_bet), stack)
+        # same as start_hand() and step() without the state snapshots
+        table.reset_hand()
+        table.place_bet(bet)
+        table.deal()
+        while table.phase == 'action':
+            hand = table.active
+            table.take_action(policy(table, hand), hand)
+            table.advance()
+        last_bet = bet
+        last_net = table.player_stack - stack
+    stack = table.player_stack
+    return 'ruin' if stack < min_bet else 'target' if stack >= target else 'limit', max_hands
+
+
+class Estimate:
+    """
+    Running mean and variance of a stream of observations, from their
+    sum and sum of squares
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.total_squared = 0
+
+    def add(self, x):
+        self.count += 1
+        self.total += x
+        self.total_squared += x * x
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return 0
+        mean = self.mean
+        return max(self.total_squared - self.count * mean * mean, 0) / (self.count - 1)
+
+    def half_width(self, z=Z_SCORES[0.95]):
+        # of the normal confidence interval for the mean
+        return z * math.sqrt(self.variance / self.count) if self.count else math.inf
+
+
+class SchemeStats:
+    """
+    Estimates for one betting scheme. Each observation is a session, or
+    the mean of an antithetic pair of sessions.
+    """
+
+    def __init__(self):
+        self.ruin = Estimate()
+        self.length = Estimate()
+        # the same, counting each session on its own, to measure the
+        # gain from antithetic pairs
+        self.ruin_single = Estimate()
+        # paired difference in ruin from the first scheme
+        self.difference = Estimate()
+        self.outcomes = {'ruin': 0, 'target': 0, 'limit': 0}
+        self.lengths = []
+
+    def add(self, sessions, first_ruin):
+        # sessions: the (outcome, hands) of a session or antithetic pair
+        ruin = sum(outcome == 'ruin' for outcome, _ in sessions) / len(sessions)
+        self.ruin.add(ruin)
+        self.length.add(sum(hands for _, hands in sessions) / len(sessions))
+        self.difference.add(ruin - first_ruin)
+        for outcome, hands in sessions:
+            self.ruin_single.add(outcome == 'ruin')
+            self.outcomes[outcome] += 1
+            self.lengths += [hands]
+        return ruin
+
+    def report(self, z, first=None):
+        # first: the first scheme's SchemeStats, for the gain from
+        # common random numbers
+        lengths = sorted(self.lengths)
+        # variance of a single session over that of a pair mean, scaled
+        # to the same number of sessions: how many times fewer sessions
+        # the pairs need for the same precision
+        sessions_per_observation = len(lengths) / self.ruin.count if self.ruin.count else 1
+        antithetic_gain = (
+            self.ruin_single.variance / (sessions_per_observation * self.ruin.variance)
+            if sessions_per_observation > 1 and self.ruin.variance else None
+            )
+        # variance of the difference of independent estimates over that
+        # of the paired difference
+        crn_gain = (
+            (first.ruin.variance + self.ruin.variance) / self.difference.variance
+            if first is not None and self.difference.variance else None
+            )
+        return {
+            'sessions': len(lengths),
+            'risk_of_ruin': self.ruin.mean,
+            'risk_of_ruin_ci': self.ruin.half_width(z),
+            'mean_length': self.length.mean,
+            'mean_length_ci': self.length.half_width(z),
+            'median_length': lengths[len(lengths) // 2] if lengths else 0,
+            'p90_length': lengths[int(len(lengths) * 0.9)] if lengths else 0,
+            'outcomes': dict(self.outcomes),
+            'difference': self.difference.mean,
+            'difference_ci': self.difference.half_width(z),
+            'crn_gain': crn_gain,
+            'antithetic_gain': antithetic_gain
+        }
+
+
+def _session_block(args):
+    """
+    Play sessions start to stop for every scheme, each session (and its
+    antithetic pair) from the same seed for all schemes, and return a
+    list with each session's results for each scheme
+    """
+    schemes, seed, start, stop, stack, target, min_bet, max_hands, rules, antithetic = args
+    sides = (False, True) if antithetic else (False,)
+    return [
+        [
+            [play_session(scheme, f'{seed}:{index}', stack, target, min_bet, max_hands, rules, side) for side in sides]
+            for scheme in schemes
+        ]
+        for index in range(start, stop)
+    ]
+
+
+def estimate(schemes, stack, target, min_bet=1, max_hands=100000, precision=0.01, confidence=0.95,
+             min_sessions=200, max_sessions=100000, seed=0, workers=None, block_size=50,
+             rules=None, antithetic=False):
+    """
+    Yield a report after every block of sessions until every scheme's
+    risk of ruin confidence interval half-width is within precision
+    (once at least min_sessions sessions per scheme are in) or
+    max_sessions have been played. Each report has the SchemeStats
+    report of every scheme, in order, and whether the run has finished.
+
+    With normal confidence intervals a run where no session (or every
+    session) is ruined has a half-width of 0, so min_sessions should be
+    large enough to see a ruin at the smallest risk of interest.
+    """
+    schemes = list(schemes)
+    if not schemes:
+        raise ValueError("At least one betting scheme is needed")
+    if not min_bet <= stack < target:
+        raise ValueError("Stack must be at least the minimum bet and less than the target")
+    if target > MAX_TARGET:
+        raise ValueError(f"Target must be at most {MAX_TARGET}")
+    z = Z_SCORES.get(confidence)
+    if z is None:
+        raise ValueError(f"Confidence must be one of {', '.join(str(level) for level in Z_SCORES)}")
+    workers = workers or os.cpu_count()
+    # an antithetic pair is one observation of two sessions
+    observations = max_sessions // (2 if antithetic else 1)
+    blocks = (
+        (schemes, seed, start, min(start + block_size, observations), stack, target, min_bet, max_hands, rules, antithetic)
+        for start in range(0, observations, block_size)
+        )
+    stats = [SchemeStats() for _ in schemes]
+    start = time.perf_counter()
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        # imap keeps the block order so the estimates are always the same
+        results = pool.imap(_session_block, blocks) if pool else map(_session_block, blocks)
+        for block in results:
+            for sessions in block:
+                first_ruin = stats[0].add(sessions[0], 0)
+                for scheme_stats, scheme_sessions in zip(stats[1:], sessions[1:]):
+                    scheme_stats.add(scheme_sessions, first_ruin)
+            reports = [stats[0].report(z)] + [scheme_stats.report(z, stats[0]) for scheme_stats in stats[1:]]
+            precise = (
+                reports[0]['sessions'] >= min_sessions and
+                all(report['risk_of_ruin_ci'] <= precision for report in reports)
+                )
+            done = precise or stats[0].ruin.count >= observations
+            yield {
+                'schemes': [repr(scheme) for scheme in schemes],
+                'reports': reports,
+                'elapsed': time.perf_counter() - start,
+                'precise': precise,
+                'done': done
+            }
+            if done:
+                break
+    finally:
+        # stops any blocks still running once the estimate is precise
+        if pool:
+            pool.terminate()
+
+
+def run(*args, **kwargs):
+    """
+    Run estimate() to the end and return its final report
+    """
+    report = None
+    for report in estimate(*args, **kwargs):
+        pass
+    return report
+
+
+def format_progress(report):
+    return '  '.join(
+        f'{name}: {scheme["risk_of_ruin"]:.2%} ±{scheme["risk_of_ruin_ci"]:.2%}'
+        for name, scheme in zip(report['schemes'], report['reports'])
+        ) + f'  ({report["reports"][0]["sessions"]} sessions, {report["elapsed"]:.0f}s)'
+
+
+def print_report(report):
+    first = report['schemes'][0]
+    for index, (name, scheme) in enumerate(zip(report['schemes'], report['reports'])):
+        print(f'{name}')
+        print(f'  Risk of ruin: {scheme["risk_of_ruin"]:.2%} ±{scheme["risk_of_ruin_ci"]:.2%}')
+        print(f'  Session length: mean {scheme["mean_length"]:,.0f} ±{scheme["mean_length_ci"]:,.0f}  '
+              f'median {scheme["median_length"]:,}  90th percentile {scheme["p90_length"]:,}')
+        print(f'  Ruined / reached target / hit hand limit: {scheme["outcomes"]["ruin"]} / '
+              f'{scheme["outcomes"]["target"]} / {scheme["outcomes"]["limit"]}')
+        if index:
+            print(f'  Difference from {first}: {scheme["difference"]:+.2%} ±{scheme["difference_ci"]:.2%}')
+        if scheme['crn_gain'] is not None:
+            print(f'  Common random numbers variance reduction: {scheme["crn_gain"]:.2f}x')
+        if scheme['antithetic_gain'] is not None:
+            print(f'  Antithetic variance reduction: {scheme["antithetic_gain"]:.2f}x')
+    if not report['precise']:
+        print('Stopped at max sessions before reaching the target precision')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Estimate risk of ruin and session length for betting schemes')
+    parser.add_argument('--stack', type=float, default=50, help='starting stack')
+    parser.add_argument('--target', type=float, default=100, help='stack that ends a session as a win')
+    parser.add_argument('--scheme', action='append', type=parse_scheme,
+                        help='flat:UNITS, proportional:FRACTION or martingale:BASE:LIMIT (repeatable)')
+    parser.add_argument('--min-bet', type=float, default=1)
+    parser.add_argument('--max-hands', type=int, default=100000, help='hands per session')
+    parser.add_argument('--precision', type=float, default=0.01, help='confidence interval half-width to stop at')
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--min-sessions', type=int, default=200)
+    parser.add_argument('--max-sessions', type=int, default=100000)
+    parser.add_argument('--antithetic', action='store_true', help='also play every session on antithetic shoes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args(args)
+
+    report = None
+    for report in estimate(
+            args.scheme or [Flat(1)], args.stack, args.target, args.min_bet, args.max_hands,
+            args.precision, args.confidence, args.min_sessions, args.max_sessions, args.seed,
+            args.workers, antithetic=args.antithetic):
+        print(format_progress(report), flush=True)
+    print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import numpy as np
+
+from .run import Deck
+
+# marks an empty slot in a padded row of cards
+NO_CARD = -1
+
+# lookup arrays indexed by card id; the extra last entry is what NO_CARD
+# (-1) indexes, so padding contributes nothing to any of the sums
+CARD_VALUES = np.array([Deck.get_value(card) for card in range(52)] + [0], dtype=np.int16)
+CARD_ACES = (CARD_VALUES == 11).astype(np.int16)
+CARD_PRESENT = np.array([1] * 52 + [0], dtype=np.int16)
+
+
+def pack_hands(hands, width=None):
+    """
+    Pack a list of card lists into a 2-D int16 array, one row per hand,
+    padded with NO_CARD
+    """
+    width = width or max((len(hand) for hand in hands), default=0)
+    packed = np.full((len(hands), width), NO_CARD, dtype=np.int16)
+    for row, hand in enumerate(hands):
+        packed[row, :len(hand)] = hand
+    return packed
+
+
+def evaluate_hands(cards):
+    """
+    Evaluate many hands in one pass. cards is a 2-D array of card ids with
+    one hand per row, padded with NO_CARD. Returns a dict of value, soft and
+    blackjack arrays matching evaluate_hand() for every row.
+    """
+    cards = np.asarray(cards)
+    total = CARD_VALUES[cards].sum(axis=1, dtype=np.int16)
+    ace_count = CARD_ACES[cards].sum(axis=1, dtype=np.int16)
+    card_count = CARD_PRESENT[cards].sum(axis=1, dtype=np.int16)
+    # each ace counted as 1 instead of 11 takes 10 off the total; count
+    # only as many as needed to get to 21 or below
+    reductions = np.minimum(np.clip((total - 12) // 10, 0, None), ace_count)
+    value = total - 10 * reductions
+    return {
+        'value': value,
+        'blackjack': (card_count == 2) & (value == 21),
+        'soft': ace_count > reductions
+    }
@@ -0,0 +1,243 @@
+"""
+Headless simulation of many shoes at once, for the throughput a single
+core can't reach one hand at a time.
+
+A BatchSimulator deals lanes shoes side by side and plays one hand on
+every lane per step, each stage of the hand (the deal, the strategy
+lookup, the player's hits, the dealer's draws, settlement) as a handful
+of NumPy operations over all the lanes still in it. The cards, actions
+and payouts are those of Simulator.play_hand_fast() (see simulate.py)
+on each lane's shoe, so a lane plays the same hands a Simulator would
+from the same shoes. Splits, which a lane can't play, are handed to a
+Simulator on the lane's shoe, so every hand is played in full.
+
+Only the optimal strategy and the cut card Shoe (with any shuffle
+backend) can be played this way; policies and the shoes of shoes.py need
+Simulator. The lanes don't keep the shoes' counts or rank counts.
+"""
+
+import random
+import time
+
+import numpy as np
+
+from . import strategy
+from .run import Shoe, card_values
+from .simulate import Simulator, Stats, HIT, STAND, DOUBLE, SURRENDER
+from .strategy import ACTIONS, UPCARDS
+
+# the value of each card id
+VALUES = np.array(card_values, dtype=np.int64)
+
+# actions a lane can play, indexed by action code
+PLAYABLE = np.zeros(len(ACTIONS), dtype=bool)
+PLAYABLE[[HIT, STAND, DOUBLE, SURRENDER]] = True
+
+
+class BatchSimulator:
+    """
+    Plays hands with the optimal strategy on lanes shoes at once (see
+    above) and keeps running totals of the results, with the arguments,
+    run() and report() of Simulator.
+
+    Lane 0 is dealt the shoes a Simulator with the same seed or rng would
+    deal, the other lanes the shoes after them: each lane's first shoe in
+    lane order, then at each step a new shoe for each lane past its cut
+    card, in lane order.
+    """
+
+    def __init__(self, num_decks=6, bet=1, stack=1000, seed=None, rules=None, rng=None, lanes=1024):
+        if lanes < 1:
+            raise ValueError("A batch needs at least one lane")
+        self.rng = rng or (random.Random(seed) if seed is not None else random)
+        # plays the hands the lanes can't, and deals lane 0's first shoe
+        self.simulator = Simulator(num_decks, bet=bet, stack=stack, rules=rules, rng=self.rng)
+        table = self.simulator.table
+        rules = table.rules
+        if table.strategy_table is None:
+            table.strategy_table = strategy.table_for(rules)
+        self.entries = np.frombuffer(table.strategy_table.entries, dtype=np.uint8)
+        table.bet = bet
+        self.hand_bet = table.bet
+        self.num_decks = table.shoe.num_decks
+        self.size = 52 * self.num_decks
+        self.bet = bet
+        self.stack = stack
+        self.payout = rules.blackjack_payout
+        self.hit_soft_17 = rules.hit_soft_17
+        # the index bits of the first decision, as Simulator.play_hand_fast()
+        chips = stack - self.hand_bet >= self.hand_bet
+        self.first_bits = chips * 4 + rules.late_surrender
+        self.split_bit = (rules.max_hands > 1 and chips) * 2
+        self.lanes = lanes
+        self.shoes = [table.shoe] + [None] * (lanes - 1)
+        # every lane's cards as values, one row of size per lane, the index
+        # of each lane's next card in cards and the index past its cut card
+        self.cards = np.zeros(lanes * self.size, dtype=np.int64)
+        self.cursor = np.zeros(lanes, dtype=np.int64)
+        self.cut = np.zeros(lanes, dtype=np.int64)
+        self.reshuffle = np.ones(lanes, dtype=bool)
+        self.reshuffle[0] = False
+        self.load([0])
+        self.stats = Stats()
+        self.elapsed = 0
+
+    def new_shoe(self, lane):
+        # the shoe a lane deals from after a reshuffle
+        return Shoe(self.num_decks, self.rng)
+
+    def load(self, lanes):
+        # copy the cards of the lanes' shoes into their rows
+        size = self.size
+        shoes = [self.shoes[lane] for lane in lanes]
+        rows = np.frombuffer(b''.join(shoe.cards.tobytes() for shoe in shoes), dtype=np.uint8)
+        self.cards.reshape(self.lanes, size)[lanes] = VALUES[rows.reshape(len(shoes), size)]
+        lanes = np.asarray(lanes)
+        self.cursor[lanes] = lanes * size + [shoe.position for shoe in shoes]
+        self.cut[lanes] = lanes * size + size - np.array([shoe.reshuffle_point for shoe in shoes])
+
+    def play_hands(self, count=None):
+        """
+        Play a hand to completion on each of the first count lanes (all
+        of them by default), record them and return the net units won
+        """
+        count = self.lanes if count is None else count
+        reshuffle = np.flatnonzero(self.reshuffle[:count])
+        if reshuffle.size:
+            for lane in reshuffle.tolist():
+                self.shoes[lane] = self.new_shoe(lane)
+            self.load(reshuffle)
+            self.reshuffle[reshuffle] = False
+        cards = self.cards
+        entries = self.entries
+        start = self.cursor[:count].copy()
+        first = cards[start]
+        second = cards[start + 1]
+        upcard = cards[start + 2]
+        cursor = start + 3
+        # hands are kept as a hard total (aces as 1) and a count of aces
+        aces = (first == 11).astype(np.int64) + (second == 11)
+        hard = first + second - 10 * aces
+        natural = (aces > 0) & (hard == 11)
+        pair = first == second
+        soft = (aces > 0) & (hard <= 11)
+        value = hard + 10 * soft
+        action = entries[(((value * 2 + soft) * 2 + pair) * UPCARDS + upcard) * 8 + self.first_bits
+                         + pair * self.split_bit]
+        action[natural] = STAND
+        # lanes whose hand needs the Table, played once the others are
+        fallback = ~PLAYABLE[action]
+
+        hitting = np.flatnonzero(action == HIT)
+        while hitting.size:
+            card = cards[cursor[hitting]]
+            cursor[hitting] += 1
+            ace = card == 11
+            aces[hitting] += ace
+            hard[hitting] += card - 10 * ace
+            hitting = hitting[hard[hitting] <= 21]
+            lane_hard = hard[hitting]
+            lane_soft = (aces[hitting] > 0) & (lane_hard <= 11)
+            # no double, split or surrender after the first card
+            lane_action = entries[((lane_hard + 10 * lane_soft) * 2 + lane_soft) * 2 * UPCARDS * 8
+                                  + upcard[hitting] * 8]
+            fallback[hitting[(lane_action != HIT) & (lane_action != STAND)]] = True
+            hitting = hitting[lane_action == HIT]
+
+        doubled = action == DOUBLE
+        doubling = np.flatnonzero(doubled)
+        if doubling.size:
+            card = cards[cursor[doubling]]
+            cursor[doubling] += 1
+            ace = card == 11
+            aces[doubling] += ace
+            hard[doubling] += card - 10 * ace
+        surrendered = action == SURRENDER
+        value = hard + 10 * ((aces > 0) & (hard <= 11))
+
+        # the dealer cards settling needs, as Table.dealer_cards_needed()
+        needed = np.where(surrendered | natural, 1, np.where(value <= 21, 2, 0))
+        needed[fallback] = 0
+        dealer_aces = (upcard == 11).astype(np.int64)
+        dealer_hard = upcard - 10 * dealer_aces
+        drawing = np.flatnonzero(needed)
+        card = cards[cursor[drawing]]
+        cursor[drawing] += 1
+        ace = card == 11
+        dealer_aces[drawing] += ace
+        dealer_hard[drawing] += card - 10 * ace
+        dealer_blackjack = (needed > 0) & (dealer_aces > 0) & (dealer_hard == 11)
+        drawing = np.flatnonzero((needed == 2) & ~dealer_blackjack)
+        while drawing.size:
+            lane_hard = dealer_hard[drawing]
+            lane_soft = (dealer_aces[drawing] > 0) & (lane_hard <= 11)
+            lane_value = lane_hard + 10 * lane_soft
+            drawing = drawing[(lane_value < 17) | ((lane_value == 17) & lane_soft & self.hit_soft_17)]
+            card = cards[cursor[drawing]]
+            cursor[drawing] += 1
+            ace = card == 11
+            dealer_aces[drawing] += ace
+            dealer_hard[drawing] += card - 10 * ace
+        dealer_value = dealer_hard + 10 * ((dealer_aces > 0) & (dealer_hard <= 11))
+
+        # paid as Table.pay() and process_result()
+        bet = self.hand_bet
+        hand_bet = np.where(doubled, 2 * bet, bet)
+        live = value <= 21
+        winnings = np.select(
+            [surrendered & dealer_blackjack, surrendered, natural & dealer_blackjack, natural,
+             live & ((value > dealer_value) | (dealer_value > 21)), live & (value == dealer_value) & ~dealer_blackjack],
+            [0, hand_bet / 2, bet, bet * (1 + self.payout), hand_bet * 2, hand_bet], 0)
+        # the stack after the hand as Simulator.play_hand_fast() adds it up
+        net = (self.stack - bet) - np.where(doubled, bet, 0) + winnings - self.stack
+
+        played = ~fallback
+        stats = self.stats
+        stats.hands += int(np.count_nonzero(played))
+        stats.blackjacks += int(np.count_nonzero(natural))
+        stats.surrenders += int(np.count_nonzero(surrendered))
+        stats.doubles += int(np.count_nonzero(doubled & played))
+        stats.wins += int(np.count_nonzero((winnings > hand_bet) & played))
+        stats.pushes += int(np.count_nonzero((winnings == hand_bet) & played))
+        stats.losses += int(np.count_nonzero((winnings < hand_bet) & played))
+        net = net[played]
+        total = float(net.sum())
+        stats.net += total
+        stats.net_squared += float((net * net).sum())
+
+        lanes = np.flatnonzero(fallback)
+        if lanes.size:
+            # from the start of the hand, on the lane's shoe
+            simulator = self.simulator
+            table = simulator.table
+            for lane in lanes.tolist():
+                shoe = self.shoes[lane]
+                shoe.position = int(start[lane]) - lane * self.size
+                table.shoe = shoe
+                table.reshuffle = False
+                total += simulator.play_hand()
+                cursor[lane] = lane * self.size + shoe.position
+        self.cursor[:count] = cursor
+        self.reshuffle[:count] = cursor > self.cut[:count]
+        return total
+
+    def run(self, num_hands):
+        """
+        Play num_hands hands, a step at a time, and return the cumulative
+        report
+        """
+        play_hands = self.play_hands
+        start = time.perf_counter()
+        for _ in range(num_hands // self.lanes):
+            play_hands()
+        if num_hands % self.lanes:
+            play_hands(num_hands % self.lanes)
+        self.elapsed += time.perf_counter() - start
+        return self.report()
+
+    def report(self):
+        # the lanes' hands and those the simulator played for them
+        stats = Stats().merge(self.stats).merge(self.simulator.stats)
+        report = stats.report(self.bet)
+        report['hands_per_sec'] = stats.hands / self.elapsed if self.elapsed else 0
+        return report
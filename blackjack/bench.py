@@ -0,0 +1,356 @@
+"""
+Benchmarks for the hand engine and renderer.
+
+    python3 -m blackjack.bench run                    save results for HEAD
+    python3 -m blackjack.bench compare BASE [HEAD]    compare saved results
+
+Every case uses fixed seeds so runs are comparable. Results are saved as
+JSON in .benchmarks/<commit>.json; compare exits with status 1 if any
+case is slower in HEAD than in BASE by more than --threshold percent
+(and 2 if either has no saved results), and run exits with status 1 if
+startup is over its budget (STARTUP_BUDGET_MS in blackjack/__main__.py).
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from .__main__ import STARTUP_BUDGET_MS
+from .broadcast import Broadcast
+from .run import Table, Deck, Shoe, Hand, evaluate_hand
+from .screen import Screen
+from .simulate import Simulator
+
+# results are kept next to the blackjack package, at the repository root
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.benchmarks')
+
+
+class NullStream:
+    # discards frames so Table.print can be timed without a terminal
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def random_hands(count, seed=1):
+    rng = random.Random(seed)
+    return [[rng.randrange(52) for _ in range(rng.randint(2, 5))] for _ in range(count)]
+
+
+def decision_tables(count, seed=2):
+    """
+    Tables paused at a player decision, dealt from seeded shoes
+    """
+    rng = random.Random(seed)
+    tables = []
+    while len(tables) < count:
+        table = Table(1000, 6, rng)
+        table.start_hand(10)
+        if table.phase == 'action':
+            tables += [table]
+    return tables
+
+
+def bench_evaluate_hand():
+    hands = random_hands(1000)
+
+    def run():
+        for hand in hands:
+            evaluate_hand(hand)
+    return run, len(hands)
+
+
+def bench_hand_add():
+    hands = random_hands(1000)
+
+    def run():
+        for cards in hands:
+            Hand(cards).value
+    return run, len(hands)
+
+
+def bench_get_value():
+    cards = list(range(52)) * 20
+
+    def run():
+        for card in cards:
+            Deck.get_value(card)
+    return run, len(cards)
+
+
+def bench_get_label():
+    cards = list(range(52)) * 20
+
+    def run():
+        for card in cards:
+            Deck.get_label(card)
+    return run, len(cards)
+
+
+def bench_optimal_strategy():
+    tables = decision_tables(200)
+
+    def run():
+        for table in tables:
+            table.optimal_strategy()
+    return run, len(tables)
+
+
+def bench_action_permitted():
+    tables = decision_tables(200)
+
+    def run():
+        for table in tables:
+            table.action_permitted('hit')
+            table.action_permitted('stand')
+            table.action_permitted('double')
+            table.action_permitted('split')
+    return run, len(tables) * 4
+
+
+def bench_shoe():
+    rng = random.Random(3)
+
+    def run():
+        for _ in range(20):
+            Shoe(6, rng)
+    return run, 20
+
+
+def bench_shoe_batch():
+    # a whole batch of shoes from a Philox stream per run; rng (and
+    # numpy) is only imported for this case
+    from .rng import Stream
+
+    stream = Stream(3, 'philox')
+
+    def run():
+        for _ in range(stream.batch):
+            Shoe(6, stream)
+    return run, stream.batch
+
+
+def bench_print():
+    tables = decision_tables(50)
+    for table in tables:
+        table.screen = Screen(NullStream(), 100)
+
+    def run():
+        for table in tables:
+            # alternate messages so each frame differs from the last
+            table.print(['Hit (h), stand (s) or double (d)?'])
+            table.print(['Optimal action is to hit. Press s again to stand.'])
+    return run, len(tables) * 2
+
+
+def bench_broadcast():
+    # a frame drawn for 100 watchers, who never fall behind
+    tables = decision_tables(50)
+    for table in tables:
+        table.screen = Broadcast(None, 100)
+        for _ in range(100):
+            table.screen.watch(max_frames=float('inf'))
+
+    def run():
+        for table in tables:
+            table.print(['Hit (h), stand (s) or double (d)?'])
+            table.print(['Optimal action is to hit. Press s again to stand.'])
+            for watcher in table.screen.watchers:
+                watcher.buffer.clear()
+    return run, len(tables) * 2
+
+
+def bench_full_hand():
+    simulator = Simulator(seed=4)
+
+    def run():
+        for _ in range(1000):
+            simulator.play_hand()
+    return run, 1000
+
+
+def bench_batch_hand():
+    # a step of every lane per run; batch_sim is only imported for this case
+    from .batch_sim import BatchSimulator
+
+    simulator = BatchSimulator(seed=4)
+
+    def run():
+        simulator.play_hands()
+    return run, simulator.lanes
+
+
+def bench_startup():
+    # process start to the first frame of `python3 -m blackjack play`,
+    # which is written when the game waits for the bet
+    # the directory holding the blackjack package
+    directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, BLACKJACK_METRICS='', BLACKJACK_HAND_LOG='')
+
+    def run():
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'blackjack', 'play'], cwd=directory, env=env,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+        output = b''
+        while b'How much would you like to bet' not in output:
+            data = process.stdout.read1()
+            if not data:
+                raise RuntimeError('Game exited before drawing a frame')
+            output += data
+        process.kill()
+        process.wait()
+        process.stdin.close()
+        process.stdout.close()
+    return run, 1
+
+
+CASES = {
+    'evaluate_hand': bench_evaluate_hand,
+    'hand_add': bench_hand_add,
+    'deck_get_value': bench_get_value,
+    'deck_get_label': bench_get_label,
+    'optimal_strategy': bench_optimal_strategy,
+    'action_permitted': bench_action_permitted,
+    'shoe_construction': bench_shoe,
+    'shoe_batch': bench_shoe_batch,
+    'table_print': bench_print,
+    'broadcast': bench_broadcast,
+    'full_hand': bench_full_hand,
+    'batch_hand': bench_batch_hand,
+    'startup': bench_startup,
+}
+
+
+def measure(case, repeat=5, min_time=0.2):
+    """
+    Return the best time per operation in nanoseconds over repeat runs,
+    each looping the case for at least min_time seconds
+    """
+    run, operations = case()
+    run()
+    best = None
+    for _ in range(repeat):
+        loops = 0
+        start = time.perf_counter()
+        while True:
+            run()
+            loops += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        per_op = elapsed * 1e9 / (loops * operations)
+        best = per_op if best is None else min(best, per_op)
+    return best
+
+
+def current_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD']).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty else commit
+
+
+def results_path(name):
+    # a saved commit id or a path to a results file
+    if os.path.exists(name):
+        return name
+    return os.path.join(RESULTS_DIR, f'{name}.json')
+
+
+def run_cases(names, repeat, save):
+    """
+    Run and print the cases, saving the report if save is set. Return
+    the report and the names of cases over their budget.
+    """
+    results = {}
+    over_budget = []
+    for name in names:
+        ns = measure(CASES[name], repeat)
+        results[name] = {'ns_per_op': ns, 'ops_per_sec': 1e9 / ns}
+        print(f'{name:20} {ns:12,.0f} ns/op {1e9 / ns:14,.0f} ops/sec')
+        if name == 'startup' and ns > STARTUP_BUDGET_MS * 1e6:
+            print(f'{"":20} over the {STARTUP_BUDGET_MS} ms startup budget')
+            over_budget += [name]
+    report = {
+        'commit': current_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results
+    }
+    if save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = results_path(report['commit'])
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Saved {path}')
+    return report, over_budget
+
+
+def load_results(name):
+    # raises ValueError if there are no saved results for a commit
+    try:
+        with open(results_path(name)) as f:
+            return json.load(f)['results']
+    except FileNotFoundError:
+        raise ValueError(f"No benchmark results for {name}: run `python3 -m blackjack.bench run` at that commit")
+
+
+def compare(base, head, threshold):
+    """
+    Print the change per case and return the names of cases that got
+    slower by more than threshold percent
+    """
+    base_results = load_results(base)
+    head_results = load_results(head)
+    regressions = []
+    for name, result in head_results.items():
+        if name not in base_results:
+            continue
+        change = (result['ns_per_op'] / base_results[name]['ns_per_op'] - 1) * 100
+        regressed = change > threshold
+        if regressed:
+            regressions += [name]
+        print(f'{name:20} {change:+8.1f}%{"  REGRESSION" if regressed else ""}')
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark the hand engine and renderer')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('cases', nargs='*', help=f'cases to run (default: all): {", ".join(CASES)}')
+    run_parser.add_argument('--repeat', type=int, default=5)
+    run_parser.add_argument('--no-save', action='store_true', help="don't save the results")
+    compare_parser = commands.add_parser('compare', help='compare saved results')
+    compare_parser.add_argument('base', help='commit id or results file')
+    compare_parser.add_argument('head', nargs='?', help='commit id or results file (default: current commit)')
+    compare_parser.add_argument('--threshold', type=float, default=10, help='allowed slowdown in percent')
+    args = parser.parse_args(args)
+
+    if args.command == 'run':
+        unknown = [name for name in args.cases if name not in CASES]
+        if unknown:
+            parser.error(f'unknown cases: {", ".join(unknown)}')
+        _, over_budget = run_cases(args.cases or list(CASES), args.repeat, not args.no_save)
+        return 1 if over_budget else 0
+    try:
+        regressions = compare(args.base, args.head or current_commit(), args.threshold)
+    except ValueError as error_message:
+        print(error_message, file=sys.stderr)
+        return 2
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
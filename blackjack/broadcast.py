@@ -0,0 +1,131 @@
+"""
+Spectator broadcast: one table's frames streamed to any number of
+watchers.
+
+A Broadcast takes the place of a table's Screen. Each Table.print
+renders the frame once, as the diff against the previous frame that
+Screen.render produces, writes it to the player's own stream (if any)
+and, when anyone is watching, encodes it once and appends the same bytes
+to every watcher's buffer. An extra watcher costs a buffer append per
+frame, never a render or an encode.
+
+Each watcher's buffer holds at most max_frames frames. A diff only
+draws correctly over the frame before it, so a watcher that falls
+behind isn't sent a partial history: once its buffer is full, the
+frames waiting in it are dropped and replaced by a keyframe (the whole
+current frame, as drawn after clearing the screen), and diffs carry on
+from there. Keyframes are encoded at most once per frame, and only when
+a new or slow watcher needs one.
+"""
+
+import asyncio
+from collections import deque
+
+from .screen import Screen, CURSOR_HOME, ERASE_SCREEN
+
+# frames a watcher can fall behind by before it is sent a keyframe
+MAX_FRAMES = 16
+
+
+class Watcher:
+    """
+    One spectator's buffer of encoded frames, sent to a stream writer by
+    send_to()
+    """
+
+    def __init__(self, broadcast, max_frames=MAX_FRAMES):
+        self.broadcast = broadcast
+        self.max_frames = max_frames
+        self.buffer = deque()
+        self.ready = asyncio.Event()
+        # the next frame must be a keyframe: nothing has been sent yet
+        self.needs_keyframe = True
+        self.dropped = 0
+        self.closed = False
+
+    def push(self, data):
+        if self.needs_keyframe or len(self.buffer) >= self.max_frames:
+            self.dropped += len(self.buffer)
+            self.buffer.clear()
+            data = self.broadcast.keyframe()
+            self.needs_keyframe = False
+        self.buffer.append(data)
+        self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    async def send_to(self, writer):
+        """
+        Write frames to an asyncio StreamWriter as they arrive, until the
+        broadcast ends
+        """
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.buffer:
+                writer.write(self.buffer.popleft())
+                await writer.drain()
+            if self.closed:
+                return
+
+
+class Broadcast:
+    """
+    Draws a table's frames to the player's stream (None for a table
+    with no player watching it, e.g. a simulation) and to every watcher.
+    Used as a table's screen: table.screen = Broadcast(...).
+    """
+
+    def __init__(self, stream=None, lines=None, newline='\n'):
+        self.stream = stream
+        self.renderer = Screen(stream, lines, newline)
+        self.rows = None
+        # frames drawn so far, and the keyframe of the latest one
+        self.frames = 0
+        self.keyframe_data = None
+        self.keyframe_number = -1
+        self.watchers = set()
+
+    def reset(self):
+        self.renderer.reset()
+
+    def draw(self, rows):
+        text = self.renderer.render(rows)
+        self.rows = rows
+        self.frames += 1
+        if self.stream is not None:
+            self.stream.write(text)
+            self.stream.flush()
+        if self.watchers:
+            data = text.encode()
+            for watcher in self.watchers:
+                watcher.push(data)
+
+    def keyframe(self):
+        # the whole current frame, encoded once per frame
+        if self.keyframe_number != self.frames:
+            newline = self.renderer.newline
+            self.keyframe_data = (CURSOR_HOME + ERASE_SCREEN + newline.join(self.rows or ()) + newline).encode()
+            self.keyframe_number = self.frames
+        return self.keyframe_data
+
+    def watch(self, max_frames=MAX_FRAMES):
+        """
+        Add a watcher, starting from a keyframe of the current frame
+        """
+        watcher = Watcher(self, max_frames)
+        if self.rows is not None:
+            watcher.push(b'')
+        self.watchers.add(watcher)
+        return watcher
+
+    def unwatch(self, watcher):
+        self.watchers.discard(watcher)
+
+    def close(self):
+        # the table is finished: end every watcher's stream
+        for watcher in self.watchers:
+            watcher.close()
+        self.watchers.clear()
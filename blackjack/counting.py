@@ -0,0 +1,245 @@
+"""
+Card counting simulations: a counting system, a bet ramp driven by the
+count and optional index plays, played against the Shoe.reshuffle_point
+penetration model.
+
+The running count is kept by the Shoe itself, which adds each card's tag
+as the card is drawn (see run.Shoe), so counting adds nothing to a draw
+and the count is always current: at the bet it covers every card dealt
+from the shoe so far, and at a decision it also covers the cards of the
+hand in play. Balanced systems bet and play on the true count (running
+count per deck left, floored); unbalanced systems on the running count.
+
+For each system the report has the win rate and standard deviation per
+100 hands and N0, the number of hands after which the expected win
+equals one standard deviation, all in units of the minimum bet.
+
+Usage: python3 -m blackjack.counting [hands] [--system hi-lo ...] [--no-index] [--seed N]
+"""
+
+import argparse
+import math
+import sys
+
+from .run import Shoe, Deck
+from .simulate import Simulator
+
+
+class CountingSystem:
+    """
+    A card counting system: a tag for each rank, in Deck.card_ranks
+    order (2 to A). The system is balanced if the tags of a deck sum to 0.
+    """
+
+    def __init__(self, name, tags):
+        if len(tags) != 13:
+            raise ValueError("A counting system needs a tag for each of the 13 ranks")
+        self.name = name
+        self.tags = tuple(tags)
+        # sum of the tags over one deck
+        self.imbalance = 4 * sum(tags)
+        self.balanced = not self.imbalance
+
+    def initial_count(self, num_decks):
+        # an unbalanced count starts at minus the imbalance of all but
+        # one deck (4 - 4 per deck for KO), so the count it reaches at a
+        # given advantage is about the same for any number of decks
+        return -self.imbalance * (num_decks - 1)
+
+    def count(self, shoe):
+        """
+        The count bets and index plays are keyed on: the floored true
+        count for a balanced system, the running count otherwise
+        """
+        if self.balanced:
+            return math.floor(shoe.true_count())
+        return shoe.running_count
+
+    def __repr__(self):
+        return self.name
+
+
+SYSTEMS = {
+    'hi-lo': CountingSystem('hi-lo', (1, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1, -1)),
+    'ko': CountingSystem('ko', (1, 1, 1, 1, 1, 1, 0, 0, -1, -1, -1, -1, -1)),
+    'omega-ii': CountingSystem('omega-ii', (1, 1, 2, 2, 2, 1, 0, -1, -2, -2, -2, -2, 0)),
+}
+
+
+class BetRamp:
+    """
+    Bets (in units of the minimum bet) by count: the bet of the highest
+    step at or below the count, or the minimum bet below every step
+    """
+
+    def __init__(self, steps, minimum=1):
+        self.steps = sorted(steps)
+        self.minimum = minimum
+
+    def __call__(self, count):
+        bet = self.minimum
+        for step_count, step_bet in self.steps:
+            if count < step_count:
+                break
+            bet = step_bet
+        return bet
+
+    def __repr__(self):
+        return ','.join(f'{count}:{bet}' for count, bet in self.steps)
+
+
+def parse_ramp(text):
+    # e.g. '2:2,3:4,4:8,5:12'
+    steps = [step.split(':') for step in text.split(',')]
+    if any(len(step) != 2 for step in steps):
+        raise ValueError(f"Bet ramp must be count:bet pairs separated by commas: {text}")
+    return BetRamp([(int(count), int(bet)) for count, bet in steps])
+
+
+# a 1-12 spread for each system, at about the same true count
+DEFAULT_RAMPS = {
+    'hi-lo': BetRamp([(2, 2), (3, 4), (4, 8), (5, 12)]),
+    'ko': BetRamp([(-2, 2), (0, 4), (2, 8), (4, 12)]),
+    'omega-ii': BetRamp([(4, 2), (6, 4), (8, 8), (10, 12)]),
+}
+
+# Hi-Lo index plays (the Illustrious 18 without insurance), keyed by
+# (total, soft, pair, upcard) as in strategy.py: (index, action at or
+# above it, action below it)
+ILLUSTRIOUS_18 = {
+    (16, False, False, 10): (0, 'stand', 'hit'),
+    (15, False, False, 10): (4, 'stand', 'hit'),
+    (20, False, True, 5): (5, 'split', 'stand'),
+    (20, False, True, 6): (4, 'split', 'stand'),
+    (10, False, False, 10): (4, 'double', 'hit'),
+    (12, False, False, 3): (2, 'stand', 'hit'),
+    (12, False, False, 2): (3, 'stand', 'hit'),
+    (11, False, False, 11): (1, 'double', 'hit'),
+    (9, False, False, 2): (1, 'double', 'hit'),
+    (10, False, False, 11): (4, 'double', 'hit'),
+    (9, False, False, 7): (3, 'double', 'hit'),
+    (16, False, False, 9): (5, 'stand', 'hit'),
+    (13, False, False, 2): (-1, 'stand', 'hit'),
+    (12, False, False, 4): (0, 'stand', 'hit'),
+    (12, False, False, 5): (-2, 'stand', 'hit'),
+    (12, False, False, 6): (-1, 'stand', 'hit'),
+    (13, False, False, 3): (-2, 'stand', 'hit'),
+}
+
+# Hi-Lo true count at or above which insurance is worth taking
+INSURANCE_INDEX = 3
+
+
+class CountingPolicy:
+    """
+    Table.optimal_strategy, overridden by index plays (keyed as
+    ILLUSTRIOUS_18, in the system's count) where the indexed action is
+    permitted, and taking insurance at or above insurance_index (if
+    given) when the rules offer it
+    """
+
+    def __init__(self, system, index_plays=None, insurance_index=None):
+        self.system = system
+        self.index_plays = index_plays or {}
+        self.insurance_index = insurance_index
+
+    def __call__(self, table, hand):
+        system = self.system
+        if self.insurance_index is not None and table.action_permitted('insure', hand):
+            if system.count(table.shoe) >= self.insurance_index:
+                return 'insure'
+        if self.index_plays:
+            cards = table.hands[hand]
+            pair = len(cards) == 2 and Deck.get_value(cards[0]) == Deck.get_value(cards[1])
+            play = self.index_plays.get((cards.value, cards.soft, pair, Deck.get_value(table.dealer_cards[0])))
+            if play is not None:
+                index, above, below = play
+                action = above if system.count(table.shoe) >= index else below
+                if table.action_permitted(action, hand):
+                    return action
+        return table.optimal_strategy(hand)
+
+
+class CountingSimulator(Simulator):
+    """
+    A Simulator whose shoes keep the system's count, betting by the ramp
+    and playing with a CountingPolicy (or Table.optimal_strategy without
+    index plays or an insurance index)
+    """
+
+    def __init__(self, system, ramp=None, index_plays=None, insurance_index=None, num_decks=6, stack=100000,
+                 seed=None, rules=None):
+        ramp = ramp or DEFAULT_RAMPS.get(system.name) or BetRamp([])
+        # without index plays the plain strategy is the same and faster
+        policy = CountingPolicy(system, index_plays, insurance_index) if index_plays or insurance_index is not None else None
+        super().__init__(num_decks, policy, ramp.minimum, stack, seed, rules=rules)
+        self.system = system
+        self.ramp = ramp
+        self.wagered = 0
+        self.table.shoe = self.new_shoe()
+
+    def new_shoe(self):
+        num_decks = self.table.rules.num_decks
+        return Shoe(num_decks, self.rng, count_tags=self.system.tags, initial_count=self.system.initial_count(num_decks))
+
+    def next_bet(self):
+        bet = self.ramp(self.system.count(self.table.shoe))
+        self.wagered += bet
+        return bet
+
+    def report(self):
+        """
+        Win rate and standard deviation per 100 hands and N0, in units of
+        the minimum bet, along with the Simulator report
+        """
+        stats = self.stats
+        minimum = self.ramp.minimum
+        report = stats.report(minimum)
+        hands = stats.hands
+        win_rate = stats.net / hands / minimum if hands else 0
+        sd = math.sqrt(report['variance'])
+        report.update({
+            'system': self.system.name,
+            'ramp': repr(self.ramp),
+            'average_bet': self.wagered / hands / minimum if hands else 0,
+            'edge': stats.net / self.wagered if self.wagered else 0,
+            'win_rate_per_100': win_rate * 100,
+            'sd_per_100': sd * 10,
+            'n0': (sd / win_rate) ** 2 if win_rate > 0 else math.inf,
+            'hands_per_sec': hands / self.elapsed if self.elapsed else 0
+        })
+        return report
+
+
+def print_report(report):
+    n0 = f'{report["n0"]:,.0f}' if report['n0'] != math.inf else 'never'
+    print(f'{report["system"]:10} {report["ramp"]:>22} {report["average_bet"]:>8.2f} {report["edge"]:>+8.3%} '
+          f'{report["win_rate_per_100"]:>+10.2f} {report["sd_per_100"]:>9.2f} {n0:>12} {report["hands_per_sec"]:>10,.0f}')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Simulate card counting systems with a bet ramp and index plays')
+    parser.add_argument('hands', nargs='?', type=int, default=1000000)
+    parser.add_argument('--system', action='append', choices=list(SYSTEMS), help='systems to compare (default: all)')
+    parser.add_argument('--ramp', type=parse_ramp, help='count:bet steps, e.g. 2:2,3:4,4:8,5:12')
+    parser.add_argument('--no-index', action='store_true', help="don't use the Hi-Lo index plays")
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(args)
+
+    print(f'{"system":10} {"ramp":>22} {"avg bet":>8} {"edge":>8} {"win/100":>10} {"sd/100":>9} {"N0":>12} {"hands/sec":>10}')
+    for name in args.system or list(SYSTEMS):
+        system = SYSTEMS[name]
+        # the index plays are Hi-Lo true counts
+        hi_lo = name == 'hi-lo' and not args.no_index
+        simulator = CountingSimulator(
+            system, args.ramp, ILLUSTRIOUS_18 if hi_lo else None, INSURANCE_INDEX if hi_lo else None,
+            args.decks, seed=args.seed
+            )
+        simulator.run(args.hands)
+        print_report(simulator.report())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
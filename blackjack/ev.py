@@ -0,0 +1,308 @@
+"""
+Exact expected values for the game in run.py under a rules.RuleSet: no
+hole card (the dealer's second card is drawn after the player acts and a
+dealer blackjack takes doubled and split bets in full), dealer hits or
+stands on soft 17, double after split if allowed, late surrender for half
+the bet (lost in full to a dealer blackjack) and no blackjack after
+split (a two-card 21 on a split hand is valued as 21, so it loses to a
+dealer blackjack). Split hands are valued as if they couldn't be split
+again, so with resplits allowed the split EV is a slight underestimate.
+
+Shoe compositions are tuples of 10 card counts, indexed by blackjack value
+2-9, 10 and ace (see value_index). All EVs are per unit of initial bet.
+
+Strategy tables generated from these EVs are cached on disk: a change
+here that changes any EV-maximising action needs a bump of
+strategy.GENERATOR_VERSION.
+"""
+
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+from .rules import RuleSet
+from .run import Deck
+
+# dealer outcome indexes
+DEALER_TOTALS = (17, 18, 19, 20, 21)
+BUST = 5
+BLACKJACK = 6
+
+# bound on the number of memoised dealer distributions and player states
+CACHE_SIZE = 2 ** 18
+
+
+def value_index(card):
+    # 0-7 for values 2-9, 8 for ten-value cards and 9 for aces
+    return Deck.get_value(card) - 2
+
+
+def composition(cards):
+    """
+    Count the cards in a list of card ids by value
+    """
+    counts = [0] * 10
+    for card in cards:
+        counts[value_index(card)] += 1
+    return tuple(counts)
+
+
+def full_shoe(num_decks):
+    return tuple([4 * num_decks] * 8 + [16 * num_decks, 4 * num_decks])
+
+
+def remove(comp, *cards):
+    counts = list(comp)
+    for card in cards:
+        counts[value_index(card)] -= 1
+    return tuple(counts)
+
+
+def _hand_value(hard, ace):
+    # hard total counts aces as 1; one ace can count as 11 if it fits
+    return hard + 10 if ace and hard <= 11 else hard
+
+
+@lru_cache(maxsize=None)
+def _dealer_hands(upcard_value, hit_soft_17=False):
+    """
+    Enumerate every way the dealer can draw to a finished hand from the
+    upcard, independent of the shoe. Every ordering of the same cards has
+    the same probability for a given composition, so draw sequences are
+    grouped by the multiset of cards drawn. Returns arrays of the counts
+    drawn per value, number of valid orderings, number of cards drawn and
+    outcome index for each multiset.
+    """
+    hands = {}
+
+    def draw(counts, hard, ace, cards):
+        value = _hand_value(hard, ace)
+        # a soft 17 is hard + 10 == 17 with an ace counted as 11
+        if value >= 17 and not (hit_soft_17 and value == 17 and ace and hard == 7):
+            if value > 21:
+                outcome = BUST
+            elif cards == 2 and value == 21:
+                outcome = BLACKJACK
+            else:
+                outcome = value - 17
+            key = tuple(counts)
+            orderings = hands[key][0] + 1 if key in hands else 1
+            hands[key] = (orderings, outcome)
+            return
+        for index in range(10):
+            counts[index] += 1
+            draw(counts, hard + (1 if index == 9 else index + 2), ace or index == 9, cards + 1)
+            counts[index] -= 1
+
+    draw([0] * 10, 1 if upcard_value == 11 else upcard_value, upcard_value == 11, 1)
+    drawn = np.array(list(hands), dtype=np.int64)
+    orderings = np.array([orderings for orderings, _ in hands.values()], dtype=np.float64)
+    outcomes = np.array([outcome for _, outcome in hands.values()], dtype=np.int64)
+    return drawn, orderings, drawn.sum(axis=1), outcomes
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def dealer_probabilities(comp, upcard_value, hit_soft_17=False):
+    """
+    Probabilities of the dealer finishing on 17, 18, 19, 20, 21, bust or
+    blackjack, given the upcard value (2-11) and the composition of the
+    cards the dealer draws from
+    """
+    drawn, orderings, num_drawn, outcomes = _dealer_hands(upcard_value, hit_soft_17)
+    max_drawn = num_drawn.max() + 1
+    counts = np.array(comp, dtype=np.float64)
+    # falling factorials c * (c - 1) * ... for each value and number drawn
+    steps = np.arange(max_drawn - 1)
+    per_value = np.ones((10, max_drawn))
+    per_value[:, 1:] = np.cumprod(np.maximum(counts[:, None] - steps, 0), axis=1)
+    per_total = np.ones(max_drawn)
+    per_total[1:] = np.cumprod(np.maximum(counts.sum() - steps, 0))
+    probabilities = (
+        orderings *
+        per_value[np.arange(10), drawn].prod(axis=1) /
+        per_total[num_drawn]
+        )
+    return tuple(np.bincount(outcomes, weights=probabilities, minlength=7).tolist())
+
+
+def ev_stand(comp, value, upcard_value, hit_soft_17=False):
+    """
+    EV of standing on a (non-blackjack) value
+    """
+    if value > 21:
+        return -1.0
+    dealer = dealer_probabilities(comp, upcard_value, hit_soft_17)
+    ev = dealer[BUST] - dealer[BLACKJACK]
+    for outcome, total in enumerate(DEALER_TOTALS):
+        if value > total:
+            ev += dealer[outcome]
+        elif value < total:
+            ev -= dealer[outcome]
+    return ev
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _best_hit_stand(comp, hard, ace, upcard_value, hit_soft_17=False):
+    stand = ev_stand(comp, _hand_value(hard, ace), upcard_value, hit_soft_17)
+    return max(stand, _ev_hit(comp, hard, ace, upcard_value, hit_soft_17))
+
+
+def _draws(comp, hard, ace):
+    # yield (probability, composition, hard total, ace) for each next card
+    remaining = sum(comp)
+    for index, count in enumerate(comp):
+        if count:
+            yield (
+                count / remaining,
+                comp[:index] + (count - 1,) + comp[index + 1:],
+                hard + (1 if index == 9 else index + 2),
+                ace or index == 9
+            )
+
+
+def _ev_hit(comp, hard, ace, upcard_value, hit_soft_17=False):
+    ev = 0.0
+    for p, drawn, new_hard, new_ace in _draws(comp, hard, ace):
+        ev += p * (-1.0 if new_hard > 21 else _best_hit_stand(drawn, new_hard, new_ace, upcard_value, hit_soft_17))
+    return ev
+
+
+def _ev_double(comp, hard, ace, upcard_value, hit_soft_17=False):
+    ev = 0.0
+    for p, drawn, new_hard, new_ace in _draws(comp, hard, ace):
+        ev += p * 2 * ev_stand(drawn, _hand_value(new_hard, new_ace), upcard_value, hit_soft_17)
+    return ev
+
+
+def _ev_split(comp, card, upcard_value, hit_soft_17=False, double_after_split=False):
+    # each hand starts with one card and draws a second, then hits or
+    # stands, or doubles if allowed; the two hands are treated as drawing
+    # from the same composition, ignoring the cards the other hand removes
+    hard = 1 if card == 11 else card
+    ev = 0.0
+    for p, drawn, new_hard, new_ace in _draws(comp, hard, card == 11):
+        best = _best_hit_stand(drawn, new_hard, new_ace, upcard_value, hit_soft_17)
+        if double_after_split:
+            best = max(best, _ev_double(drawn, new_hard, new_ace, upcard_value, hit_soft_17))
+        ev += p * best
+    return 2 * ev
+
+
+def action_evs(player_cards, dealer_card, comp, double=True, split=True, surrender=False, rules=None):
+    """
+    Return a dict of EV for each permitted action (hit, stand, and double,
+    split and surrender if allowed) with the player holding player_cards
+    against dealer_card, under a rule set (the default rules if None).
+    comp is the composition of the cards still to be drawn, i.e.
+    excluding the player's cards and the dealer upcard.
+    """
+    rules = rules or RuleSet()
+    values = [Deck.get_value(card) for card in player_cards]
+    hard = sum(1 if value == 11 else value for value in values)
+    ace = 11 in values
+    upcard_value = Deck.get_value(dealer_card)
+    evs = {
+        'hit': _ev_hit(comp, hard, ace, upcard_value, rules.hit_soft_17),
+        'stand': ev_stand(comp, _hand_value(hard, ace), upcard_value, rules.hit_soft_17)
+    }
+    if double and len(player_cards) == 2:
+        evs['double'] = _ev_double(comp, hard, ace, upcard_value, rules.hit_soft_17)
+    if split and len(player_cards) == 2 and values[0] == values[1]:
+        evs['split'] = _ev_split(comp, values[0], upcard_value, rules.hit_soft_17, rules.double_after_split)
+    if surrender:
+        evs['surrender'] = ev_surrender(comp, upcard_value)
+    return evs
+
+
+def situation_evs(total, soft, pair, upcard_value, comp, double=True, split=True, surrender=False, rules=None):
+    """
+    Return a dict of EV for each permitted action for a decision known
+    only by the player total, soft and pair flags (as keyed in
+    strategy.py) rather than by the cards held. The EVs depend on the
+    cards only through these, apart from the cards removed from comp.
+    """
+    rules = rules or RuleSet()
+    hard = total - 10 if soft else total
+    evs = {
+        'hit': _ev_hit(comp, hard, soft, upcard_value, rules.hit_soft_17),
+        'stand': ev_stand(comp, total, upcard_value, rules.hit_soft_17)
+    }
+    if double:
+        evs['double'] = _ev_double(comp, hard, soft, upcard_value, rules.hit_soft_17)
+    if split and pair:
+        evs['split'] = _ev_split(comp, 11 if soft else total // 2, upcard_value, rules.hit_soft_17, rules.double_after_split)
+    if surrender:
+        evs['surrender'] = ev_surrender(comp, upcard_value)
+    return evs
+
+
+def ev_surrender(comp, upcard_value):
+    """
+    EV of a late surrender: half the bet back unless the dealer has
+    blackjack
+    """
+    return -0.5 - 0.5 * dealer_probabilities(comp, upcard_value)[BLACKJACK]
+
+
+def ev_blackjack(comp, upcard_value, blackjack_payout=1.5):
+    """
+    EV of a player blackjack: the payout unless the dealer also has
+    blackjack
+    """
+    return blackjack_payout * (1 - dealer_probabilities(comp, upcard_value)[BLACKJACK])
+
+
+def audit(num_decks=6, rules=None, exhaustive=True):
+    """
+    Compare Table.optimal_strategy with the EV-maximising action in every
+    decision state reachable under a rule set (the default rules with
+    num_decks decks if None), as yielded by strategy.reachable_states:
+    hands of any number of cards against every upcard, first actions
+    with and without chips to double or split, and hands after a split.
+    EVs are taken from a full shoe less the cards on the table. With
+    exhaustive=False, hands of 3 or more cards are audited once per hard
+    total and ace. Returns a list of dicts for each state where they
+    differ.
+    """
+    from . import strategy
+
+    rules = rules or RuleSet(num_decks)
+    shoe = full_shoe(rules.num_decks)
+    deviations = []
+    seen = set()
+    for table, hand in strategy.reachable_states(rules, exhaustive):
+        cards = table.hands[hand]
+        upcard = table.dealer_cards[0]
+        permitted = tuple(table.action_permitted(action, hand) for action in ('double', 'split', 'surrender'))
+        # e.g. hands of 3 or more cards are yielded with and without chips
+        # to double or split, which neither can
+        key = (tuple(cards), upcard, len(table.hands), permitted)
+        if key in seen:
+            continue
+        seen.add(key)
+        action = table.optimal_strategy(hand)
+        comp = remove(shoe, *[card for hand_cards in table.hands for card in hand_cards], upcard)
+        evs = action_evs(cards, upcard, comp, *permitted, rules)
+        best = max(evs, key=evs.get)
+        if evs[best] > evs[action]:
+            deviations += [{
+                'player_cards': [Deck.get_rank(card) for card in cards],
+                'dealer_card': Deck.get_rank(upcard),
+                'hands': len(table.hands),
+                'double': permitted[0],
+                'action': action,
+                'best_action': best,
+                'ev_loss': evs[best] - evs[action]
+            }]
+    return deviations
+
+
+if __name__ == '__main__':
+    num_decks = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    for deviation in audit(num_decks):
+        print(f'{"/".join(deviation["player_cards"])} vs {deviation["dealer_card"]}'
+              f'{" after a split" if deviation["hands"] > 1 else ""}'
+              f'{"" if deviation["double"] else " (no double)"}: '
+              f'{deviation["action"]} instead of {deviation["best_action"]} '
+              f'costs {deviation["ev_loss"]:.4f}')
@@ -0,0 +1,348 @@
+"""
+Append-only binary log of completed hands.
+
+Every hand is one fixed-width little-endian record (RECORD below):
+
+    seed            shoe seed (Shoe.seed), from which the shoe can be redealt
+    position        shoe position of the hand's first card
+    num_decks, max_hands, rule_flags, blackjack_payout
+                    the rules.RuleSet the hand was played under, with
+                    its boolean rules packed as bits in RULE_FLAGS order
+                    and the code of the shoe's RNG backend (see rng.py)
+                    in the bits from BACKEND_SHIFT up, with ANTITHETIC
+                    set for an antithetic shoe
+    bet             the bet placed before any double or split
+    dealer_cards    card ids of the dealer hand, padded with NO_CARD
+    cards           card ids of each player hand, in order, padded with
+                    NO_CARD (hands after a split follow the first)
+    actions         strategy.ACTION_CODES of each action taken, in order,
+                    padded with 0
+    optimal         bit i set if action i matched Table.optimal_strategy
+    bets            final bets (including doubles) on each hand
+    winnings        winnings returned for each hand
+    outcomes        OUTCOMES index for each hand, NO_HAND if not played
+    insurance_bet, insurance_winnings
+                    the insurance taken and returned
+    start_stack     player stack before the bet was placed
+    stack           player stack once the hand has been paid
+
+The file starts with MAGIC and the record size, so a log written with a
+different layout is rejected instead of misread. A writer appending to
+an existing log first cuts off a last record left partly written by a
+crash, so the records after it stay aligned. HandLogReader maps the
+file into memory and exposes the records as a NumPy structured array
+viewing the mapped bytes, so fields of millions of hands can be scanned
+without parsing or copying them.
+
+The terminal game and server log every hand to the file named by
+BLACKJACK_HAND_LOG when it is set.
+
+Usage: python3 -m blackjack.handlog <path>    print a summary of a log
+"""
+
+import atexit
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from .rng import BACKENDS, BACKEND_CODES
+from .rules import MAX_HANDS, RuleSet
+from .strategy import ACTION_CODES
+
+MAGIC = b'BJHL3\x00'
+
+# card slots per hand and action slots per hand record
+MAX_CARDS = 16
+MAX_ACTIONS = 32
+NO_CARD = 255
+
+OUTCOMES = ('loss', 'push', 'win', 'blackjack', 'surrender')
+NO_HAND = 255
+
+RULE_FLAGS = ('hit_soft_17', 'double_after_split', 'late_surrender', 'insurance')
+# rule_flags bit of the shoe backend's code (0 for 'mt', so older logs
+# read as Mersenne Twister shoes)
+BACKEND_SHIFT = 6
+# rule_flags bit set when the shoe is the antithetic one for its seed
+ANTITHETIC = 1 << 4
+
+RECORD = struct.Struct(
+    f'<QHBBBdd{MAX_CARDS}s{MAX_HANDS * MAX_CARDS}s{MAX_ACTIONS}sI'
+    f'{MAX_HANDS}d{MAX_HANDS}d{MAX_HANDS}sdddd'
+    )
+HEADER = MAGIC + struct.pack('<H', RECORD.size)
+
+# the same layout as RECORD, for reading records with NumPy
+RECORD_DTYPE = np.dtype([
+    ('seed', '<u8'),
+    ('position', '<u2'),
+    ('num_decks', 'u1'),
+    ('max_hands', 'u1'),
+    ('rule_flags', 'u1'),
+    ('blackjack_payout', '<f8'),
+    ('bet', '<f8'),
+    ('dealer_cards', 'u1', (MAX_CARDS,)),
+    ('cards', 'u1', (MAX_HANDS, MAX_CARDS)),
+    ('actions', 'u1', (MAX_ACTIONS,)),
+    ('optimal', '<u4'),
+    ('bets', '<f8', (MAX_HANDS,)),
+    ('winnings', '<f8', (MAX_HANDS,)),
+    ('outcomes', 'u1', (MAX_HANDS,)),
+    ('insurance_bet', '<f8'),
+    ('insurance_winnings', '<f8'),
+    ('start_stack', '<f8'),
+    ('stack', '<f8')
+    ])
+
+
+def rule_flags(rules):
+    flags = 0
+    for bit, name in enumerate(RULE_FLAGS):
+        if getattr(rules, name):
+            flags |= 1 << bit
+    return flags
+
+
+def record_rules(num_decks, max_hands, flags, blackjack_payout):
+    # the RuleSet stored in a record
+    return RuleSet(
+        num_decks, max_hands=max_hands, blackjack_payout=blackjack_payout,
+        **{name: bool(flags & 1 << bit) for bit, name in enumerate(RULE_FLAGS)}
+        )
+
+
+def record_backend(flags):
+    # name of the backend that shuffled a record's shoe
+    return BACKEND_CODES[flags >> BACKEND_SHIFT].name
+
+
+def record_antithetic(flags):
+    return bool(flags & ANTITHETIC)
+
+
+def check_shoe(shoe):
+    # only a shoe that can be redealt from its seed can be logged
+    if not shoe.replayable:
+        raise ValueError(f"{type(shoe).__name__} can't be redealt from its seed, so its hands can't be logged")
+
+
+def outcome(table, index):
+    # index into OUTCOMES of a hand's result
+    if table.surrendered:
+        return 4
+    bet = table.bets[index]
+    winnings = table.results[index]['winnings']
+    if winnings == 0:
+        return 0
+    if winnings == bet:
+        return 1
+    if table.natural and winnings > 2 * bet:
+        return 3
+    return 2
+
+
+def pack_cards(cards):
+    if len(cards) > MAX_CARDS:
+        raise ValueError(f"Hand log holds at most {MAX_CARDS} cards per hand")
+    return bytes(cards).ljust(MAX_CARDS, bytes([NO_CARD]))
+
+
+def encode(table):
+    """
+    Pack a completed hand on a Table into one record
+    """
+    actions = table.actions
+    if len(actions) > MAX_ACTIONS:
+        raise ValueError(f"Hand log holds at most {MAX_ACTIONS} actions per hand")
+    optimal = 0
+    for index, (action, optimal_action) in enumerate(actions):
+        if action == optimal_action:
+            optimal |= 1 << index
+    shoe = table.shoe
+    check_shoe(shoe)
+    rules = table.rules
+    unused = MAX_HANDS - len(table.hands)
+    flags = rule_flags(rules) | BACKENDS[shoe.backend].code << BACKEND_SHIFT
+    if shoe.antithetic:
+        flags |= ANTITHETIC
+    return RECORD.pack(
+        shoe.seed,
+        table.hand_start,
+        rules.num_decks,
+        rules.max_hands,
+        flags,
+        rules.blackjack_payout,
+        table.bet,
+        pack_cards(table.dealer_cards),
+        b''.join(pack_cards(cards) for cards in table.hands).ljust(MAX_HANDS * MAX_CARDS, bytes([NO_CARD])),
+        bytes(ACTION_CODES[action] for action, _ in actions),
+        optimal,
+        *table.bets, *[0] * unused,
+        *[result['winnings'] for result in table.results], *[0] * unused,
+        bytes(outcome(table, index) for index in range(len(table.hands))).ljust(MAX_HANDS, bytes([NO_HAND])),
+        table.insurance_bet,
+        table.insurance_winnings,
+        table.hand_start_stack,
+        table.player_stack
+    )
+
+
+def check_header(header, path):
+    if header != HEADER:
+        raise ValueError(f"{path} is not a hand log in this format")
+
+
+def truncate_torn_record(path):
+    """
+    Check the header of an existing log and cut off a record left partly
+    written (e.g. by a crash), so appended records start on a record
+    boundary. Raises ValueError if the file isn't a log in this format.
+    """
+    with open(path, 'r+b') as f:
+        header = f.read(len(HEADER))
+        size = f.seek(0, 2)
+        if size < len(HEADER) and HEADER.startswith(header):
+            # the header itself was cut short: start the log again
+            f.truncate(0)
+            return
+        check_header(header, path)
+        end = size - (size - len(HEADER)) % RECORD.size
+        if end != size:
+            f.truncate(end)
+
+
+class HandLogWriter:
+    """
+    Appends a record for each completed hand to a log file through a
+    large write buffer, so logging costs a struct pack and a memory copy
+    per hand. Attach it to a Table to log every hand the table completes.
+    """
+
+    def __init__(self, path, buffer_size=1 << 20):
+        self.path = path
+        if os.path.exists(path):
+            truncate_torn_record(path)
+        self.file = open(path, 'ab', buffering=buffer_size)
+        if self.file.tell() == 0:
+            self.file.write(HEADER)
+        self.count = 0
+
+    def attach(self, table):
+        # raises ValueError if the table's shoe can't be logged
+        check_shoe(table.shoe)
+        table.hand_log = self
+        table.record_actions = True
+        return table
+
+    def record(self, table):
+        self.file.write(encode(table))
+        self.count += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class HandLogReader:
+    """
+    Read-only view of a hand log. records is a structured array with
+    the fields of RECORD_DTYPE backed directly by the mapped file, e.g.
+    reader.records['winnings'] or reader['stack'].
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            check_header(f.read(len(HEADER)), path)
+            size = f.seek(0, 2)
+            # an empty log has nothing to map
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > len(HEADER) else None
+        # ignore a partly written last record
+        count = (size - len(HEADER)) // RECORD_DTYPE.itemsize
+        if self.map is None:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        else:
+            self.records = np.frombuffer(self.map, dtype=RECORD_DTYPE, count=count, offset=len(HEADER))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, key):
+        return self.records[key]
+
+    def cards(self, index, hand=0):
+        # card ids of one player hand (or the dealer's, if hand is None)
+        # without the padding
+        record = self.records[index]
+        cards = record['dealer_cards'] if hand is None else record['cards'][hand]
+        return cards[cards != NO_CARD].tolist()
+
+    def close(self):
+        # drop the views before the map they point into; if the caller still
+        # holds views, the map is closed when the last of them is freed
+        self.records = None
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def from_env():
+    """
+    Writer for the log named by BLACKJACK_HAND_LOG, closed on exit, or
+    None if it isn't set
+    """
+    path = os.environ.get('BLACKJACK_HAND_LOG')
+    if not path:
+        return None
+    writer = HandLogWriter(path)
+    atexit.register(writer.close)
+    return writer
+
+
+def summary(path):
+    with HandLogReader(path) as log:
+        records = log.records
+        hands = len(records)
+        actions = int(np.count_nonzero(records['actions']))
+        # popcount of the optimal bitmasks
+        optimal = int(np.unpackbits(np.ascontiguousarray(records['optimal']).view(np.uint8)).sum())
+        net = (
+            records['winnings'].sum() + records['insurance_winnings'].sum() -
+            records['bets'].sum() - records['insurance_bet'].sum()
+            )
+        outcomes = np.bincount(records['outcomes'][:, 0], minlength=len(OUTCOMES))
+        return {
+            'hands': hands,
+            'actions': actions,
+            'optimal_rate': optimal / actions if actions else 0,
+            'splits': int(np.count_nonzero(records['outcomes'][:, 1] != NO_HAND)),
+            'insured': int(np.count_nonzero(records['insurance_bet'])),
+            'net': float(net),
+            'outcomes': {name: int(count) for name, count in zip(OUTCOMES, outcomes)}
+        }
+
+
+if __name__ == '__main__':
+    report = summary(sys.argv[1])
+    print(f'Hands: {report["hands"]}  Splits: {report["splits"]}  Insured: {report["insured"]}')
+    print(f'Actions: {report["actions"]}  Optimal: {report["optimal_rate"]:.2%}')
+    print('First hand outcomes: ' + ', '.join(f'{name} {count}' for name, count in report['outcomes'].items()))
+    print(f'Net units: {report["net"]:+g}')
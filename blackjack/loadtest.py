@@ -0,0 +1,622 @@
+"""
+Load generator for the web terminal path: bot players that connect the
+way a browser's terminal does and play with the same keys (a bet and
+Enter, then h/s/d/2/r and Enter, then Enter for the next hand).
+
+Three transports reach a game:
+
+    tcp   a session on server.py, which is what the web front end
+          bridges every websocket to when GAME_SERVER_PORT is set
+    ws    a websocket to index.js itself (controllers/default.js), in
+          whichever mode it was started
+    pty   a `python3 -m blackjack` game on its own pty, the game
+          default.js spawns (as run.py) for every connection without
+          GAME_SERVER_PORT
+
+Bots keep a model of the screen from the frames they receive and read
+the table back from it: the dealer upcard, each hand's cards and bet,
+the active hand and the remaining chips. A server with a store
+(BLACKJACK_STORE) asks for a name first, and each bot answers with its
+own, unique across --workers (bot0-1, bot0-2, ..., bot1-1, ...), so its
+stack carries over between its sessions.
+Bots rebuild a Table from the screen and act on Table.optimal_strategy,
+so a bot that reads a state the server didn't send (or is offered
+actions that don't match) shows up as a desync error. A session ends
+when the game exits (out of chips or at the reshuffle point) and the
+bot starts another one.
+
+Sessions are added in steps up to the target and each step is held for
+a while. Every step reports the latency from sending a line to
+receiving the complete frame it produced (percentiles in ms), the
+memory per session of the serving processes (the RSS of the server
+above its idle RSS, or of every run.py process), errors per session and
+the CPU the bots used. Bots near 100% of a core are the bottleneck
+rather than the server: spread them over more processes with --workers.
+Everything runs locally: with --spawn the harness starts server.py
+itself. Memory is read from /proc, so is only reported on Linux.
+
+Usage: python3 -m blackjack.loadtest --spawn --sessions 2000 --steps 4 --hold 10
+       python3 -m blackjack.loadtest --transport ws --port 3000 --pid <node pid>
+       python3 -m blackjack.loadtest --transport pty --sessions 100
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import random
+import re
+import struct
+import sys
+import time
+
+from .run import Table, Hand, Deck
+
+# a card id for each rank label shown on a card
+RANK_CARDS = {rank: card for card, rank in enumerate(Deck.card_ranks)}
+CARD_LABEL = re.compile(r'│(10|[2-9JQKA])[♣♦♥♠]')
+HAND_LABEL = re.compile(r'<-- (Dealer|Player|Player split): \w+(?: \| Bet: ([\d.]+))? -->')
+STACK_LABEL = re.compile(r'Remaining chips: +([\d.]+)')
+PROMPT_ACTIONS = re.compile(r'\b(hit|stand|double|split|surrender|insure) \((.)\)', re.IGNORECASE)
+ESCAPE = re.compile(r'\x1b\[(\d*)(?:;(\d*))?([A-Za-z])')
+
+# frame latency percentiles reported for every step
+PERCENTILES = (50, 90, 99, 99.9)
+
+# the directory holding the blackjack package, where `python3 -m
+# blackjack` starts the game and `-m blackjack.server` the server
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ScreenModel:
+    """
+    The rows of the terminal as drawn by screen.Screen: full redraws
+    after cursor home and erase, and rows rewritten in place after
+    cursor moves
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.row = 0
+
+    def write(self, row, text):
+        while len(self.rows) <= row:
+            self.rows.append('')
+        self.rows[row] = text
+
+    def feed(self, data):
+        position = 0
+        for match in ESCAPE.finditer(data):
+            self.text(data[position:match.start()])
+            position = match.end()
+            row, _, command = match.groups()
+            if command == 'H':
+                self.row = int(row) - 1 if row else 0
+            elif command == 'J':
+                # erase the screen (2J) or everything below the cursor
+                del self.rows[0 if row == '2' else self.row:]
+        self.text(data[position:])
+
+    def text(self, data):
+        lines = data.replace('\r', '').split('\n')
+        for index, line in enumerate(lines):
+            if index:
+                self.row += 1
+            if line:
+                self.write(self.row, line)
+
+
+def frame_complete(data):
+    # a frame diff ends by erasing below it, a full frame with its border
+    return data.endswith('\x1b[J') or data.rstrip('\r\n').endswith('┘') and data.endswith('\n')
+
+
+def read_table(rows, table):
+    """
+    Set up table with the hands, bets, dealer upcard and stack shown on
+    the screen rows, and return the actions the prompt offers, keyed by
+    action
+    """
+    hands = []
+    bets = []
+    active = 0
+    dealer = None
+    for index, row in enumerate(rows):
+        label = HAND_LABEL.search(row)
+        if label is None:
+            continue
+        # the rank is on the second row of each card image
+        cards = [RANK_CARDS[rank] for rank in CARD_LABEL.findall(rows[index + 2] if index + 2 < len(rows) else '')]
+        if label.group(1) == 'Dealer':
+            dealer = cards
+            continue
+        if index + 2 < len(rows) and rows[index + 2].rstrip(' |').endswith('<<<<'):
+            active = len(hands)
+        hands.append(Hand(cards))
+        bets.append(float(label.group(2) or 0))
+    stack = STACK_LABEL.search('\n'.join(rows[-5:]))
+    prompt = rows[-2] if len(rows) > 1 else ''
+    if not dealer or not hands or stack is None:
+        raise ValueError("Table not found on the screen")
+    table.hands = hands
+    table.bets = bets
+    table.active = active
+    table.dealer_cards = Hand(dealer[:1])
+    table.player_stack = float(stack.group(1))
+    return {action.lower(): key for action, key in PROMPT_ACTIONS.findall(prompt)}
+
+
+class TcpTransport:
+    """
+    A connection to server.py
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def send(self, text):
+        self.writer.write(text.encode())
+
+    async def receive(self):
+        # the next chunk of output, or '' once the game has closed
+        return (await self.reader.read(65536)).decode(errors='replace')
+
+    def close(self):
+        self.writer.close()
+
+
+class WebSocketTransport(TcpTransport):
+    """
+    A websocket to the web front end, which sends and receives the
+    terminal's text as text frames. Implements just enough of RFC 6455
+    for that: client frames are masked, server frames aren't, and
+    control frames other than ping and close are ignored.
+    """
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.writer.write((
+            f'GET / HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'
+        ).encode())
+        response = await self.reader.readuntil(b'\r\n\r\n')
+        status = response.split(b'\r\n', 1)[0].decode(errors='replace')
+        if ' 101 ' not in status:
+            raise ConnectionError(f"Websocket upgrade refused: {status}")
+
+    def send_frame(self, opcode, payload):
+        mask = os.urandom(4)
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, length)
+        masked = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+        self.writer.write(header + mask + masked)
+
+    def send(self, text):
+        self.send_frame(0x1, text.encode())
+
+    async def receive(self):
+        while True:
+            try:
+                first, second = await self.reader.readexactly(2)
+            except asyncio.IncompleteReadError:
+                return ''
+            opcode = first & 0x0f
+            length = second & 0x7f
+            if length == 126:
+                length, = struct.unpack('!H', await self.reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack('!Q', await self.reader.readexactly(8))
+            payload = await self.reader.readexactly(length)
+            if opcode == 0x8:
+                return ''
+            if opcode == 0x9:
+                self.send_frame(0xa, payload)
+            elif opcode in (0x0, 0x1, 0x2):
+                return payload.decode(errors='replace')
+
+
+class PtyTransport:
+    """
+    A `python3 -m blackjack` process on its own pty, read from the event
+    loop
+    """
+
+    def __init__(self):
+        self.process = None
+
+    async def open(self):
+        import pty
+
+        master, slave = pty.openpty()
+        os.set_blocking(master, False)
+        self.master = master
+        self.output = asyncio.Queue()
+        environment = dict(os.environ, LINES='24', COLUMNS='80', TERM='xterm-color')
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, '-m', 'blackjack', 'play', stdin=slave, stdout=slave, stderr=slave, env=environment,
+                cwd=PACKAGE_PARENT, start_new_session=True
+            )
+        finally:
+            os.close(slave)
+        asyncio.get_running_loop().add_reader(master, self.readable)
+
+    def readable(self):
+        try:
+            data = os.read(self.master, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            # EIO once the process has exited and the pty is closed
+            data = b''
+        if not data:
+            asyncio.get_running_loop().remove_reader(self.master)
+        self.output.put_nowait(data.decode(errors='replace'))
+
+    def send(self, text):
+        os.write(self.master, text.encode())
+
+    async def receive(self):
+        return await self.output.get()
+
+    def close(self):
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self.master)
+        os.close(self.master)
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+            # reap it in the background
+            loop.create_task(self.process.wait())
+
+
+class Results:
+    """
+    Frame latencies, errors and sessions for one step of the ramp
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.latencies = []
+        self.first_frames = []
+        self.errors = {}
+        # sessions started and played to the end in this step
+        self.started = 0
+        self.completed = 0
+        self.hands = 0
+        # RSS per session of the serving processes, if measured
+        self.memory = None
+        # wall time of the step and CPU time the bots used in it
+        self.elapsed = 0
+        self.cpu = 0
+
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def merge(self, other):
+        # results of the same step from another worker
+        if other.memory is not None:
+            memory = (self.memory or 0) * self.sessions + other.memory * other.sessions
+            self.memory = memory / (self.sessions + other.sessions)
+        self.sessions += other.sessions
+        self.latencies += other.latencies
+        self.first_frames += other.first_frames
+        for kind, count in other.errors.items():
+            self.errors[kind] = self.errors.get(kind, 0) + count
+        self.started += other.started
+        self.completed += other.completed
+        self.hands += other.hands
+        self.elapsed = max(self.elapsed, other.elapsed)
+        self.cpu += other.cpu
+        return self
+
+
+class Bot:
+    """
+    Plays sessions back to back on new connections until stopped,
+    recording into load.results (the current step)
+    """
+
+    def __init__(self, load, name, transport, bet, think, timeout, rng):
+        self.load = load
+        # answers the name prompt of a server with a store
+        self.name = name
+        self.transport = transport
+        self.bet = bet
+        self.think = think
+        self.timeout = timeout
+        self.rng = rng
+        # reused to work out the optimal action from the screen
+        self.table = Table(1)
+        self.transport_in_use = None
+
+    async def frame(self, transport, screen):
+        # read up to the end of a frame; None if the game has closed
+        data = ''
+        while not frame_complete(data):
+            chunk = await asyncio.wait_for(transport.receive(), self.timeout)
+            if not chunk:
+                screen.feed(data)
+                return None
+            data += chunk
+        screen.feed(data)
+        return data
+
+    async def run(self):
+        while not self.load.stopping:
+            transport = self.transport_in_use = self.transport()
+            self.load.results.started += 1
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(transport.open(), self.timeout)
+            except (OSError, asyncio.TimeoutError, ConnectionError):
+                self.load.results.error('connect')
+                self.transport_in_use = None
+                # back off before trying again
+                await asyncio.sleep(1)
+                continue
+            try:
+                await self.play(transport, start)
+            except asyncio.TimeoutError:
+                self.load.results.error('timeout')
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                self.load.results.error('disconnect')
+            except ValueError:
+                self.load.results.error('desync')
+            finally:
+                transport.close()
+                self.transport_in_use = None
+
+    async def play(self, transport, start):
+        screen = ScreenModel()
+        if await self.frame(transport, screen) is None:
+            raise ConnectionError("Closed before the first frame")
+        self.load.results.first_frames.append(time.perf_counter() - start)
+        while not self.load.stopping:
+            line = self.choose(screen.rows)
+            if line is None:
+                # the exit frame: the game closes the connection next
+                self.load.results.completed += 1
+                return
+            if self.think:
+                await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+            sent = time.perf_counter()
+            transport.send(line)
+            if await self.frame(transport, screen) is None:
+                raise ConnectionError("Closed during the game")
+            self.load.results.latencies.append(time.perf_counter() - sent)
+
+    def choose(self, rows):
+        """
+        The line to type for the screen, or None once the game has ended
+        """
+        prompt = rows[-2] if len(rows) > 1 else ''
+        if 'Exiting' in prompt:
+            return None
+        if 'What is your name?' in prompt:
+            return f'{self.name}\r'
+        if 'How much would you like to bet?' in prompt:
+            stack = STACK_LABEL.search('\n'.join(rows[-5:]))
+            return f'{min(self.bet, float(stack.group(1))):g}\r'
+        if 'Press Enter for new hand' in prompt:
+            self.load.results.hands += 1
+            return '\r'
+        keys = read_table(rows, self.table)
+        action = self.table.optimal_strategy()
+        if action not in keys:
+            raise ValueError(f"Optimal action {action} not offered in: {prompt}")
+        return f'{keys[action]}\r'
+
+
+def rss(pid):
+    # resident set size of a process in bytes, or 0 if it can't be read
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class LoadTest:
+    """
+    Bots added in steps up to a number of sessions, with Results kept
+    for each step. worker is the index of the bot process running the
+    test, which is part of every bot's name.
+    """
+
+    def __init__(self, transport, sessions, steps, hold, bet=10, think=0.2, timeout=10, seed=0, worker=0):
+        self.transport = transport
+        self.worker = worker
+        self.sessions = sessions
+        self.steps = steps
+        self.hold = hold
+        self.bet = bet
+        self.think = think
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.stopping = False
+        self.results = None
+        self.bots = []
+
+    def process_memory(self):
+        # RSS per session of the run.py processes of pty bots
+        pids = [bot.transport_in_use.process.pid for bot in self.bots
+                if isinstance(bot.transport_in_use, PtyTransport) and bot.transport_in_use.process is not None]
+        return sum(rss(pid) for pid in pids) / len(pids) if pids else None
+
+    async def run(self, report):
+        """
+        Ramp up, passing the Results of each step to report() as it ends
+        """
+        tasks = []
+        for step in range(1, self.steps + 1):
+            target = self.sessions * step // self.steps
+            self.results = Results(target)
+            start = time.perf_counter()
+            cpu = time.process_time()
+            new = target - len(self.bots)
+            # spread the new connections over the first second of the step
+            for index in range(new):
+                bot = Bot(self, f'bot{self.worker}-{len(self.bots) + 1}', self.transport, self.bet, self.think, self.timeout, random.Random(self.rng.random()))
+                self.bots.append(bot)
+                tasks.append(asyncio.create_task(bot.run()))
+                await asyncio.sleep(1 / new)
+            await asyncio.sleep(self.hold)
+            self.results.memory = self.process_memory()
+            self.results.elapsed = time.perf_counter() - start
+            self.results.cpu = time.process_time() - cpu
+            report(self.results)
+        self.stopping = True
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # let the closed pty processes be reaped
+        await asyncio.gather(*(asyncio.all_tasks() - {asyncio.current_task()}), return_exceptions=True)
+
+
+def percentile(values, q):
+    # nearest-rank percentile of sorted values
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def print_results(results):
+    latencies = sorted(results.latencies)
+    first_frames = sorted(results.first_frames)
+    errors = sum(results.errors.values())
+    percentiles = ' '.join(f'{percentile(latencies, q) * 1e3:>7.2f}' for q in PERCENTILES)
+    memory = f'{results.memory / 1024:>9,.0f}' if results.memory is not None else f'{"-":>9}'
+    error_rate = errors / results.started if results.started else 0
+    kinds = ', '.join(f'{kind} {count}' for kind, count in sorted(results.errors.items()))
+    print(f'{results.sessions:>8,} {len(latencies):>9,} {percentiles} {percentile(latencies, 100) * 1e3:>8.2f} '
+          f'{percentile(first_frames, 50) * 1e3:>8.2f} {memory} {error_rate:>8.2%} {results.cpu / results.elapsed:>8.0%}  '
+          f'{kinds}', flush=True)
+
+
+def spawn_server(port):
+    """
+    Start server.py on a local port and return the process once it
+    accepts connections
+    """
+    import socket
+    import subprocess
+
+    process = subprocess.Popen([sys.executable, '-m', 'blackjack.server', str(port)], cwd=PACKAGE_PARENT)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"server.py didn't start listening on port {port}")
+
+
+def raise_file_limit():
+    # every session needs a descriptor (two with a pty)
+    try:
+        import resource
+
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def make_transport(args):
+    # a callable returning a new, unopened transport for each session
+    if args.transport == 'pty':
+        return PtyTransport
+    if args.transport == 'ws':
+        return lambda: WebSocketTransport(args.host, args.port)
+    return lambda: TcpTransport(args.host, args.port)
+
+
+def run_worker(args, index, sessions, seed, results_queue):
+    # one of several bot processes: sends each step's Results back
+    load = LoadTest(make_transport(args), sessions, args.steps, args.hold, args.bet, args.think, args.timeout, seed,
+                    index)
+    asyncio.run(load.run(results_queue.put))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Load test the game with bot players')
+    parser.add_argument('--transport', choices=['tcp', 'ws', 'pty'], default='tcp')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--spawn', action='store_true', help='start server.py on --port for the test (tcp)')
+    parser.add_argument('--pid', type=int, action='append', default=[], help='serving process to measure memory of')
+    parser.add_argument('--sessions', type=int, default=1000, help='sessions at the end of the ramp')
+    parser.add_argument('--steps', type=int, default=4, help='steps to ramp up in')
+    parser.add_argument('--hold', type=float, default=10, help='seconds to hold each step')
+    parser.add_argument('--think', type=float, default=0.2, help='mean seconds between a frame and the next key')
+    parser.add_argument('--bet', type=float, default=10)
+    parser.add_argument('--timeout', type=float, default=10, help='seconds to wait for a frame')
+    parser.add_argument('--workers', type=int, default=1, help='bot processes, for more load than one core can drive')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(args)
+
+    raise_file_limit()
+    server = None
+    pids = args.pid
+    if args.spawn:
+        server = spawn_server(args.port)
+        pids = pids + [server.pid]
+    idle = sum(rss(pid) for pid in pids)
+
+    def report(results):
+        if pids:
+            results.memory = (sum(rss(pid) for pid in pids) - idle) / results.sessions
+        print_results(results)
+
+    percentiles = ' '.join(f'{f"p{q:g}":>7}' for q in PERCENTILES)
+    print(f'{"sessions":>8} {"frames":>9} {percentiles} {"max":>8} {"connect":>8} {"KB/sess":>9} {"errors":>8} {"bot cpu":>8}')
+    try:
+        if args.workers == 1:
+            load = LoadTest(make_transport(args), args.sessions, args.steps, args.hold, args.bet, args.think,
+                            args.timeout, args.seed)
+            asyncio.run(load.run(report))
+        else:
+            import multiprocessing
+
+            results_queue = multiprocessing.Queue()
+            workers = []
+            for index in range(args.workers):
+                sessions = args.sessions // args.workers + (index < args.sessions % args.workers)
+                worker = multiprocessing.Process(
+                    target=run_worker, args=(args, index, sessions, f'{args.seed}-{index}', results_queue), daemon=True
+                    )
+                worker.start()
+                workers.append(worker)
+            # every worker reports each step in turn
+            for _ in range(args.steps):
+                results = Results(0)
+                for _ in workers:
+                    results.merge(results_queue.get())
+                report(results)
+            for worker in workers:
+                worker.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.kill()
+            server.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Per-phase call counts and latency histograms for the game engine.
+
+Set BLACKJACK_METRICS=1 to enable. Functions decorated with timed() are
+left untouched when it isn't set, so disabled metrics cost nothing.
+When enabled, install() prints the stats on exit (to the file named by
+BLACKJACK_METRICS_FILE, or stderr) and, if BLACKJACK_METRICS_PORT is set,
+serves them in Prometheus text format at http://127.0.0.1:<port>/metrics.
+"""
+
+import atexit
+import functools
+import os
+import sys
+import time
+from bisect import bisect_left
+
+ENABLED = os.environ.get('BLACKJACK_METRICS', '') not in ('', '0')
+
+# histogram bucket upper bounds in nanoseconds: 1us to about 4 minutes
+BUCKETS = tuple(1000 * 4 ** power for power in range(15))
+
+
+class Histogram:
+    """
+    Call count, total time and bucketed latencies for one phase
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        # one count per bucket plus one for anything slower
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, ns):
+        self.count += 1
+        self.total += ns
+        self.buckets[bisect_left(BUCKETS, ns)] += 1
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th quantile, in ns
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target and count:
+                return BUCKETS[index] if index < len(BUCKETS) else float('inf')
+        return 0
+
+
+histograms = {}
+
+
+def timed(phase):
+    """
+    Decorator recording the latency of each call under phase; returns
+    the function unchanged when metrics are disabled
+    """
+    def decorate(func):
+        if not ENABLED:
+            return func
+        histogram = histograms.setdefault(phase, Histogram())
+        perf_counter_ns = time.perf_counter_ns
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter_ns() - start)
+        return wrapper
+    return decorate
+
+
+def summary():
+    lines = [f'{"phase":22}{"calls":>10}{"mean us":>12}{"p50 us":>12}{"p99 us":>12}']
+    for phase, histogram in histograms.items():
+        mean = histogram.total / histogram.count / 1000 if histogram.count else 0
+        lines += [
+            f'{phase:22}{histogram.count:>10}{mean:>12.1f}'
+            f'{histogram.quantile(0.5) / 1000:>12g}{histogram.quantile(0.99) / 1000:>12g}'
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def prometheus():
+    """
+    All histograms in Prometheus text exposition format
+    """
+    name = 'blackjack_phase_duration_seconds'
+    lines = [
+        f'# HELP {name} Time spent in each game phase.',
+        f'# TYPE {name} histogram'
+    ]
+    for phase, histogram in histograms.items():
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram.buckets):
+            cumulative += count
+            lines += [f'{name}_bucket{{phase="{phase}",le="{bound / 1e9:g}"}} {cumulative}']
+        lines += [
+            f'{name}_bucket{{phase="{phase}",le="+Inf"}} {histogram.count}',
+            f'{name}_sum{{phase="{phase}"}} {histogram.total / 1e9:.9f}',
+            f'{name}_count{{phase="{phase}"}} {histogram.count}'
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def serve(port):
+    """
+    Serve prometheus() at /metrics on a background thread
+    """
+    # http.server takes longer to import than the rest of the game, so
+    # it is only imported when the endpoint is wanted
+    import http.server
+    import threading
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def dump():
+    path = os.environ.get('BLACKJACK_METRICS_FILE')
+    if path:
+        with open(path, 'w') as f:
+            f.write(summary())
+    else:
+        sys.stderr.write(summary())
+
+
+def install():
+    """
+    Register the exit dump and start the Prometheus endpoint, if enabled
+    """
+    if not ENABLED:
+        return
+    atexit.register(dump)
+    port = os.environ.get('BLACKJACK_METRICS_PORT')
+    if port:
+        serve(int(port))
@@ -0,0 +1,129 @@
+"""
+Several players at one table. Every seat is a Table with its own stack,
+bets and hands, but all seats draw from one shared Shoe and play against
+one shared dealer hand, dealt in casino order: a card to each seat, the
+dealer upcard, then a second card to each seat. Seats act in turn; once
+the last seat has acted the dealer hand is played out once for the round
+and every seat is paid against it in one pass.
+
+Seats aren't written to hand logs: their cards aren't consecutive in the
+shoe, so a log record couldn't be replayed from the shoe position.
+"""
+
+import random
+
+from .rules import RuleSet
+from .run import Table, Shoe, Hand
+
+
+class Seat(Table):
+    """
+    One seat at a MultiSeatTable. Its hands wait in the 'dealer' phase
+    once input has ended instead of settling on their own.
+    """
+
+    def advance(self):
+        self.update_hand_status()
+        if self.active >= len(self.hands):
+            self.phase = 'dealer'
+
+
+class MultiSeatTable:
+    """
+    Seats (one per starting stack) sharing a shoe and dealer hand.
+    Rounds are driven with start_round() and step() (or a seat's
+    take_action() and advance(), then advance()), which settles every
+    seat once no seat is waiting for input.
+    """
+
+    def __init__(self, stacks, num_decks=6, rng=random, rules=None):
+        if not stacks:
+            raise ValueError("A table needs at least one seat")
+        self.rules = rules or RuleSet(num_decks)
+        shoe = Shoe(self.rules.num_decks, rng)
+        self.seats = [Seat(stack, rules=self.rules, shoe=shoe) for stack in stacks]
+        self.shoe = shoe
+        self.dealer_cards = Hand()
+        self.phase = 'bet'
+        self.reshuffle = False
+
+    @property
+    def shoe(self):
+        return self._shoe
+
+    @shoe.setter
+    def shoe(self, shoe):
+        self._shoe = shoe
+        for seat in self.seats:
+            seat.shoe = shoe
+
+    @property
+    def active_seat(self):
+        # index of the first seat waiting for input, or None
+        for index, seat in enumerate(self.seats):
+            if seat.phase == 'action':
+                return index
+        return None
+
+    def start_round(self, bets):
+        """
+        Place a bet for every seat, in seat order, and deal the round.
+        Raises ValueError for an invalid bet, before any card is dealt.
+        """
+        if len(bets) != len(self.seats):
+            raise ValueError(f"Expected {len(self.seats)} bets")
+        seats = self.seats
+        # check every bet before taking any
+        for seat, bet in zip(seats, bets):
+            seat.bet = bet
+        dealer_cards = self.dealer_cards = Hand()
+        draw = self.shoe.draw
+        for seat, bet in zip(seats, bets):
+            seat.reset_hand()
+            seat.dealer_cards = dealer_cards
+            seat.place_bet(bet)
+            seat.hands[0].add(draw())
+        dealer_cards.add(draw())
+        for seat in seats:
+            seat.hands[0].add(draw())
+            seat.phase = 'action'
+            seat.advance()
+        self.phase = 'action'
+        self.advance()
+
+    def advance(self):
+        # settle the round once every seat has finished acting
+        if self.phase == 'action' and self.active_seat is None:
+            self.settle()
+
+    def settle(self):
+        """
+        Play out the dealer hand as far as any seat needs it, then pay
+        every seat against it
+        """
+        needed = max(seat.dealer_cards_needed() for seat in self.seats)
+        # the seats share the shoe and dealer hand, so any of them can
+        # draw the dealer cards
+        self.seats[0].reveal_dealer_cards(needed)
+        for seat in self.seats:
+            seat.results = seat.pay()
+            seat.phase = 'complete'
+        self.phase = 'complete'
+        self.shoe.discard()
+        if len(self.shoe) < self.shoe.reshuffle_point:
+            self.reshuffle = True
+
+    def step(self, index, action):
+        """
+        Take an action on the active hand of a seat, which must be the
+        active seat, and return that seat's new state
+        """
+        if index != self.active_seat:
+            raise ValueError(f"Seat {index} is not waiting for an action")
+        seat = self.seats[index]
+        if not seat.action_permitted(action):
+            raise ValueError(f"Action not permitted: {action}")
+        seat.take_action(action)
+        seat.advance()
+        self.advance()
+        return seat.state()
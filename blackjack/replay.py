@@ -0,0 +1,211 @@
+"""
+Deterministic replay of hands recorded by handlog.py.
+
+Each record holds the seed and position of the shoe the hand was dealt
+from, the rules it was played under and the actions the player took,
+which is everything needed to play the hand again on a Table. The
+replayed hand is encoded into a record and compared byte for byte with
+the logged one, so the cards, the optimal action at every decision,
+bets, winnings, outcomes and final stack are all verified. An action
+that isn't permitted when replayed, or a hand left unfinished by the
+logged actions, is reported as an error.
+
+    python3 -m blackjack.replay LOG [--workers N]
+        replay every hand in a log
+    python3 -m blackjack.replay LOG --hand N
+        show one hand action by action
+
+Run a bulk replay after any change to the rules or the engine: every
+difference from the logged results is listed by hand index and field.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from . import handlog
+from .handlog import HandLogReader, RECORD, RECORD_DTYPE, NO_CARD
+from .run import Table, Shoe
+from .strategy import ACTIONS
+
+# the padding byte of the logged card fields
+PADDING = bytes([NO_CARD])
+
+
+def differences(expected, actual):
+    # names of the fields that differ between two records
+    expected = np.frombuffer(expected, dtype=RECORD_DTYPE)[0]
+    actual = np.frombuffer(actual, dtype=RECORD_DTYPE)[0]
+    return [field for field in RECORD_DTYPE.names if not np.array_equal(expected[field], actual[field])]
+
+
+class Replayer:
+    """
+    Replays logged hands on one reused Table per rule set. The shoe is
+    kept between hands, so replaying hands in the order they were logged
+    only draws the cards between them instead of reshuffling for every
+    hand.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.shoe = None
+        # called with the table after the deal and after every action
+        self.observer = None
+        # set as Table.on_decision on every table replayed on
+        self.on_decision = None
+
+    def table_for(self, rules):
+        table = self.tables.get(rules)
+        if table is None:
+            table = self.tables[rules] = Table(1000, rules=rules)
+            table.record_actions = True
+            table.on_decision = self.on_decision
+        return table
+
+    def shoe_at(self, seed, num_decks, position, backend='mt', antithetic=False, cards=0):
+        """
+        The shoe with a seed, dealt up to position. Raises ValueError if
+        a hand of cards cards from there would run past its end.
+        """
+        shoe = self.shoe
+        if (shoe is None or shoe.seed != seed or shoe.num_decks != num_decks or shoe.backend != backend
+                or shoe.antithetic != antithetic or shoe.position > position):
+            shoe = self.shoe = Shoe(num_decks, seed=seed, antithetic=antithetic, backend=backend)
+        if position + cards > len(shoe.cards):
+            raise ValueError(f"Hand of {cards} cards at position {position} runs past the end of the {len(shoe.cards)} card shoe")
+        while shoe.position < position:
+            shoe.draw()
+        return shoe
+
+    def replay(self, record):
+        """
+        Play the hand in a record again and return the record of the
+        replayed hand. Raises ValueError if the logged actions can't be
+        replayed.
+        """
+        fields = RECORD.unpack(record)
+        seed, position, num_decks, max_hands, flags, blackjack_payout, bet = fields[:7]
+        actions = fields[9].rstrip(b'\0')
+        start_stack = fields[-2]
+        table = self.table_for(handlog.record_rules(num_decks, max_hands, flags, blackjack_payout))
+        # cards the logged hand was dealt, dealer's included
+        cards = len(fields[7].replace(PADDING, b'')) + len(fields[8].replace(PADDING, b''))
+        table.shoe = self.shoe_at(
+            seed, num_decks, position, handlog.record_backend(flags), handlog.record_antithetic(flags), cards
+            )
+        table.player_stack = start_stack
+        table.reset_hand()
+        table.place_bet(bet)
+        table.deal()
+        if self.observer:
+            self.observer(table)
+        for code in actions:
+            action = ACTIONS[code]
+            hand = table.active
+            if table.phase != 'action' or not table.action_permitted(action, hand):
+                raise ValueError(f"Action not permitted: {action}")
+            table.take_action(action, hand)
+            table.advance()
+            if self.observer:
+                self.observer(table)
+        if table.phase != 'complete':
+            raise ValueError("Hand not complete after the logged actions")
+        return handlog.encode(table)
+
+    def check(self, record):
+        """
+        Replay a record and return a list of problems: the fields that
+        differ from the log, or the replay error. Empty if identical.
+        """
+        try:
+            replayed = self.replay(record)
+        except ValueError as error_message:
+            return [str(error_message)]
+        except IndexError:
+            # the replayed hand drew more cards than the log says
+            return ["Shoe ran out of cards"]
+        if replayed == record:
+            return []
+        return differences(record, replayed)
+
+
+def replay_block(args):
+    """
+    Replay records start to stop of a log and return the number replayed
+    and a list of (index, problems) for each hand that didn't match
+    """
+    path, start, stop = args
+    replayer = Replayer()
+    size = RECORD.size
+    failures = []
+    with HandLogReader(path) as log:
+        data = log.records[start:stop].tobytes()
+    for index in range(stop - start):
+        problems = replayer.check(data[index * size:(index + 1) * size])
+        if problems:
+            failures += [(start + index, problems)]
+    return stop - start, failures
+
+
+def replay_log(path, workers=1, block_size=100000):
+    """
+    Replay every hand in a log, in blocks spread over a process pool,
+    and return a report of the hands replayed and the failures in log
+    order
+    """
+    with HandLogReader(path) as log:
+        count = len(log)
+    blocks = [(path, start, min(start + block_size, count)) for start in range(0, count, block_size)]
+    start = time.perf_counter()
+    if workers == 1 or len(blocks) < 2:
+        results = list(map(replay_block, blocks))
+    else:
+        with multiprocessing.Pool(min(workers, len(blocks))) as pool:
+            results = pool.map(replay_block, blocks, chunksize=1)
+    elapsed = time.perf_counter() - start
+    failures = [failure for _, block_failures in results for failure in block_failures]
+    return {
+        'hands': sum(replayed for replayed, _ in results),
+        'failures': failures,
+        'hands_per_sec': count / elapsed if elapsed else 0
+    }
+
+
+def show_hand(path, index):
+    """
+    Print the table after the deal and after each action of one hand,
+    then the fields of the log that the replay doesn't reproduce
+    """
+    with HandLogReader(path) as log:
+        record = log.records[index].tobytes()
+    replayer = Replayer()
+    replayer.observer = lambda table: print('\n'.join(table.frame(table.messages())))
+    problems = replayer.check(record)
+    print(f'Hand {index}: ' + (f'differs from log: {", ".join(problems)}' if problems else 'matches log'))
+    return problems
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Replay hands from a hand log and verify the results')
+    parser.add_argument('log', help='hand log written by handlog.py')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes for a full replay')
+    parser.add_argument('--hand', type=int, help='show a single hand action by action')
+    args = parser.parse_args(args)
+
+    if args.hand is not None:
+        return 1 if show_hand(args.log, args.hand) else 0
+    report = replay_log(args.log, args.workers)
+    for index, problems in report['failures'][:20]:
+        print(f'Hand {index}: {", ".join(problems)}')
+    print(f'Replayed {report["hands"]} hands, {len(report["failures"])} differ from the log '
+          f'({report["hands_per_sec"]:,.0f} hands/sec)')
+    return 1 if report['failures'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
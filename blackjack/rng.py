@@ -0,0 +1,183 @@
+"""
+Pluggable random number backends for dealing shoes, with seedable,
+splittable streams.
+
+A backend turns a 64-bit shoe seed into a shuffled shoe and a reshuffle
+point (backend.shuffle(seed, num_decks)), so any shoe can be dealt
+again from its seed and backend name alone:
+
+    mt      random.Random(seed).shuffle, as run.Shoe has always dealt
+    pcg64   NumPy's PCG64 and Philox bit generators: a shoe is the
+    philox  argsort of a row of uniform doubles, so a whole batch of
+            shoes is shuffled by one vectorised call
+
+For the NumPy backends the top 48 bits of a shoe seed are the key of a
+bit generator and the bottom 16 bits the shoe's row in that generator's
+output, which the generator jumps straight to with advance(). The
+shoes of a Stream are consecutive rows, dealt a batch at a time, and
+each one is still reproducible from its own seed.
+
+A Stream is seeded from a numpy.random.SeedSequence, and spawn() splits
+it into independent child streams, e.g. one per table, worker or
+simulation block. Streams also have the parts of the random module's
+interface the engine uses (getrandbits, randint, random and shuffle), so
+a Stream can be passed anywhere an rng is taken: Table, Shoe, Simulator.
+
+Hand logs record the backend of each shoe, so replays deal the same
+cards whichever backend was used.
+"""
+
+from array import array
+
+import numpy as np
+
+# shoes (rows) per NumPy generator key
+ROWS_PER_KEY = 1 << 16
+
+
+class MersenneTwister:
+    """
+    The shuffle run.Shoe uses by default: Python's Mersenne Twister
+    seeded with the shoe seed
+    """
+
+    name = 'mt'
+    code = 0
+
+    def shuffle(self, seed, num_decks):
+        from .run import Shoe
+
+        return Shoe.shuffle(seed, num_decks)
+
+    def shuffle_batch(self, key, start, count, num_decks):
+        # no vectorised form: one shuffle per shoe, seeded from the row seeds
+        seeds = [key * ROWS_PER_KEY + row for row in range(start, start + count)]
+        return seeds, [self.shuffle(seed, num_decks) for seed in seeds]
+
+
+class NumpyBackend:
+    """
+    Shoes from a NumPy bit generator: row r of the generator keyed with
+    k holds a uniform double per card and one for the reshuffle point,
+    and the shoe with seed (k << 16) | r is the argsort of its cards'
+    doubles
+    """
+
+    def __init__(self, name, code, bit_generator, draws_per_step=1):
+        self.name = name
+        self.code = code
+        self.bit_generator = bit_generator
+        # 64-bit outputs per step of bit_generator.advance()
+        self.draws_per_step = draws_per_step
+
+    def row_width(self, num_decks):
+        # a double per card and one for the reshuffle point, rounded up
+        # to whole advance() steps
+        step = self.draws_per_step
+        return -(-(52 * num_decks + 1) // step) * step
+
+    def rows(self, key, start, count, num_decks):
+        width = self.row_width(num_decks)
+        bits = self.bit_generator(key)
+        bits.advance(start * width // self.draws_per_step)
+        return np.random.Generator(bits).random((count, width))
+
+    def deal(self, uniforms, num_decks):
+        # cards and reshuffle points for rows of uniforms
+        size = 52 * num_decks
+        cards = (np.argsort(uniforms[:, :size], axis=1) % 52).astype(np.uint8)
+        points = 30 + (uniforms[:, size] * (size - 29)).astype(np.int64)
+        return cards, points
+
+    def shuffle(self, seed, num_decks):
+        cards, points = self.deal(self.rows(seed // ROWS_PER_KEY, seed % ROWS_PER_KEY, 1, num_decks), num_decks)
+        return array('B', cards[0].tobytes()), int(points[0])
+
+    def shuffle_batch(self, key, start, count, num_decks):
+        """
+        The seeds and (cards, reshuffle point) of count consecutive
+        shoes, starting at row start of key, in one vectorised call
+        """
+        cards, points = self.deal(self.rows(key, start, count, num_decks), num_decks)
+        seeds = [key * ROWS_PER_KEY + row for row in range(start, start + count)]
+        return seeds, [(array('B', row.tobytes()), int(point)) for row, point in zip(cards, points.tolist())]
+
+
+BACKENDS = {
+    'mt': MersenneTwister(),
+    'pcg64': NumpyBackend('pcg64', 1, np.random.PCG64),
+    # Philox advances a counter of four 64-bit outputs at a time
+    'philox': NumpyBackend('philox', 2, np.random.Philox, draws_per_step=4),
+}
+BACKEND_CODES = {backend.code: backend for backend in BACKENDS.values()}
+
+
+def get_backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown RNG backend: {name} (expected {', '.join(BACKENDS)})")
+    return BACKENDS[name]
+
+
+class Stream:
+    """
+    A reproducible stream of shoes and random numbers from a backend,
+    seeded with an int (or None for fresh entropy) or a SeedSequence.
+    Shoes are dealt batch at a time.
+    """
+
+    def __init__(self, seed=None, backend='philox', batch=256):
+        self.backend = get_backend(backend) if isinstance(backend, str) else backend
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        # independent children for shoe keys, other numbers and spawn()
+        self.keys, numbers, self.children = self.seed_sequence.spawn(3)
+        self.generator = np.random.Generator(np.random.PCG64(numbers))
+        self.batch = batch
+        self.key = None
+        self.row = ROWS_PER_KEY
+        self.shoes = []
+        self.num_decks = None
+
+    def spawn(self, count):
+        """
+        count independent child streams with the same backend
+        """
+        return [Stream(child, self.backend, self.batch) for child in self.children.spawn(count)]
+
+    def next_key(self):
+        # a fresh 48-bit generator key for the next ROWS_PER_KEY shoes
+        self.key = int(self.keys.spawn(1)[0].generate_state(1, np.uint64)[0]) >> 16
+        self.row = 0
+
+    def next_shoe(self, num_decks):
+        """
+        The seed, cards and reshuffle point of the stream's next shoe
+        """
+        if not self.shoes or num_decks != self.num_decks:
+            if self.row >= ROWS_PER_KEY:
+                self.next_key()
+            count = min(self.batch, ROWS_PER_KEY - self.row)
+            seeds, shoes = self.backend.shuffle_batch(self.key, self.row, count, num_decks)
+            self.row += count
+            self.num_decks = num_decks
+            # popped from the end
+            self.shoes = [(seed, *shoe) for seed, shoe in zip(reversed(seeds), reversed(shoes))]
+        return self.shoes.pop()
+
+    # the parts of the random module's interface used by the engine
+
+    def random(self):
+        return self.generator.random()
+
+    def randint(self, a, b):
+        return int(self.generator.integers(a, b, endpoint=True))
+
+    def getrandbits(self, k):
+        if not 0 < k <= 64:
+            raise ValueError("Stream.getrandbits takes 1 to 64 bits")
+        return int(self.generator.bit_generator.random_raw()) >> (64 - k)
+
+    def shuffle(self, x):
+        # in place, like random.shuffle
+        shuffled = [x[index] for index in self.generator.permutation(len(x))]
+        for index, value in enumerate(shuffled):
+            x[index] = value
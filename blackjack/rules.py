@@ -0,0 +1,65 @@
+"""
+Rule sets for the game. A Table is played under one RuleSet, which the
+engine (run.py), the strategy tables (strategy.py), exact EVs (ev.py)
+and the hand log all read the rules from.
+"""
+
+from collections import namedtuple
+
+# most hands a player can split to
+MAX_HANDS = 4
+
+
+class RuleSet(namedtuple('RuleSet', [
+        'num_decks', 'hit_soft_17', 'double_after_split', 'max_hands',
+        'late_surrender', 'insurance', 'blackjack_payout'
+        ])):
+    """
+    The rules of a game. The defaults are the original rules: 6 decks,
+    dealer stands on soft 17, one split (two hands) with no double after
+    split, no surrender or insurance, and blackjack pays 3:2.
+
+    The dealer never takes a hole card: the second dealer card is drawn
+    once the player has acted, so a dealer blackjack takes doubled and
+    split bets in full: a two-card 21 on a split hand is not a blackjack,
+    so it pays even money and loses to a dealer blackjack. Late surrender
+    gives up half the bet as the first action on the initial two cards,
+    unless the dealer's second card makes a blackjack, which takes the
+    whole bet; insurance can be taken against a dealer ace before acting,
+    for half the bet, and pays 2:1.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, num_decks=6, hit_soft_17=False, double_after_split=False, max_hands=2,
+                late_surrender=False, insurance=False, blackjack_payout=1.5):
+        if not (num_decks > 0 and num_decks < 9):
+            raise ValueError("Number of decks must be between 1 and 8")
+        if not (max_hands > 0 and max_hands <= MAX_HANDS):
+            raise ValueError(f"Number of hands after splits must be between 1 and {MAX_HANDS}")
+        if blackjack_payout <= 0:
+            raise ValueError("Blackjack payout must be greater than 0")
+        return super().__new__(
+            cls, int(num_decks), bool(hit_soft_17), bool(double_after_split), int(max_hands),
+            bool(late_surrender), bool(insurance), float(blackjack_payout)
+            )
+
+    def digest(self):
+        # stable short hash of the rules, e.g. for naming cached files
+        import hashlib
+        return hashlib.sha256(repr(tuple(self)).encode()).hexdigest()[:16]
+
+    def describe(self):
+        blackjack = '3:2' if self.blackjack_payout == 1.5 else '6:5' if self.blackjack_payout == 1.2 else f'{self.blackjack_payout:g}:1'
+        return ', '.join([
+            f'{self.num_decks} deck{"s" if self.num_decks > 1 else ""}',
+            'H17' if self.hit_soft_17 else 'S17',
+            'DAS' if self.double_after_split else 'no DAS',
+            f'split to {self.max_hands} hands' if self.max_hands > 1 else 'no splits',
+            'late surrender' if self.late_surrender else 'no surrender',
+            'insurance' if self.insurance else 'no insurance',
+            f'blackjack pays {blackjack}'
+        ])
+
+
+DEFAULT = RuleSet()
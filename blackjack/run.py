@@ -0,0 +1,1048 @@
+import random
+import math
+import os
+import sys
+from array import array
+from collections import namedtuple
+
+from . import metrics
+from . import strategy
+from .rules import RuleSet
+from .screen import Screen
+
+
+# waiting for the player is timed like the other phases of a hand
+@metrics.timed('input')
+def read_input():
+    return input()
+
+
+def round_float(x):
+    if '.' in str(x):
+        return str(x).rstrip("0").rstrip(".")
+    else:
+        return x
+
+
+# Snapshot of a table returned by Table.state()
+TableState = namedtuple('TableState', [
+    'phase', 'hands', 'dealer_cards', 'active_hand', 'legal_actions',
+    'optimal_action', 'bets', 'insurance_bet', 'player_stack', 'results'
+    ])
+HandResult = namedtuple('HandResult', ['result_string', 'winnings'])
+
+
+class Table:
+    """
+    Holds the player's chip stack and card deck(s).
+    Maintains game state and has methods for displaying game status
+    to the user.
+    Hands are driven with start_hand() and step(), which never block, and
+    state() returns a snapshot of the game for any frontend.
+
+    The game is played under a rules.RuleSet (the original rules with
+    num_decks decks if none is given). The player's cards are a list of
+    hands, with the bet on each in bets: a split moves a card into a new
+    hand after the one split. Hands are played in order and active is the
+    index of the hand waiting for input, which is len(hands) once input
+    has ended.
+    """
+
+    # h = hit, s = stick, d = double, 2 = split, r = surrender, i = insure
+    key_actions = {'h': 'hit', 's': 'stand', 'd': 'double', '2': 'split', 'r': 'surrender', 'i': 'insure'}
+
+    def __init__(self, player_stack, num_decks=6, rng=random, rules=None, shoe=None):
+        # rules, if given, also sets the number of decks
+        self.rules = rules or RuleSet(num_decks)
+        self.player_stack = player_stack
+        # a shoe, if given, is dealt from instead of a new one shuffled
+        # from rng, e.g. the shoe the seats of a MultiSeatTable share
+        self.shoe = Shoe(self.rules.num_decks, rng) if shoe is None else shoe
+        self.reshuffle = False
+        # StrategyTable for the rules, loaded on first use
+        self.strategy_table = None
+        # a HandLogWriter (see handlog.py) that each completed hand is written to
+        self.hand_log = None
+        # keep (action, optimal action) pairs in self.actions for each hand
+        self.record_actions = False
+        # called as on_decision(table, hand, action, optimal action) before
+        # each action is taken, while actions are recorded
+        self.on_decision = None
+        # called as on_hand_complete(table) once each hand is settled
+        self.on_hand_complete = None
+        self.reset_hand()
+        # give bet an intial value to avoid bet <= 0 error
+        self.bet = 1
+        self.bet_placed = False
+        self.screen = Screen()
+
+    @property
+    def natural(self):
+        # a blackjack dealt to the player; no blackjack after split
+        return len(self.hands) == 1 and self.hands[0].blackjack
+
+    @metrics.timed('frame')
+    def frame(self, messages, columns=65):
+        """
+        Build the rows of the table view, with the messages shown
+        in the message bar at the bottom
+        """
+        card_images = Deck.card_images
+        dealer_card_images = [card_images[card] for card in self.dealer_cards]
+        # add a face down card for the dealer if only 1 dealer card dealt
+        if len(self.dealer_cards) == 1:
+            dealer_card_images += [card_images[-1]]
+
+        view = []
+        # dealer status and cards
+        dealer_hand_label = "Blackjack" if self.dealer_cards.blackjack else self.dealer_cards.value
+        view += [f'|<-- Dealer: {dealer_hand_label} -->']
+        for row in range(5):
+            view += ['|' + ''.join([image[row] for image in dealer_card_images])]
+        # player status and cards for each hand, with a marker on the
+        # active hand if there's a split
+        split = len(self.hands) > 1
+        for index, cards in enumerate(self.hands):
+            if index == 0:
+                player_hand_label = "Blackjack" if self.natural else cards.value
+                if self.bet_placed:
+                    view += [f'|<-- Player: {player_hand_label} | Bet: {round_float(self.bets[0])} -->']
+                else:
+                    view += [f'|<-- Player: {player_hand_label} -->']
+            else:
+                # split hand can't be blackjack, so always display numeric value
+                view += [f'|<-- Player split: {cards.value} | Bet: {round_float(self.bets[index])} -->']
+            hand_card_images = [card_images[card] for card in cards]
+            marked = split and index == self.active
+            for row in range(5):
+                row_string = '|' + ''.join([image[row] for image in hand_card_images])
+                if marked and row in (1, 2, 3):
+                    row_string += ' ' * (columns - 5 - len(row_string)) + '<<<<'
+                view += [row_string]
+        # current bet and chip stack with spacer rows
+        view += ['|']
+        # strip decimal from bet and stack values if round numbers
+        bet = round_float(sum(self.bets) + self.insurance_bet)
+        stack = round_float(self.player_stack)
+        bet_spacer = ' ' * (6 - len(str(bet)))
+        stack_spacer = ' ' * (6 - len(str(stack)))
+        if self.bet_placed:
+            view += [f'|<--   Total bet: {bet_spacer}{bet}  -->|<--  Remaining chips: {stack_spacer}{stack}   -->']
+        else:
+            view += [f'|<--     No bet placed     -->|<--  Remaining chips: {stack_spacer}{stack}  -->']
+        view += ['|']
+        # message rows; if spacer length is an odd number, add 1 extra block to right spacer
+        for message in messages:
+            spacer_left = int(math.floor(((columns - 2) - len(message)) / 2) - 1)
+            spacer_right = int(math.ceil(((columns - 2) - len(message)) / 2) - 1)
+            view += [f'|{"░" * spacer_left} {message} {"░" * spacer_right}']
+        # top border, then right border with spacers on every row, then bottom border
+        border = '-' * (columns - 2)
+        print_view = [f'┌{border}┐']
+        for row in view:
+            print_view += [f'{row}{" " * ((columns - 1) - len(row))}|']
+        print_view += [f'└{border}┘']
+        return print_view
+
+    @metrics.timed('print')
+    def print(self, messages, columns=65):
+        # redraw the changed rows of the view in place
+        self.screen.draw(self.frame(messages, columns))
+
+    @metrics.timed('process_result')
+    def process_result(self, cards, bet):
+        """
+        Once all actions have been taken, determine if the player
+        won or lost the hand and update their stack accordingly
+        """
+        player_hand_value = cards.value
+        dealer_hand_value = self.dealer_cards.value
+        player_blackjack = self.natural
+        dealer_blackjack = self.dealer_cards.blackjack
+
+        # player has blackjack and dealer does not: winnings are the bet
+        # times the blackjack payout (e.g. 1.5x for 3:2)
+        # note: bet is also returned when player wins so bet is * 2.5 not 1.5
+        if player_blackjack and not dealer_blackjack:
+            winnings = bet * (1 + self.rules.blackjack_payout)
+            """
+            remove decimal if winnings is a round number
+            source: https://stackoverflow.com/questions/2440692/formatting-floats-without-trailing-zeros
+            """
+            return {
+                'result_string': f'Blackjack! You won {round_float(winnings)}.',
+                'winnings': winnings
+            }
+
+        # player is not bust
+        if player_hand_value <= 21:
+            # player hand beats dealer or dealer is bust
+            if player_hand_value > dealer_hand_value or dealer_hand_value > 21:
+                winnings = bet * 2
+                return {
+                    'result_string': f'You won {round_float(winnings)}!',
+                    'winnings': winnings
+                }
+
+            # tie: return the bet only
+            if (not dealer_blackjack and
+                (player_hand_value == dealer_hand_value)) or (
+                    player_blackjack and dealer_blackjack):
+                winnings = bet
+                return {
+                    'result_string': f'Push: returning {round_float(bet)} bet.',
+                    'winnings': winnings
+                }
+
+        # if function gets to here, dealer has won
+        return {
+            'result_string': 'Dealer won :-(',
+            'winnings': 0
+        }
+
+    def dealer_cards_needed(self):
+        """
+        How much of the dealer hand settling needs: 2 for the full hand
+        if any hand is still live, 1 for just the second card to settle
+        a blackjack, surrender or insurance, otherwise 0
+        """
+        if not self.surrendered and any(cards.value <= 21 for cards in self.hands):
+            return 1 if self.natural else 2
+        return 1 if self.surrendered or self.insurance_bet else 0
+
+    @metrics.timed('reveal_dealer_cards')
+    def reveal_dealer_cards(self, needed=2):
+        # needed as returned by dealer_cards_needed()
+        if not needed:
+            return
+        # deal 1 additional dealer card, since dealer already has one
+        self.dealer_cards.add(self.shoe.draw())
+        # check for dealer blackjack or only the second card needed
+        if self.dealer_cards.blackjack or needed == 1:
+            return
+        # continue drawing cards until dealer has > 17, or a hard 17
+        # if the dealer hits soft 17
+        hit_soft_17 = self.rules.hit_soft_17
+        while self.dealer_cards.value < 17 or (
+                hit_soft_17 and self.dealer_cards.value == 17 and self.dealer_cards.soft):
+            self.dealer_cards.add(self.shoe.draw())
+
+    def action_permitted(self, action, hand=None):
+        """
+        Returns True or False indicating if the action
+        passed in (hit, stand, double, split, surrender or insure) is
+        permitted on a hand (by default the active hand)
+        """
+        # only the active hand takes actions
+        if hand is None:
+            hand = self.active
+        if hand != self.active or hand >= len(self.hands):
+            return False
+        # no actions permitted if player has blackjack
+        # no blackjack permitted after split
+        if self.natural:
+            return False
+        cards = self.hands[hand]
+        rules = self.rules
+        # hit and stand allowed except when player has blackjack or input ended
+        if (action == 'hit' or action == 'stand'):
+            return True
+        # double allowed as first action only, and after split only if the
+        # rules allow it
+        elif (action == 'double' and
+                len(cards) == 2 and
+                (len(self.hands) == 1 or rules.double_after_split) and
+                self.player_stack >= self.bets[hand]):
+            return True
+        # split allowed only as first action, when cards have equal rank,
+        # when enough chips are available to split, and when the rules
+        # allow another hand
+        elif (action == 'split' and
+                len(cards) == 2 and
+                card_values[cards[0]] == card_values[cards[1]] and
+                len(self.hands) < rules.max_hands and
+                self.player_stack >= self.bets[hand]):
+            return True
+        # surrender allowed as first action on the initial two cards only
+        elif (action == 'surrender' and
+                rules.late_surrender and
+                len(self.hands) == 1 and
+                len(cards) == 2):
+            return True
+        # insurance allowed once against a dealer ace, before acting
+        elif (action == 'insure' and
+                rules.insurance and
+                not self.insurance_bet and
+                len(self.hands) == 1 and
+                len(cards) == 2 and
+                card_values[self.dealer_cards[0]] == 11 and
+                self.player_stack >= self.bets[hand] / 2):
+            return True
+        else:
+            return False
+
+    def actions_permitted(self, **kwargs):
+        # set the variables if they were passed in as keyword args
+        hand = kwargs['hand'] if 'hand' in kwargs else None
+        req_str = kwargs['req_str'] if 'req_str' in kwargs else False
+        action_list = []
+        for key, action in self.key_actions.items():
+            if self.action_permitted(action, hand):
+                # append the key prompt if returning the request string
+                action_list += [f'{action}{f" ({key})" if req_str else ""}']
+
+        if req_str and action_list:
+            """
+            Join the actions together into a comma-separated string but
+            join last 2 words with 'and'
+            source: https://stackoverflow.com/a/30084022/726221
+            """
+            action_request_string = f'{" or ".join([", ".join(action_list[:-1]),action_list[-1]])}?'
+            return [action_request_string.capitalize()]
+        else:
+            return action_list
+
+    def process_action(self, key_pressed):
+        """
+        Handle a key pressed while the hand is in play and return the
+        messages to show next. An action that doesn't match the optimal
+        strategy is only taken when its key is pressed a second time.
+        """
+        hand = self.active
+        action = self.key_actions.get(key_pressed)
+        # invalid key or action not permitted - no action taken
+        if action not in self.actions_permitted(hand=hand):
+            return self.messages()
+        if not self.action_confirmed(action, hand):
+            return [
+                self.actions_permitted(req_str=True, hand=hand)[0],
+                f'Optimal action is to {self.optimal_strategy(hand)}. Press {key_pressed} again to {action}.'
+            ]
+        self.step(action)
+        return self.messages()
+
+    def take_action(self, action, hand=None):
+        """
+        Apply a permitted action to a hand (by default the active hand)
+        without any prompting or confirmation
+        """
+        if hand is None:
+            hand = self.active
+        if self.record_actions:
+            optimal = self.optimal_strategy(hand)
+            self.actions += [(action, optimal)]
+            if self.on_decision is not None:
+                self.on_decision(self, hand, action, optimal)
+        cards = self.hands[hand]
+        if action == 'hit':
+            cards.add(self.shoe.draw())
+            return
+        elif action == 'stand':
+            self.active += 1
+            return
+        elif action == 'double':
+            self.player_stack -= self.bets[hand]
+            self.bets[hand] *= 2
+            cards.add(self.shoe.draw())
+            self.active += 1
+            return
+        elif action == 'split':
+            # move one card to a new hand with its own bet, played after
+            # this one, and deal a second card to this hand
+            self.player_stack -= self.bets[hand]
+            self.hands.insert(hand + 1, Hand([cards.pop()]))
+            self.bets.insert(hand + 1, self.bets[hand])
+            cards.add(self.shoe.draw())
+            return
+        elif action == 'surrender':
+            self.surrendered = True
+            self.active += 1
+            return
+        elif action == 'insure':
+            self.insurance_bet = self.bets[hand] / 2
+            self.player_stack -= self.insurance_bet
+
+    def action_confirmed(self, action, hand=None):
+        optimal_strategy = self.optimal_strategy(hand)
+        if (action == optimal_strategy or
+                self.confirmed_action == action):
+            self.confirmed_action = ''
+            return True
+        else:
+            self.confirmed_action = action
+            return False
+
+    @metrics.timed('optimal_strategy')
+    def optimal_strategy(self, hand=None):
+        """
+        Return the optimal action for the player to take on a hand (by
+        default the active hand) based on their cards and the dealer's
+        cards, looked up in the strategy table for the rules (see
+        strategy.py). Insurance is never optimal.
+        """
+        if hand is None:
+            hand = self.active
+        hands = self.hands
+        # the checks action_permitted makes for every action, made once:
+        # no action on an inactive hand or a blackjack
+        if hand != self.active or hand >= len(hands) or self.natural:
+            return False
+        if self.strategy_table is None:
+            self.strategy_table = strategy.table_for(self.rules)
+        rules = self.rules
+        cards = hands[hand]
+        first_action = len(cards) == 2
+        pair = first_action and card_values[cards[0]] == card_values[cards[1]]
+        chips = self.player_stack >= self.bets[hand]
+        single = len(hands) == 1
+        return self.strategy_table.lookup(
+            cards.value,
+            cards.soft,
+            pair,
+            card_values[self.dealer_cards[0]],
+            # double, split and surrender as permitted by action_permitted
+            first_action and (single or rules.double_after_split) and chips,
+            pair and len(hands) < rules.max_hands and chips,
+            rules.late_surrender and single and first_action
+            )
+
+    def reference_strategy(self, hand=None):
+        """
+        Return the optimal action for the player to take
+        based on their cards and the dealer's cards.
+        This is the definition of the strategy that the table used
+        by optimal_strategy is compiled from for the default rules
+        (see strategy.py)
+        """
+        if hand is None:
+            hand = self.active
+        # Get hand values
+        cards = self.hands[hand]
+        player_value = cards.value
+        soft = cards.soft
+        dealer_value = self.dealer_cards.value
+        double_permitted = 'double' in self.actions_permitted(hand=hand)
+
+        # No actions possible
+        if not self.actions_permitted(hand=hand):
+            return False
+
+        """
+        Splits allowed (player has 2 cards or equal value)
+        """
+        if 'split' in self.actions_permitted(hand=hand):
+            # Never split 5s or 10s - no return so handled in non-split section
+            if player_value not in [10, 20]:
+                # 9s
+                if (player_value == 18 and
+                        (dealer_value == 7 or dealer_value >= 10)):
+                    return 'stand'
+                # 4s, 6s, or <=7 vs 8+
+                elif ((player_value == 8 and not 5 <= dealer_value <= 6) or
+                        ((player_value == 12 and not soft) and dealer_value >= 7) or
+                        ((player_value <= 14 and not soft) and dealer_value >= 8)):
+                    return 'hit'
+                else:
+                    return 'split'
+
+        """
+        Soft player hands (player has >= 1 Ace valued at 11)
+        """
+        if soft:
+            if ((player_value == 17 and 3 <= dealer_value <= 6) or
+                    (15 <= player_value <= 16 and 4 <= dealer_value <= 6) or
+                    (13 <= player_value <= 14 and 5 <= dealer_value <= 6)):
+                return 'double' if double_permitted else 'hit'
+            elif player_value == 18 and 3 <= dealer_value <= 6:
+                return 'double' if double_permitted else 'stand'
+            elif ((player_value == 18 and dealer_value <= 8) or
+                    player_value >= 19):
+                return 'stand'
+            else:
+                return 'hit'
+
+        """
+        No split and not soft
+        """
+        # Doubles
+        if ((player_value == 11 and dealer_value < 11) or
+                (player_value == 10 and dealer_value < 10) or
+                (player_value == 9 and 3 <= dealer_value <= 6)):
+            return 'double' if double_permitted else 'hit'
+
+        # Hits
+        if (player_value <= 11 or
+                (player_value == 12 and not (4 <= dealer_value <= 6)) or
+                (13 <= player_value <= 16 and dealer_value >= 7)):
+            return 'hit'
+
+        # player 17+ or (player 13-16 and dealer < 7)
+        else:
+            return 'stand'
+
+    def reset_hand(self):
+        self.phase = 'bet'
+        self.results = []
+        self.bet_placed = False
+        self.confirmed_action = ''
+        self.actions = []
+        self.hands = [Hand()]
+        self.bets = []
+        self.active = 0
+        self.surrendered = False
+        self.insurance_bet = 0
+        self.insurance_winnings = 0
+        self.dealer_cards = Hand()
+
+    def place_bet(self, bet):
+        self.bet = bet
+        self.player_stack -= self.bet
+        self.bets = [self.bet]
+        self.bet_placed = True
+
+    @metrics.timed('deal')
+    def deal(self):
+        # shoe position of the first card and the stack before the bet,
+        # for the hand log
+        self.hand_start = self.shoe.position
+        self.hand_start_stack = self.player_stack + self.bet
+        # deal 2 cards to player and 1 to dealer
+        self.hands[0].add(self.shoe.draw())
+        self.hands[0].add(self.shoe.draw())
+        self.dealer_cards.add(self.shoe.draw())
+        self.phase = 'action'
+        self.advance()
+
+    def update_hand_status(self):
+        """
+        End hands that need no further input and deal the second
+        card to a split hand once it becomes active
+        """
+        while self.active < len(self.hands):
+            cards = self.hands[self.active]
+            # deal second card to split hand initially
+            if len(cards) == 1:
+                cards.add(self.shoe.draw())
+            # end hand if bust or blackjack
+            if cards.value > 21 or self.natural:
+                self.active += 1
+            else:
+                break
+
+    def settle(self):
+        """
+        Reveal the dealer cards if needed, pay out each hand and the
+        insurance and return the list of results (one per hand, in order)
+        """
+        self.reveal_dealer_cards(self.dealer_cards_needed())
+        return self.pay()
+
+    def pay(self):
+        """
+        Pay out each hand and the insurance against the revealed dealer
+        cards and return the list of results
+        """
+        if self.surrendered and self.dealer_cards.blackjack:
+            # late surrender is lost to a dealer blackjack
+            results = [{
+                'result_string': 'Dealer blackjack: surrender lost.',
+                'winnings': 0
+            }]
+        elif self.surrendered:
+            # surrender returns half the bet
+            results = [{
+                'result_string': f'Surrendered: returning {round_float(self.bets[0] / 2)}.',
+                'winnings': self.bets[0] / 2
+            }]
+        else:
+            results = [self.process_result(cards, bet) for cards, bet in zip(self.hands, self.bets)]
+        # insurance pays 2:1 if the dealer has blackjack
+        if self.insurance_bet and self.dealer_cards.blackjack:
+            self.insurance_winnings = self.insurance_bet * 3
+        self.player_stack += sum(result['winnings'] for result in results) + self.insurance_winnings
+        # trigger game exit if shoe is at or beyond reshuffle point
+        if len(self.shoe) < self.shoe.reshuffle_point:
+            self.reshuffle = True
+        return results
+
+    def start_hand(self, bet):
+        """
+        Place the bet and deal a new hand. Raises ValueError for an
+        invalid bet, leaving the table waiting for a bet, or while a hand
+        is in play, leaving that hand as it was.
+        Returns the new state.
+        """
+        if self.phase not in ('bet', 'complete'):
+            raise ValueError(f"Can't deal a new hand in the {self.phase} phase")
+        self.reset_hand()
+        self.place_bet(bet)
+        self.deal()
+        return self.state()
+
+    def step(self, action, hand=None):
+        """
+        Take an action ('hit', 'stand', 'double', 'split', 'surrender' or
+        'insure') on the active hand and return the new state. Raises
+        ValueError if the action is not permitted.
+        """
+        if hand is None:
+            hand = self.active
+        if self.phase != 'action' or not self.action_permitted(action, hand):
+            raise ValueError(f"Action not permitted: {action}")
+        self.take_action(action, hand)
+        self.advance()
+        return self.state()
+
+    def advance(self):
+        # end finished hands and settle once no more input is needed
+        self.update_hand_status()
+        if self.active >= len(self.hands):
+            self.results = self.settle()
+            self.phase = 'complete'
+            self.shoe.discard()
+            if self.hand_log is not None:
+                self.hand_log.record(self)
+            if self.on_hand_complete is not None:
+                self.on_hand_complete(self)
+
+    def state(self):
+        """
+        Return an immutable snapshot of the hand in play
+        """
+        active = self.phase == 'action'
+        return TableState(
+            phase=self.phase,
+            hands=tuple(tuple(cards) for cards in self.hands),
+            dealer_cards=tuple(self.dealer_cards),
+            active_hand=self.active if active else None,
+            legal_actions=tuple(self.actions_permitted()) if active else (),
+            optimal_action=self.optimal_strategy() if active else False,
+            bets=tuple(self.bets),
+            insurance_bet=self.insurance_bet,
+            player_stack=self.player_stack,
+            results=tuple(HandResult(result['result_string'], result['winnings']) for result in self.results)
+        )
+
+    def messages(self):
+        """
+        Messages prompting for the next input in the current phase
+        """
+        if self.phase == 'bet':
+            return [f'How much would you like to bet? (max. {round_float(self.player_stack)})']
+        if self.phase == 'action':
+            return self.actions_permitted(req_str=True)
+        messages = []
+        if self.insurance_bet:
+            messages += [f'Insurance won {round_float(self.insurance_winnings)}.' if self.insurance_winnings else 'Insurance lost.']
+        if len(self.results) > 1:
+            messages += [f'Hand {index + 1}: {result["result_string"]}' for index, result in enumerate(self.results)]
+            messages[-1] += ' Press Enter for new hand.'
+        else:
+            messages += [f'{self.results[0]["result_string"]} Press Enter for new hand.']
+        return messages
+
+    def exit_message(self):
+        """
+        Reason for the game to end after the hand, or None to play on
+        """
+        if self.player_stack <= 0:
+            return 'Exiting: out of chips'
+        if self.player_stack > 999999:
+            return 'Exiting: stack >= 1,000,000 - you win!'
+        if self.reshuffle:
+            return 'Exiting: shoe hit resuffle point'
+        return None
+
+    def play_hand(self):
+        """
+        Play one hand at the terminal, reading the bet and actions with
+        input() and redrawing the table after each one
+        """
+        self.reset_hand()
+        messages = self.messages()
+        while self.phase == 'bet':
+            self.print(messages)
+            try:
+                self.start_hand(read_input())
+            except ValueError as error_message:
+                messages = [self.messages()[0], str(error_message)]
+        # get player action on each hand in turn
+        messages = self.messages()
+        while self.phase == 'action':
+            self.print(messages)
+            try:
+                messages = self.process_action(read_input())
+            except ValueError as error_message:
+                # ignores invalid keypress, but prints an error e.g. bet exceeds stack
+                messages = [self.messages()[0], str(error_message)]
+        self.print(messages)
+        # wait for key before moving to next hand
+        read_input()
+
+    @property
+    def player_stack(self):
+        return self._player_stack
+
+    @player_stack.setter
+    def player_stack(self, v):
+        if v < 0 or v > 999999:
+            raise ValueError("Player stack must be between 0 and 999999")
+        else:
+            self._player_stack = v
+
+    @property
+    def bet(self):
+        return self._bet
+
+    @bet.setter
+    def bet(self, v):
+        try:
+            bet_input = float(v)
+        except ValueError:
+            raise ValueError("Bet must be a number")
+        if (bet_input <= 0):
+            raise ValueError("Bet must be greater than 0")
+        elif (bet_input > self.player_stack):
+            raise ValueError("Bet must not be larger than remaining chips")
+        else:
+            self._bet = bet_input
+
+
+class Deck:
+    """
+    Standard 52 card deck
+    """
+
+    card_ranks = [
+        '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A'
+        ]
+
+    card_suits = [
+        '♣', '♦', '♥', '♠'
+        ]
+
+    # rng can be any object with the random module's interface, e.g. a
+    # seeded random.Random instance for a reproducible shuffle
+    def __init__(self, rng=random):
+        self.cards = list(range(52))
+        rng.shuffle(self.cards)
+
+    # card values are in 0-12 indexed array
+    # 4 suits of 13 cards, so label index is remainder after dividing by 13
+    @staticmethod
+    def get_rank(x):
+        return Deck.card_ranks[x % 13]
+
+    # 52 cards in 4 suits, so round down after dividing by 13 for suit
+    @staticmethod
+    def get_suit(x):
+        return Deck.card_suits[math.floor(x / 13)]
+
+    # combined rank and suit, e.g. As or 4d
+    @staticmethod
+    def get_label(x):
+        return f"{Deck.get_rank(x)}{Deck.get_suit(x)}"
+
+    # Blackjack card value (i.e. 10 for all face cards)
+    @staticmethod
+    def get_value(card):
+        # Number cards
+        if (card % 13) <= 7:
+            return (card % 13) + 2
+        # Ten and face cards
+        elif (card % 13) >= 8 and (card % 13) <= 11:
+            return 10
+        # Ace
+        elif (card % 13) == 12:
+            return 11
+
+    # print an ascii representation of a card
+    @staticmethod
+    def print_card(card=-1):
+        r = Deck.get_rank(card)
+        s = Deck.get_suit(card)
+        # add a spacer if rank is a single character
+        p = '' if r == '10' else ' '
+
+        print_list = ['┌─────┐']
+        # card value is specified
+        if card >= 0:
+            print_list += [f'│{r}{s}{p}  │']
+            print_list += ['│     │']
+            print_list += [f'│  {p}{r}{s}│']
+        # no card value, i.e. card is face-down
+        else:
+            print_list += ['│░░░░░│'] * 3
+        print_list += ['└─────┘']
+
+        return print_list
+
+
+class Shoe:
+    """
+    Contains one or more decks of cards and a cut point that defines when a
+    reshuffle (i.e. a new shoe) is needed.
+    Cards are held in a byte array and dealt by moving a cursor, with the
+    number of cards left of each rank and the Hi-Lo running count updated
+    on every draw, so composition and count queries never scan the cards.
+
+    An antithetic shoe is the mirror image of the shoe shuffled from the
+    same seed: every card's rank is swapped with its opposite (2 with A, 3
+    with K, ... 8 with itself), which leaves the cards in the shoe
+    unchanged but turns low-card runs into high-card runs. The pair is
+    for variance reduction in simulations (see bankroll.py), and hand
+    logs mark antithetic shoes so they can be redealt too.
+
+    The running count uses the Hi-Lo tags unless other count_tags are
+    given (see counting.py), starting from initial_count, which is only
+    non-zero for unbalanced counts.
+    """
+
+    # Hi-Lo count tag for each rank, in Deck.card_ranks order (2 to A)
+    count_tags = (1, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1, -1)
+
+    # a shoe can be dealt again from its seed, so its hands can be logged
+    replayable = True
+
+    # card id with the opposite rank in the same suit, for each card id
+    mirror = bytes(card - 2 * (card % 13) + 12 for card in range(52)).ljust(256, b'\0')
+
+    # for each index i of a shuffle, the shift that leaves a 32-bit word
+    # with as many bits as i + 1 needs, as random.getrandbits() takes them
+    shuffle_shifts = tuple(32 - (i + 1).bit_length() for i in range(52 * 8 + 1))
+
+    def __init__(self, num_decks=6, rng=random, seed=None, antithetic=False, count_tags=None, initial_count=0,
+                 backend=None):
+        self.num_decks = num_decks
+        # each shoe is shuffled from its own seed (drawn from rng if not
+        # given) by a backend (see rng.py), so any shoe can be dealt again
+        # from the seed and the backend's name alone
+        if backend is None:
+            backend = getattr(rng, 'backend', None)
+        elif isinstance(backend, str):
+            backend = self.backend_named(backend)
+        if seed is None and hasattr(rng, 'next_shoe'):
+            # an rng.Stream deals its shoes in batches, from its own backend
+            backend = rng.backend
+            self.seed, self.cards, self.reshuffle_point = rng.next_shoe(num_decks)
+        else:
+            self.seed = rng.getrandbits(64) if seed is None else seed
+            self.cards, self.reshuffle_point = (backend or Shoe).shuffle(self.seed, num_decks)
+        self.backend = backend.name if backend is not None else 'mt'
+        self.antithetic = antithetic
+        if antithetic:
+            self.cards = array('B', self.cards.tobytes().translate(self.mirror))
+        # index of the next card to be dealt
+        self.position = 0
+        self.rank_counts = [4 * num_decks] * 13
+        if count_tags is not None:
+            self.count_tags = count_tags
+        self.running_count = initial_count
+
+    @staticmethod
+    def shuffle(seed, num_decks):
+        """
+        The cards and reshuffle point of the shoe with a seed, shuffled
+        by a Mersenne Twister: the default backend.
+        This is random.Random(seed).shuffle() with its draws taken in
+        bulk: shuffle() draws one 32-bit word per swap (redrawing while
+        the index is out of range), and getrandbits(32 * i) returns the
+        next i words at once, lowest first. i words are enough for at
+        most i swaps, so no word is drawn that shuffle() wouldn't draw
+        and the reshuffle point comes from the same state.
+        """
+        shuffler = random.Random(seed)
+        cards = list(range(52)) * num_decks
+        getrandbits = shuffler.getrandbits
+        shifts = Shoe.shuffle_shifts
+        if len(cards) > len(shifts):
+            shifts = tuple(32 - (i + 1).bit_length() for i in range(len(cards)))
+        i = len(cards) - 1
+        while i:
+            words = array('I', getrandbits(32 * i).to_bytes(4 * i, 'little'))
+            if sys.byteorder == 'big':
+                words.byteswap()
+            for word in words:
+                j = word >> shifts[i]
+                if j <= i:
+                    card = cards[j]
+                    cards[j] = cards[i]
+                    cards[i] = card
+                    i -= 1
+        return array('B', cards), shuffler.randint(30, 52 * num_decks)
+
+    @staticmethod
+    def backend_named(name):
+        # the default needs no import; the others need numpy
+        if name == 'mt':
+            return None
+        from .rng import get_backend
+
+        return get_backend(name)
+
+    def discard(self):
+        # called once each hand is settled; a shoe's discards stay out
+        # until it is replaced (see shoes.py for a shuffler that reloads)
+        pass
+
+    def draw(self):
+        card = self.cards[self.position]
+        self.position += 1
+        rank = card % 13
+        self.rank_counts[rank] -= 1
+        self.running_count += self.count_tags[rank]
+        return card
+
+    # number of cards left to deal
+    def __len__(self):
+        return len(self.cards) - self.position
+
+    def composition(self):
+        """
+        Cards left by blackjack value (2-9, 10 and ace), in the format
+        used by ev.py
+        """
+        counts = self.rank_counts
+        return tuple(counts[:8]) + (counts[8] + counts[9] + counts[10] + counts[11], counts[12])
+
+    def penetration(self):
+        # fraction of the shoe dealt so far
+        return self.position / len(self.cards)
+
+    def true_count(self):
+        # running count per deck remaining
+        return self.running_count * 52 / (len(self.cards) - self.position)
+
+    @property
+    def num_decks(self):
+        return self._num_decks
+
+    @num_decks.setter
+    def num_decks(self, v):
+        if not (v > 0 and v < 9):
+            raise ValueError("Number of decks must be between 1 and 8")
+        else:
+            self._num_decks = v
+
+
+# ascii images of every card id, with the face down card last so that
+# card_images[-1] matches print_card()
+Deck.card_images = tuple(Deck.print_card(card) for card in range(52)) + (Deck.print_card(),)
+
+# Blackjack value of every card id, for fast lookup in the hot paths
+card_values = tuple(Deck.get_value(card) for card in range(52))
+
+
+class Hand:
+    """
+    Cards held by the player or dealer. The hard total (aces counted as 1)
+    and ace count are kept up to date as cards are added or removed, so
+    the hand value never needs re-evaluating from the card list.
+    """
+
+    __slots__ = ('cards', 'hard', 'aces')
+
+    def __init__(self, cards=()):
+        self.cards = []
+        self.hard = 0
+        self.aces = 0
+        for card in cards:
+            self.add(card)
+
+    def add(self, card):
+        self.cards.append(card)
+        value = card_values[card]
+        if value == 11:
+            self.aces += 1
+            self.hard += 1
+        else:
+            self.hard += value
+
+    def pop(self):
+        card = self.cards.pop()
+        value = card_values[card]
+        if value == 11:
+            self.aces -= 1
+            self.hard -= 1
+        else:
+            self.hard -= value
+        return card
+
+    # one ace counts as 11 whenever that doesn't bust the hand
+    @property
+    def value(self):
+        if self.aces and self.hard <= 11:
+            return self.hard + 10
+        return self.hard
+
+    @property
+    def soft(self):
+        return self.aces > 0 and self.hard <= 11
+
+    @property
+    def blackjack(self):
+        return len(self.cards) == 2 and self.hard == 11 and self.aces > 0
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __getitem__(self, index):
+        return self.cards[index]
+
+
+def evaluate_hand(cards):
+    """
+    Evaluate the value of a full hand by passing in an array of cards
+    """
+    hand_value = 0
+    ace_count = 0
+    blackjack = False
+    soft = False
+
+    for card in cards:
+        card_value = Deck.get_value(card)
+        hand_value += card_value
+        if card_value == 11:
+            ace_count += 1
+
+    # allow for aces to be 1 or 11
+    for _ in range(ace_count):
+        if hand_value > 21:
+            hand_value -= 10
+        else:
+            soft = True
+
+    # test for blackjack
+    if len(cards) == 2 and hand_value == 21:
+        blackjack = True
+
+    return {
+        'value': hand_value,
+        'blackjack': blackjack,
+        'soft': soft
+    }
+
+
+def play(stack=1000, num_decks=6, rules=None):
+    """
+    Play at the terminal until the player has no chips, has 1m or more
+    chips, or the shoe hits the reshuffle marker
+    """
+    table = Table(stack, num_decks, rules=rules)
+    if os.environ.get('BLACKJACK_HAND_LOG'):
+        from . import handlog
+        handlog.from_env().attach(table)
+    while True:
+        table.play_hand()
+        if table.exit_message():
+            table.print([table.exit_message()])
+            return 0
+
+
+if __name__ == '__main__':
+    # same as python3 -m blackjack play
+    metrics.install()
+    play()
@@ -0,0 +1,72 @@
+import os
+import sys
+
+# ANSI escape sequences
+CURSOR_HOME = '\x1b[H'
+ERASE_SCREEN = '\x1b[2J'
+ERASE_LINE_END = '\x1b[K'
+ERASE_SCREEN_END = '\x1b[J'
+
+
+def terminal_lines():
+    # as shutil.get_terminal_size().lines, without importing shutil and
+    # the modules it imports, which cost more startup time than the game
+    lines = os.environ.get('LINES', '')
+    if lines.isdigit() and int(lines) > 0:
+        return int(lines)
+    try:
+        return os.get_terminal_size(sys.__stdout__.fileno()).lines or 24
+    except (AttributeError, ValueError, OSError):
+        return 24
+
+
+def move_to(row):
+    # rows are 1-based in ANSI sequences
+    return f'\x1b[{row};1H'
+
+
+class Screen:
+    """
+    Draws frames (lists of rows) to a terminal with ANSI escape sequences
+    instead of clearing it with a subprocess. Only the rows that differ
+    from the previous frame are rewritten; the cursor is left on the row
+    below the frame, ready for input.
+
+    lines is the terminal height (read from the terminal if not given) and
+    newline is what ends each row of a full redraw; a raw socket with no
+    pty to translate line feeds needs '\r\n'.
+    """
+
+    def __init__(self, stream=None, lines=None, newline='\n'):
+        self.stream = stream or sys.stdout
+        self.lines = lines
+        self.newline = newline
+        self.rows = None
+
+    def reset(self):
+        # force the next frame to be drawn in full
+        self.rows = None
+
+    def render(self, rows):
+        """
+        Return the escape sequences and text that turn the previous frame
+        into this one
+        """
+        previous = self.rows
+        # a frame that doesn't fit with the input row and the newline after
+        # it will scroll the terminal, so the next frame can't be a diff
+        fits = len(rows) + 2 <= (self.lines or terminal_lines())
+        self.rows = rows if fits else None
+        if previous is None or not fits:
+            return CURSOR_HOME + ERASE_SCREEN + self.newline.join(rows) + self.newline
+        output = []
+        for index, row in enumerate(rows):
+            if index >= len(previous) or previous[index] != row:
+                output += [move_to(index + 1), row, ERASE_LINE_END]
+        # clear rows of a longer previous frame and any echoed input
+        output += [move_to(len(rows) + 1), ERASE_SCREEN_END]
+        return ''.join(output)
+
+    def draw(self, rows):
+        self.stream.write(self.render(rows))
+        self.stream.flush()
@@ -0,0 +1,259 @@
+"""
+Single-process asyncio game server. Each connection gets its own Table
+driven by the bytes it sends instead of input(), using the same keys as
+the terminal game (a bet followed by Enter, then h/s/d/2/r/i and Enter), and
+receives the same ANSI frames the terminal game draws, so an xterm
+attached to the socket behaves like one attached to `python3 run.py`.
+
+Targets, for one core: 5,000 connected sessions (a session is a Table,
+its shoe and a line buffer, a few kilobytes), and a p99 keystroke-to-frame
+latency under 5 ms with 1,000 sessions actively playing.
+
+With BLACKJACK_WATCH_PORT set, spectators can connect to that port and
+watch any table in play (see broadcast.py): every frame is rendered
+once for the player and copied to each spectator's buffer.
+
+With BLACKJACK_ANALYTICS set, every player's decisions are observed by
+one analytics.Analytics (under the name they give with a store, or as
+"table N" without one). The EVs it costs deviations with are computed
+before the server starts listening, so observing a decision never
+blocks the event loop.
+
+Usage: python3 -m blackjack.server [port] [host]
+"""
+
+import asyncio
+import io
+import itertools
+import os
+import sys
+
+from . import analytics
+from . import handlog
+from . import metrics
+from . import store
+from .broadcast import Broadcast
+from .run import Table
+
+# height of the terminal the frames are drawn for (as spawned by
+# controllers/default.js)
+TERMINAL_LINES = 24
+
+
+class Session:
+    """
+    One player's game, driven by feed() with the text they type and
+    returning the text to send back (echoed input and redrawn frames).
+    Hands can be written to a hand log, and decisions observed by an
+    analytics.Analytics under the given player name. The table plays
+    the given rules.RuleSet, or the default rules with num_decks decks.
+
+    With a store (see store.py) the player's stack is loaded when they sit
+    down and every hand is saved; a session without a player name asks
+    for one first. A player who leaves mid-hand gets their bets on it
+    back.
+    """
+
+    def __init__(self, stack=1000, num_decks=6, hand_log=None, analytics=None, player=None, rules=None, store=None):
+        self.output = io.StringIO()
+        self.table = Table(stack, num_decks, rules=rules)
+        if hand_log is not None:
+            hand_log.attach(self.table)
+        self.analytics = analytics
+        self.player = player
+        self.store = store
+        self.store_session = None
+        # spectators watch the same frames as the player (see broadcast.py)
+        self.broadcast = self.table.screen = Broadcast(self.output, TERMINAL_LINES, '\r\n')
+        self.line = ''
+        self.closed = False
+
+    def start(self):
+        if self.store is not None and self.player is None:
+            self.table.print(['What is your name?'])
+        else:
+            self.sit_down()
+            self.new_hand()
+        return self.flush()
+
+    def sit_down(self):
+        # start playing as self.player
+        table = self.table
+        if self.analytics is not None:
+            self.analytics.attach(table, self.player)
+        if self.store is None:
+            return
+        stack = self.store.load_stack(self.player)
+        # a player who went broke or broke the bank starts again
+        if stack is not None and 0 < stack <= 999999:
+            table.player_stack = stack
+        self.store_session = self.store.start_session(self.player, table.player_stack)
+        self.store.attach(table, self.store_session)
+
+    def close(self):
+        if self.store_session is not None:
+            table = self.table
+            # a hand left unfinished is called off: everything wagered on
+            # it is returned before the stack is saved
+            stack = table.hand_start_stack if table.phase == 'action' else table.player_stack
+            self.store.end_session(self.store_session, stack)
+            self.store_session = None
+        self.broadcast.close()
+        self.closed = True
+
+    def flush(self):
+        text = self.output.getvalue()
+        self.output.seek(0)
+        self.output.truncate()
+        return text
+
+    def feed(self, data):
+        """
+        Handle typed text a character at a time, echoing it like a pty in
+        canonical mode and acting on each complete line
+        """
+        for char in data:
+            if self.closed:
+                break
+            if char in '\r\n':
+                self.output.write('\r\n')
+                line, self.line = self.line, ''
+                self.handle_line(line)
+            elif char in '\x7f\b':
+                if self.line:
+                    self.line = self.line[:-1]
+                    self.output.write('\b \b')
+            elif char.isprintable():
+                self.line += char
+                self.output.write(char)
+        return self.flush()
+
+    def handle_line(self, line):
+        table = self.table
+        if self.player is None and self.store is not None:
+            if not line.strip():
+                table.print(['What is your name?'])
+                return
+            self.player = line.strip()
+            self.sit_down()
+            self.new_hand()
+        elif table.phase == 'bet':
+            try:
+                table.start_hand(line)
+            except ValueError as error_message:
+                table.print([table.messages()[0], str(error_message)])
+                return
+            table.print(table.messages())
+        elif table.phase == 'action':
+            try:
+                table.print(table.process_action(line))
+            except ValueError as error_message:
+                table.print([table.messages()[0], str(error_message)])
+        else:
+            self.end_hand()
+
+    def new_hand(self):
+        self.table.reset_hand()
+        self.table.print(self.table.messages())
+
+    def end_hand(self):
+        message = self.table.exit_message()
+        if message:
+            self.table.print([message])
+            self.close()
+        else:
+            self.new_hand()
+
+
+# shared by every session when BLACKJACK_HAND_LOG is set
+hand_log = None
+# shared by every session when BLACKJACK_STORE is set
+player_store = None
+# shared by every session when BLACKJACK_ANALYTICS is set
+decision_analytics = None
+# sessions in play by table number, for spectators
+tables = {}
+table_numbers = itertools.count(1)
+
+
+async def handle_connection(reader, writer):
+    number = next(table_numbers)
+    session = Session(hand_log=hand_log, store=player_store, analytics=decision_analytics,
+                      player=None if player_store is not None else f'table {number}')
+    tables[number] = session
+    try:
+        writer.write(session.start().encode())
+        await writer.drain()
+        while not session.closed:
+            data = await reader.read(1024)
+            if not data:
+                break
+            writer.write(session.feed(data.decode(errors='ignore')).encode())
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        del tables[number]
+        session.close()
+        writer.close()
+
+
+async def handle_spectator(reader, writer):
+    """
+    Ask which table to watch, then stream its frames until the game ends
+    or the spectator leaves
+    """
+    session = None
+    watcher = None
+    leaving = None
+    try:
+        numbers = sorted(tables)
+        listing = ', '.join(str(number) for number in numbers[:20]) + (' ...' if len(numbers) > 20 else '')
+        writer.write(f'Tables in play: {listing or "none"}\r\nTable to watch (Enter for {numbers[0] if numbers else "none"})? '.encode())
+        await writer.drain()
+        line = (await reader.readline()).decode(errors='ignore').strip()
+        if line.isdigit():
+            session = tables.get(int(line))
+        elif not line and numbers:
+            session = tables.get(numbers[0])
+        if session is None:
+            writer.write(b'No such table\r\n')
+            await writer.drain()
+            return
+        watcher = session.broadcast.watch()
+        # spectators' keys are ignored, but reading them notices them leave
+        leaving = asyncio.ensure_future(read_until_closed(reader, watcher))
+        await watcher.send_to(writer)
+    except ConnectionError:
+        pass
+    finally:
+        if leaving is not None:
+            leaving.cancel()
+        if watcher is not None:
+            session.broadcast.unwatch(watcher)
+        writer.close()
+
+
+async def read_until_closed(reader, watcher):
+    while await reader.read(1024):
+        pass
+    watcher.close()
+
+
+async def serve(port=8765, host='127.0.0.1', watch_port=None):
+    server = await asyncio.start_server(handle_connection, host, port)
+    if watch_port is not None:
+        await asyncio.start_server(handle_spectator, host, watch_port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    metrics.install()
+    hand_log = handlog.from_env()
+    player_store = store.from_env()
+    decision_analytics = analytics.from_env()
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    host = sys.argv[2] if len(sys.argv) > 2 else '127.0.0.1'
+    watch_port = os.environ.get('BLACKJACK_WATCH_PORT')
+    asyncio.run(serve(port, host, int(watch_port) if watch_port else None))
@@ -0,0 +1,172 @@
+"""
+Shoes that never need a reshuffle, for long simulations and unbounded
+sessions. Both deal through the same interface as run.Shoe (draw(),
+len(), position, composition() and the count), with a reshuffle point
+of 0, so a Table dealing from one never stops for a new shoe:
+
+    InfiniteShoe        an infinite deck: every card is drawn with
+                        replacement, so the odds never change
+    ContinuousShuffler  a continuous shuffling machine: each card is
+                        drawn at random from the cards in the machine,
+                        and the discards are loaded back in after the
+                        hand (or lag hands) they were dealt in
+
+A Table calls shoe.discard() once each hand is settled, which is when
+the shuffler takes a hand's cards into its discard tray.
+
+Neither can be redealt from a seed and a position, so their hands
+can't be written to a hand log: attaching a handlog.HandLogWriter to a
+table dealing from one raises ValueError.
+"""
+
+import random
+from array import array
+from collections import deque
+
+from .run import Shoe
+
+
+class InfiniteShoe(Shoe):
+    """
+    An infinite-deck shoe. Cards are drawn from blocks of random bytes
+    mapped to card ids by a precomputed table (4 bytes per card id, the
+    other 48 byte values rejected), so each draw is an index into a
+    block and every card id is equally likely. The composition is always
+    that of num_decks full decks and there is nothing to count.
+    """
+
+    # card id for each byte value: the first 4 * 52 values cover every
+    # card id 4 times, the rest are deleted from a block before use
+    card_table = bytes(value % 52 for value in range(208)).ljust(256, b'\0')
+    rejected = bytes(range(208, 256))
+
+    # random bytes per block
+    block_size = 4096
+
+    replayable = False
+
+    def __init__(self, num_decks=6, rng=random, seed=None, count_tags=None, initial_count=0):
+        self.num_decks = num_decks
+        self.seed = rng.getrandbits(64) if seed is None else seed
+        self.randbytes = random.Random(self.seed).randbytes
+        self.backend = 'mt'
+        self.antithetic = False
+        self.cards = b''
+        # index of the next card in the block, and cards dealt so far
+        self.next = 0
+        self.position = 0
+        self.rank_counts = [4 * num_decks] * 13
+        if count_tags is not None:
+            self.count_tags = count_tags
+        self.running_count = initial_count
+        self.reshuffle_point = 0
+
+    def draw(self):
+        if self.next == len(self.cards):
+            self.cards = self.randbytes(self.block_size).translate(self.card_table, self.rejected)
+            self.next = 0
+        card = self.cards[self.next]
+        self.next += 1
+        self.position += 1
+        return card
+
+    # an infinite shoe is always full
+    def __len__(self):
+        return 52 * self.num_decks
+
+    def penetration(self):
+        return 0.0
+
+    def true_count(self):
+        return 0.0
+
+
+class ContinuousShuffler(Shoe):
+    """
+    A continuous shuffling machine holding num_decks decks. Each draw
+    takes a card at random from those in the machine. The cards of a
+    hand go to the discard tray when it is settled (discard()), and the
+    tray is loaded back into the machine lag hands later: with the
+    default lag of 1, a hand's discards are loaded while the next hand
+    is played, so they can't come out again until the hand after that.
+    The composition and count are of the cards in the machine.
+    """
+
+    replayable = False
+
+    def __init__(self, num_decks=6, rng=random, seed=None, lag=1, count_tags=None, initial_count=0):
+        if lag < 0:
+            raise ValueError("The discards can't be loaded before the hand is settled (lag must be 0 or more)")
+        self.num_decks = num_decks
+        self.seed = rng.getrandbits(64) if seed is None else seed
+        self.random = random.Random(self.seed).random
+        self.backend = 'mt'
+        self.antithetic = False
+        # the cards in the machine, in no particular order
+        self.cards = array('B', range(52)) * num_decks
+        self.size = len(self.cards)
+        # cards dealt in the hand in play, and the discards of each
+        # settled hand not yet loaded
+        self.hand = array('B')
+        self.tray = deque()
+        self.lag = lag
+        self.position = 0
+        self.rank_counts = [4 * num_decks] * 13
+        if count_tags is not None:
+            self.count_tags = count_tags
+        self.running_count = initial_count
+        self.reshuffle_point = 0
+
+    def draw(self):
+        cards = self.cards
+        if not cards:
+            # the dealer loads every discard rather than run dry
+            self.load(len(self.tray))
+        card = cards.pop(int(self.random() * len(cards)))
+        self.hand.append(card)
+        self.position += 1
+        rank = card % 13
+        self.rank_counts[rank] -= 1
+        self.running_count += self.count_tags[rank]
+        return card
+
+    def discard(self):
+        # the hand is settled: its cards go to the tray
+        self.tray.append(self.hand)
+        self.hand = array('B')
+        if len(self.tray) > self.lag:
+            self.load(len(self.tray) - self.lag)
+
+    def load(self, hands):
+        """
+        Load the discards of the oldest hands in the tray back into the
+        machine
+        """
+        rank_counts = self.rank_counts
+        count_tags = self.count_tags
+        for _ in range(hands):
+            discards = self.tray.popleft()
+            self.cards.extend(discards)
+            for card in discards:
+                rank = card % 13
+                rank_counts[rank] += 1
+                self.running_count -= count_tags[rank]
+
+    # number of cards in the machine
+    def __len__(self):
+        return len(self.cards)
+
+    def penetration(self):
+        # fraction of the cards out of the machine
+        return 1 - len(self.cards) / self.size
+
+    def true_count(self):
+        return self.running_count * 52 / len(self.cards)
+
+
+# shoe types by name, for command lines
+SHOES = {
+    'shoe': Shoe,
+    'infinite': InfiniteShoe,
+    'csm': ContinuousShuffler,
+}
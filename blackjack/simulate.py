@@ -0,0 +1,614 @@
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from . import metrics
+from . import strategy
+from .multiseat import MultiSeatTable
+from .run import Table, Shoe, card_values
+from .shoes import SHOES
+from .strategy import ACTION_CODES, UPCARDS
+
+HIT = ACTION_CODES['hit']
+STAND = ACTION_CODES['stand']
+DOUBLE = ACTION_CODES['double']
+SPLIT = ACTION_CODES['split']
+SURRENDER = ACTION_CODES['surrender']
+
+
+class Stats:
+    """
+    Running totals for a batch of simulated hands. Totals from separate
+    batches can be merged into a single set with merge().
+    """
+
+    def __init__(self):
+        self.hands = 0
+        self.wins = 0
+        self.losses = 0
+        self.pushes = 0
+        self.blackjacks = 0
+        self.splits = 0
+        self.doubles = 0
+        self.surrenders = 0
+        self.net = 0
+        # sum of squared net result per hand, used for the variance
+        self.net_squared = 0
+
+    def merge(self, other):
+        self.hands += other.hands
+        self.wins += other.wins
+        self.losses += other.losses
+        self.pushes += other.pushes
+        self.blackjacks += other.blackjacks
+        self.splits += other.splits
+        self.doubles += other.doubles
+        self.surrenders += other.surrenders
+        self.net += other.net
+        self.net_squared += other.net_squared
+        return self
+
+    def add_hand(self, table, bet, stack):
+        # a completed hand on a table that started it with stack
+        if len(table.hands) > 1:
+            self.splits += 1
+        elif table.natural:
+            self.blackjacks += 1
+        elif table.surrendered:
+            self.surrenders += 1
+        if max(table.bets) > bet:
+            self.doubles += 1
+        for result, hand_bet in zip(table.results, table.bets):
+            if result['winnings'] > hand_bet:
+                self.wins += 1
+            elif result['winnings'] == hand_bet:
+                self.pushes += 1
+            else:
+                self.losses += 1
+        net = table.player_stack - stack
+        self.hands += 1
+        self.net += net
+        self.net_squared += net * net
+        return net
+
+    @property
+    def variance(self):
+        # per-hand variance of the net result, in units of the initial bet
+        if self.hands < 2:
+            return 0
+        mean = self.net / self.hands
+        return (self.net_squared - self.hands * mean * mean) / (self.hands - 1)
+
+    def report(self, bet=1):
+        return {
+            'hands': self.hands,
+            'wins': self.wins,
+            'losses': self.losses,
+            'pushes': self.pushes,
+            'blackjacks': self.blackjacks,
+            'splits': self.splits,
+            'doubles': self.doubles,
+            'surrenders': self.surrenders,
+            'net': self.net,
+            'variance': self.variance / (bet * bet),
+            'house_edge': -self.net / (self.hands * bet) if self.hands else 0
+        }
+
+
+class Simulator:
+    """
+    Plays hands headlessly (no input, no rendering) against a Table's shoe
+    using a policy to choose every action, and keeps running totals of
+    the results.
+
+    A policy is any callable taking (table, hand) and returning one of the
+    actions in table.actions_permitted(hand=hand); the default is
+    Table.optimal_strategy. Passing a seed gives the simulator its own
+    random.Random stream so the sequence of shoes is reproducible, and
+    passing an rng (e.g. an rng.Stream, for another shuffle backend)
+    deals from that instead. Passing a handlog.HandLogWriter as hand_log
+    records every hand. Hands are played under rules (a rules.RuleSet)
+    if given, and dealt from shoes of type shoe (e.g. an InfiniteShoe or
+    ContinuousShuffler from shoes.py), called as shoe(num_decks, rng).
+
+    With the default policy, hands dealt from a Shoe are played by
+    play_hand_fast() straight from the shoe's cards, unless the table
+    logs or records its hands; see there for what the table doesn't see.
+    """
+
+    def __init__(self, num_decks=6, policy=None, bet=1, stack=1000, seed=None, hand_log=None, rules=None, rng=None,
+                 shoe=Shoe):
+        self.rng = rng or (random.Random(seed) if seed is not None else random)
+        self.table = Table(stack, num_decks, self.rng, rules)
+        self.shoe_type = shoe
+        if shoe is not Shoe:
+            self.table.shoe = self.new_shoe()
+        self.policy = policy or Table.optimal_strategy
+        # the strategy table and rules for play_hand_fast(), once loaded
+        self.fast = False if policy is not None else None
+        self.bet = bet
+        self.stack = stack
+        self.stats = Stats()
+        self.elapsed = 0
+        if hand_log is not None:
+            hand_log.attach(self.table)
+
+    def new_shoe(self):
+        # the shoe dealt from after a reshuffle
+        return self.shoe_type(self.table.shoe.num_decks, self.rng)
+
+    def next_bet(self):
+        # the bet for the next hand
+        return self.bet
+
+    def play_hand(self):
+        """
+        Play a single hand to completion, record it and return the
+        net units won
+        """
+        table = self.table
+        policy = self.policy
+        if table.reshuffle:
+            table.shoe = self.new_shoe()
+            table.reshuffle = False
+        # start every hand from the same stack so the table limits never apply
+        table.player_stack = self.stack
+        bet = self.next_bet()
+        if (self.fast is not False and type(table.shoe) is Shoe and table.hand_log is None
+                and not table.record_actions and table.on_hand_complete is None):
+            net = self.play_hand_fast(bet)
+            if net is not None:
+                return net
+        # same as start_hand() and step() without the state snapshots
+        table.reset_hand()
+        table.place_bet(bet)
+        table.deal()
+        while table.phase == 'action':
+            hand = table.active
+            table.take_action(policy(table, hand), hand)
+            table.advance()
+        return self.stats.add_hand(table, bet, self.stack)
+
+    def play_hand_fast(self, bet):
+        """
+        Play a hand with the optimal strategy from the shoe's cards
+        directly, without a Hand per hand or Table method calls per card
+        and decision, and return the net units won. The cards dealt, the
+        actions and the settlement are those of play_hand() through the
+        Table (the strategy table lookup, splits, the dealer's draws,
+        payouts, the shoe's position, count and reshuffle point) and so
+        are the stats, but table.hands, bets and results aren't updated.
+        Returns None without dealing if the hand needs the Table: an
+        action outside hit, stand, double, split and surrender.
+        """
+        table = self.table
+        if self.fast is None:
+            rules = table.rules
+            if table.strategy_table is None:
+                table.strategy_table = strategy.table_for(rules)
+            self.fast = (table.strategy_table.entries, rules.blackjack_payout, rules.hit_soft_17,
+                         rules.late_surrender, rules.max_hands, rules.double_after_split)
+        entries, payout, hit_soft_17, surrender, max_hands, _ = self.fast
+        table.bet = bet
+        bet = table.bet
+        shoe = table.shoe
+        cards = shoe.cards
+        values = card_values
+        start = position = shoe.position
+        # hands are kept as a hard total (aces as 1) and a count of aces
+        first = values[cards[position]]
+        second = values[cards[position + 1]]
+        upcard = values[cards[position + 2]]
+        position += 3
+        aces = (first == 11) + (second == 11)
+        hard = first + second - 10 * aces
+        dealer_aces = upcard == 11
+        dealer_hard = 1 if dealer_aces else upcard
+        stack = self.stack - bet
+        hand_bet = bet
+        stats = self.stats
+        natural = aces and hard == 11
+        surrendered = False
+        hands = None
+        if not natural:
+            # the first decision, with double and surrender permitted as
+            # for a single hand, and split if the rules allow two hands
+            chips = stack >= bet
+            pair = first == second
+            soft = aces > 0 and hard <= 11
+            value = hard + 10 if soft else hard
+            action = entries[(((value * 2 + soft) * 2 + pair) * UPCARDS + upcard) * 8
+                             + chips * 4 + (pair and max_hands > 1 and chips) * 2 + surrender]
+            if action == HIT:
+                while True:
+                    card = values[cards[position]]
+                    position += 1
+                    if card == 11:
+                        aces += 1
+                        hard += 1
+                    else:
+                        hard += card
+                    if hard > 21:
+                        break
+                    soft = aces > 0 and hard <= 11
+                    value = hard + 10 if soft else hard
+                    # no double, split or surrender after the first card
+                    action = entries[(value * 2 + soft) * 2 * UPCARDS * 8 + upcard * 8]
+                    if action == STAND:
+                        break
+                    if action != HIT:
+                        return None
+            elif action == DOUBLE:
+                stack -= hand_bet
+                hand_bet *= 2
+                card = values[cards[position]]
+                position += 1
+                if card == 11:
+                    aces += 1
+                    hard += 1
+                else:
+                    hard += card
+            elif action == SPLIT:
+                split = self.play_split_fast(cards, position, first, upcard, bet, stack)
+                if split is None:
+                    return None
+                hands, position, stack = split
+            elif action == SURRENDER:
+                surrendered = True
+            elif action != STAND:
+                return None
+        if hands is None:
+            value = hard + 10 if aces and hard <= 11 else hard
+            live = value <= 21
+        else:
+            live = any(value <= 21 for value, _ in hands)
+        # the dealer cards settling needs, as Table.dealer_cards_needed()
+        needed = 1 if surrendered or natural else 2 if live else 0
+        dealer_blackjack = False
+        if needed:
+            card = values[cards[position]]
+            position += 1
+            if card == 11:
+                dealer_aces += 1
+                dealer_hard += 1
+            else:
+                dealer_hard += card
+            dealer_blackjack = dealer_aces > 0 and dealer_hard == 11
+            if needed == 2 and not dealer_blackjack:
+                while True:
+                    dealer_soft = dealer_aces > 0 and dealer_hard <= 11
+                    dealer_value = dealer_hard + 10 if dealer_soft else dealer_hard
+                    if dealer_value > 17 or (dealer_value == 17 and not (hit_soft_17 and dealer_soft)):
+                        break
+                    card = values[cards[position]]
+                    position += 1
+                    if card == 11:
+                        dealer_aces += 1
+                        dealer_hard += 1
+                    else:
+                        dealer_hard += card
+        dealer_value = dealer_hard + 10 if dealer_aces and dealer_hard <= 11 else dealer_hard
+        # paid as Table.pay() and process_result(), and recorded as
+        # Stats.add_hand()
+        if surrendered:
+            winnings = 0 if dealer_blackjack else hand_bet / 2
+            stats.surrenders += 1
+        elif natural:
+            winnings = bet if dealer_blackjack else bet * (1 + payout)
+            stats.blackjacks += 1
+        else:
+            if hands is None:
+                hands = ((value, hand_bet),)
+                doubled = hand_bet > bet
+            else:
+                stats.splits += 1
+                doubled = any(hand_bet > bet for _, hand_bet in hands)
+            if doubled:
+                stats.doubles += 1
+            winnings = 0
+            for value, hand_bet in hands:
+                if value <= 21 and (value > dealer_value or dealer_value > 21):
+                    winnings += hand_bet * 2
+                    stats.wins += 1
+                elif value <= 21 and value == dealer_value and not dealer_blackjack:
+                    winnings += hand_bet
+                    stats.pushes += 1
+                else:
+                    stats.losses += 1
+        if surrendered or natural:
+            if winnings > hand_bet:
+                stats.wins += 1
+            elif winnings == hand_bet:
+                stats.pushes += 1
+            else:
+                stats.losses += 1
+        # the shoe as if every card had been drawn with Shoe.draw()
+        rank_counts = shoe.rank_counts
+        count_tags = shoe.count_tags
+        running_count = shoe.running_count
+        for card in cards[start:position]:
+            rank = card % 13
+            rank_counts[rank] -= 1
+            running_count += count_tags[rank]
+        shoe.running_count = running_count
+        shoe.position = position
+        if len(cards) - position < shoe.reshuffle_point:
+            table.reshuffle = True
+        table.player_stack = stack = stack + winnings
+        net = stack - self.stack
+        stats.hands += 1
+        stats.net += net
+        stats.net_squared += net * net
+        return net
+
+    def play_split_fast(self, cards, position, card, upcard, bet, stack):
+        """
+        Play the hands of a pair of card split with a bet of bet each, for
+        play_hand_fast(), from the shoe's cards at position (the second
+        card of the first hand). Hands are played and resplit as the Table
+        plays them: a resplit hand is played next, and a split hand is
+        dealt its second card when its turn comes. Returns the value and
+        bet of each hand in order, the position after them and the stack,
+        or None if a hand needs the Table.
+        """
+        entries, _, _, _, max_hands, double_after_split = self.fast
+        values = card_values
+        hands = []
+        # the first card of each hand still to be played, the next one last
+        pending = [card]
+        stack -= bet
+        while True:
+            second = values[cards[position]]
+            position += 1
+            aces = (card == 11) + (second == 11)
+            hard = card + second - 10 * aces
+            hand_bet = bet
+            two_cards = True
+            while True:
+                soft = aces > 0 and hard <= 11
+                value = hard + 10 if soft else hard
+                if two_cards:
+                    # no surrender once the pair is split
+                    chips = stack >= hand_bet
+                    pair = card == second
+                    split = pair and len(hands) + 1 + len(pending) < max_hands and chips
+                    action = entries[(((value * 2 + soft) * 2 + pair) * UPCARDS + upcard) * 8
+                                     + (double_after_split and chips) * 4 + split * 2]
+                else:
+                    action = entries[(value * 2 + soft) * 2 * UPCARDS * 8 + upcard * 8]
+                if action == STAND:
+                    break
+                if action == SPLIT and two_cards:
+                    stack -= bet
+                    pending.append(second)
+                    second = values[cards[position]]
+                    position += 1
+                    aces = (card == 11) + (second == 11)
+                    hard = card + second - 10 * aces
+                    continue
+                if action == DOUBLE and two_cards:
+                    stack -= hand_bet
+                    hand_bet *= 2
+                elif action != HIT:
+                    return None
+                drawn = values[cards[position]]
+                position += 1
+                if drawn == 11:
+                    aces += 1
+                    hard += 1
+                else:
+                    hard += drawn
+                two_cards = False
+                if hard > 21 or action == DOUBLE:
+                    break
+            hands.append((hard + 10 if aces and hard <= 11 else hard, hand_bet))
+            if not pending:
+                return hands, position, stack
+            card = pending.pop()
+
+    def run(self, num_hands):
+        """
+        Play num_hands hands and return the cumulative report
+        """
+        play_hand = self.play_hand
+        start = time.perf_counter()
+        for _ in range(num_hands):
+            play_hand()
+        self.elapsed += time.perf_counter() - start
+        return self.report()
+
+    def report(self):
+        report = self.stats.report(self.bet)
+        report['hands_per_sec'] = self.stats.hands / self.elapsed if self.elapsed else 0
+        return report
+
+
+class MultiSeatSimulator:
+    """
+    Plays rounds headlessly at a MultiSeatTable, every seat with its own
+    bet and policy (as for Simulator; the defaults are a bet of 1 and
+    Table.optimal_strategy), and keeps running totals for each seat in
+    seat_stats. The seats share the shoe, so every seat's decisions see
+    the cards removed by the others, and the dealer hand is played once
+    per round for all of them. The seed or rng and the shoe type are as
+    for Simulator.
+    """
+
+    def __init__(self, num_seats=7, num_decks=6, policies=None, bets=None, stack=1000, seed=None, rules=None,
+                 rng=None, shoe=Shoe):
+        self.rng = rng or (random.Random(seed) if seed is not None else random)
+        self.table = MultiSeatTable([stack] * num_seats, num_decks, self.rng, rules)
+        self.shoe_type = shoe
+        if shoe is not Shoe:
+            self.table.shoe = shoe(self.table.rules.num_decks, self.rng)
+        self.policies = policies or [Table.optimal_strategy] * num_seats
+        self.bets = bets or [1] * num_seats
+        if len(self.policies) != num_seats or len(self.bets) != num_seats:
+            raise ValueError(f"Expected a policy and a bet for each of {num_seats} seats")
+        self.stack = stack
+        self.seat_stats = [Stats() for _ in range(num_seats)]
+        self.elapsed = 0
+
+    def play_round(self):
+        """
+        Play one round to completion, record every seat's hand and
+        return the net units won by the table
+        """
+        table = self.table
+        if table.reshuffle:
+            table.shoe = self.shoe_type(table.shoe.num_decks, self.rng)
+            table.reshuffle = False
+        stack = self.stack
+        for seat in table.seats:
+            seat.player_stack = stack
+        table.start_round(self.bets)
+        for seat, policy in zip(table.seats, self.policies):
+            while seat.phase == 'action':
+                hand = seat.active
+                seat.take_action(policy(seat, hand), hand)
+                seat.advance()
+        table.advance()
+        net = 0
+        for seat, stats, bet in zip(table.seats, self.seat_stats, self.bets):
+            net += stats.add_hand(seat, bet, stack)
+        return net
+
+    def run(self, num_rounds):
+        """
+        Play num_rounds rounds and return the cumulative report over all
+        seats
+        """
+        play_round = self.play_round
+        start = time.perf_counter()
+        for _ in range(num_rounds):
+            play_round()
+        self.elapsed += time.perf_counter() - start
+        return self.report()
+
+    @property
+    def stats(self):
+        # totals over every seat
+        stats = Stats()
+        for seat_stats in self.seat_stats:
+            stats.merge(seat_stats)
+        return stats
+
+    def report(self):
+        # in units of the mean bet when the seats bet differently
+        stats = self.stats
+        report = stats.report(sum(self.bets) / len(self.bets))
+        report['hands_per_sec'] = stats.hands / self.elapsed if self.elapsed else 0
+        return report
+
+
+def _simulate_block(args):
+    num_decks, policy, bet, seed, num_hands, rules, seats, shoe, lanes = args
+    # the seed of the block's stream, or the rng.Stream itself
+    rng = seed if hasattr(seed, 'next_shoe') else random.Random(seed)
+    if lanes > 1:
+        from .batch_sim import BatchSimulator
+
+        simulator = BatchSimulator(num_decks, bet, rules=rules, rng=rng, lanes=lanes)
+        simulator.run(num_hands)
+    elif seats > 1:
+        simulator = MultiSeatSimulator(seats, num_decks, [policy] * seats if policy else None, [bet] * seats, rules=rules, rng=rng,
+                                       shoe=shoe)
+        # whole rounds, so the last round of a block may play a few extra hands
+        simulator.run(-(-num_hands // seats))
+    else:
+        simulator = Simulator(num_decks, policy, bet, rules=rules, rng=rng, shoe=shoe)
+        simulator.run(num_hands)
+    return simulator.stats
+
+
+def run_parallel(num_hands, seed=0, workers=None, num_decks=6, policy=None, bet=1, block_size=None, rules=None, seats=1,
+                 backend='mt', shoe=Shoe, lanes=1):
+    """
+    Split num_hands into fixed-size blocks and simulate them across a
+    process pool, merging the per-block totals into one report. With
+    more than one seat, each block is played as rounds at a
+    MultiSeatTable with every seat using the same policy and bet.
+
+    Block i is always played from its own stream seeded with (seed, i), so
+    the results depend only on seed, num_hands and block_size, never on
+    the number of workers. With a backend other than 'mt' (see rng.py),
+    the block streams are the children spawned from rng.Stream(seed).
+    Every block deals from shoes of type shoe, as for Simulator.
+    The policy must be picklable (e.g. a module level function) when more
+    than one worker is used.
+
+    With more than one lane, each block is played by a BatchSimulator
+    (see batch_sim.py) on that many shoes at once, which only plays the
+    optimal strategy with one seat and the default shoe. Blocks are then
+    100 hands per lane unless block_size is given, so most of the shoes
+    shuffled for a block are dealt to the cut card.
+    """
+    if lanes > 1 and (policy is not None or seats > 1 or shoe is not Shoe):
+        raise ValueError("Lanes play the optimal strategy with one seat and the default shoe only")
+    if block_size is None:
+        block_size = 100 * lanes if lanes > 1 else 10000
+    workers = workers or os.cpu_count()
+    sizes = [min(block_size, num_hands - start) for start in range(0, num_hands, block_size)]
+    if backend == 'mt':
+        seeds = [f'{seed}:{i}' for i in range(len(sizes))]
+    else:
+        from . import rng
+
+        seeds = rng.Stream(seed, backend).spawn(len(sizes))
+    blocks = [(num_decks, policy, bet, seeds[i], size, rules, seats, shoe, lanes) for i, size in enumerate(sizes)]
+    start = time.perf_counter()
+    # no pool for a single block, or none (Pool(0) raises ValueError)
+    if workers == 1 or len(blocks) <= 1:
+        block_stats = list(map(_simulate_block, blocks))
+    else:
+        with multiprocessing.Pool(min(workers, len(blocks))) as pool:
+            # map keeps the block order so the merge is always the same
+            block_stats = pool.map(_simulate_block, blocks, chunksize=1)
+    stats = Stats()
+    for block in block_stats:
+        stats.merge(block)
+    elapsed = time.perf_counter() - start
+    report = stats.report(bet)
+    report['hands_per_sec'] = stats.hands / elapsed if elapsed else 0
+    return report
+
+
+def print_report(report):
+    print(f'Hands: {report["hands"]}')
+    print(f'Wins / losses / pushes: {report["wins"]} / {report["losses"]} / {report["pushes"]}')
+    print(f'Blackjacks: {report["blackjacks"]}  Splits: {report["splits"]}  Doubles: {report["doubles"]}  Surrenders: {report["surrenders"]}')
+    print(f'Net units: {report["net"]:+g}')
+    print(f'Variance: {report["variance"]:.4f}')
+    print(f'House edge: {report["house_edge"]:.3%}')
+    print(f'Hands/sec: {report["hands_per_sec"]:,.0f}')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Simulate hands played with the optimal strategy')
+    parser.add_argument('hands', nargs='?', type=int, default=100000)
+    parser.add_argument('workers', nargs='?', type=int, default=1)
+    parser.add_argument('seed', nargs='?', type=int, default=0)
+    parser.add_argument('seats', nargs='?', type=int, default=1)
+    parser.add_argument('--rng', choices=('mt', 'pcg64', 'philox'), default='mt', help='shuffle backend (see rng.py)')
+    parser.add_argument('--shoe', choices=list(SHOES), default='shoe',
+                        help='a shoe reshuffled at the cut card, an infinite deck or a continuous shuffler')
+    parser.add_argument('--lanes', type=int, default=1,
+                        help='shoes played at once by a BatchSimulator (see batch_sim.py), e.g. 1024')
+    args = parser.parse_args(args)
+
+    metrics.install()
+    try:
+        report = run_parallel(args.hands, args.seed, args.workers, seats=args.seats, backend=args.rng,
+                              shoe=SHOES[args.shoe], lanes=args.lanes)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,391 @@
+"""
+Persistent player stacks, session results and decision counts.
+
+A store is any object with the methods of SQLiteStore below, the default
+(and so far only) backend:
+
+    load_stack(player)              the player's saved stack, or None
+    start_session(player, stack)    session id for a player sitting down
+    record_hand(session, table)     a completed hand, from the game loop
+    end_session(session, stack)     the player leaving
+    player_stats(player)            saved totals for a player, or None
+    flush()                         wait until everything is written
+    close()                         flush and stop
+
+The game loop only ever calls start_session, record_hand and end_session
+while playing, and those never touch the database: they put a row on a
+queue and return. A writer thread takes everything queued since its last
+write and writes it in one transaction (write-behind), so the batch grows
+with the load and the cost of a commit is shared by every hand in it.
+load_stack answers from the stacks held in memory first, so a player who
+leaves and sits down again gets the right stack before it is written.
+
+Each process opens one connection per database file (connect()), shared
+by every store on it and guarded by a lock. The database is in WAL mode,
+so several server processes can share a file.
+
+Usage: python3 -m blackjack.store stats PATH [PLAYER]
+       python3 -m blackjack.store bench PATH [--sessions N] [--hands N]
+"""
+
+import argparse
+import os
+import queue
+import random
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    name TEXT PRIMARY KEY,
+    stack REAL NOT NULL,
+    hands INTEGER NOT NULL DEFAULT 0,
+    net REAL NOT NULL DEFAULT 0,
+    decisions INTEGER NOT NULL DEFAULT 0,
+    deviations INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    player TEXT NOT NULL,
+    started REAL NOT NULL,
+    ended REAL,
+    start_stack REAL NOT NULL,
+    end_stack REAL
+);
+CREATE TABLE IF NOT EXISTS hands (
+    session TEXT NOT NULL,
+    player TEXT NOT NULL,
+    time REAL NOT NULL,
+    bet REAL NOT NULL,
+    wagered REAL NOT NULL,
+    net REAL NOT NULL,
+    stack REAL NOT NULL,
+    decisions INTEGER NOT NULL,
+    deviations INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hands_session ON hands (session);
+"""
+
+# (connection, lock) for each (process, database path)
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def connect(path):
+    """
+    The process's connection to a database file and the lock that must
+    be held to use it, opened (and the schema created) on first use
+    """
+    key = (os.getpid(), os.path.abspath(path))
+    with _connections_lock:
+        pooled = _connections.get(key)
+        if pooled is None:
+            # transactions are begun explicitly, one per batch
+            connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            pooled = _connections[key] = (connection, threading.Lock())
+        return pooled
+
+
+class SQLiteStore:
+    """
+    Store backed by an SQLite file, with hands written behind the game
+    loop by a background thread (see the module docstring)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection, self.lock = connect(path)
+        # player name for each open session
+        self.players = {}
+        # latest stack of each player seen by this store, which is ahead
+        # of the database until the writer catches up
+        self.stacks = {}
+        self.queue = queue.SimpleQueue()
+        self.written = 0
+        self.errors = 0
+        self.closed = False
+        self.writer = threading.Thread(target=self.write_behind, name=f'store-{path}', daemon=True)
+        self.writer.start()
+
+    def load_stack(self, player):
+        # a stack not yet written is newer than the saved one
+        stack = self.stacks.get(player)
+        if stack is not None:
+            return stack
+        with self.lock:
+            row = self.connection.execute('SELECT stack FROM players WHERE name = ?', (player,)).fetchone()
+        return row[0] if row else None
+
+    def start_session(self, player, stack):
+        session = uuid.uuid4().hex
+        self.players[session] = player
+        self.stacks[player] = stack
+        self.queue.put(('start', (session, player, time.time(), stack)))
+        return session
+
+    def record_hand(self, session, table):
+        """
+        Queue a completed hand on table (with record_actions set, for
+        the decision counts) for writing
+        """
+        player = self.players[session]
+        wagered = sum(table.bets) + table.insurance_bet
+        net = sum(result['winnings'] for result in table.results) + table.insurance_winnings - wagered
+        deviations = 0
+        for action, optimal in table.actions:
+            if action != optimal:
+                deviations += 1
+        self.stacks[player] = table.player_stack
+        self.queue.put(('hand', (
+            session, player, time.time(), table.bet, wagered, net, table.player_stack, len(table.actions), deviations
+        )))
+
+    def attach(self, table, session):
+        """
+        Record every hand completed on a table under a session
+        """
+        table.record_actions = True
+        table.on_hand_complete = lambda table: self.record_hand(session, table)
+        return table
+
+    def end_session(self, session, stack):
+        player = self.players.pop(session)
+        self.stacks[player] = stack
+        self.queue.put(('end', (time.time(), stack, session, player)))
+
+    def player_stats(self, player):
+        """
+        Totals for a player as written so far: stack, hands, net,
+        decisions, deviations and sessions
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT stack, hands, net, decisions, deviations FROM players WHERE name = ?', (player,)
+            ).fetchone()
+            if row is None:
+                return None
+            sessions = self.connection.execute('SELECT count(*) FROM sessions WHERE player = ?', (player,)).fetchone()[0]
+        stack, hands, net, decisions, deviations = row
+        return {
+            'stack': stack,
+            'hands': hands,
+            'net': net,
+            'decisions': decisions,
+            'deviations': deviations,
+            'deviation_rate': deviations / decisions if decisions else 0,
+            'sessions': sessions
+        }
+
+    def flush(self):
+        # wait for everything queued so far to be written
+        done = threading.Event()
+        self.queue.put(('flush', done))
+        done.wait()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(('close', None))
+        self.writer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_behind(self):
+        # writer thread: block for a row, then take whatever else is queued
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            waiting = []
+            rows = []
+            for kind, item in batch:
+                if kind == 'flush':
+                    waiting.append(item)
+                elif kind == 'close':
+                    stop = True
+                else:
+                    rows.append((kind, item))
+            if rows:
+                try:
+                    self.write(rows)
+                except sqlite3.Error as error:
+                    # the game goes on without the rows; report the first loss
+                    if not self.errors:
+                        print(f'{self.path}: failed to write {len(rows)} rows: {error}', file=sys.stderr)
+                    self.errors += 1
+            for done in waiting:
+                done.set()
+            if stop:
+                return
+
+    def write(self, rows):
+        """
+        Write a batch of queued rows in one transaction
+        """
+        starts = []
+        hands = []
+        ends = []
+        # per player: [latest stack, hands, net, decisions, deviations]
+        totals = {}
+        for kind, row in rows:
+            if kind == 'hand':
+                session, player, _, _, _, net, stack, decisions, deviations = row
+                hands.append(row)
+                total = totals.get(player)
+                if total is None:
+                    totals[player] = [stack, 1, net, decisions, deviations]
+                else:
+                    total[0] = stack
+                    total[1] += 1
+                    total[2] += net
+                    total[3] += decisions
+                    total[4] += deviations
+            elif kind == 'start':
+                starts.append(row)
+                session, player, _, stack = row
+                total = totals.get(player)
+                if total is None:
+                    totals[player] = [stack, 0, 0, 0, 0]
+                else:
+                    total[0] = stack
+            else:
+                # the stack a player leaves with is their saved stack
+                ended, stack, session, player = row
+                ends.append((ended, stack, session))
+                total = totals.get(player)
+                if total is None:
+                    totals[player] = [stack, 0, 0, 0, 0]
+                else:
+                    total[0] = stack
+        now = time.time()
+        with self.lock:
+            connection = self.connection
+            connection.execute('BEGIN')
+            try:
+                connection.executemany('INSERT INTO sessions (id, player, started, start_stack) VALUES (?, ?, ?, ?)', starts)
+                connection.executemany('INSERT INTO hands VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', hands)
+                connection.executemany(
+                    'INSERT INTO players VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET '
+                    'stack = excluded.stack, hands = hands + excluded.hands, net = net + excluded.net, '
+                    'decisions = decisions + excluded.decisions, deviations = deviations + excluded.deviations, '
+                    'updated = excluded.updated',
+                    [(player, *total, now) for player, total in totals.items()]
+                )
+                connection.executemany('UPDATE sessions SET ended = ?, end_stack = ? WHERE id = ?', ends)
+                connection.execute('COMMIT')
+            except sqlite3.Error:
+                connection.execute('ROLLBACK')
+                raise
+        self.written += len(rows)
+
+
+def from_env():
+    """
+    Store for the database named by BLACKJACK_STORE, closed on exit, or
+    None if it isn't set
+    """
+    path = os.environ.get('BLACKJACK_STORE')
+    if not path:
+        return None
+    import atexit
+
+    store = SQLiteStore(path)
+    atexit.register(store.close)
+    return store
+
+
+def bench(path, sessions, hands, seed=0):
+    """
+    Play hands round-robin across sessions on one thread, as the game
+    server does, and return (hands per second until everything is
+    written, slowest record_hand call in seconds)
+    """
+    from .run import Table, Shoe
+
+    rng = random.Random(seed)
+    store = SQLiteStore(path)
+    slowest = 0
+
+    def record_hand(session, table):
+        nonlocal slowest
+        call_start = time.perf_counter()
+        store.record_hand(session, table)
+        slowest = max(slowest, time.perf_counter() - call_start)
+
+    tables = []
+    for index in range(sessions):
+        table = Table(1000, 6, rng)
+        table.record_actions = True
+        session = store.start_session(f'bench-{index}', 1000)
+        table.on_hand_complete = lambda table, session=session: record_hand(session, table)
+        tables.append((table, session))
+    start = time.perf_counter()
+    for _ in range(hands):
+        for table, _ in tables:
+            if table.reshuffle or table.player_stack < 10:
+                table.shoe = Shoe(6, rng)
+                table.reshuffle = False
+                table.player_stack = 1000
+            table.start_hand(10)
+            while table.phase == 'action':
+                table.take_action(table.optimal_strategy())
+                table.advance()
+    for table, session in tables:
+        store.end_session(session, table.player_stack)
+    store.flush()
+    elapsed = time.perf_counter() - start
+    store.close()
+    return sessions * hands / elapsed, slowest
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Show or benchmark a player store')
+    commands = parser.add_subparsers(dest='command', required=True)
+    stats_parser = commands.add_parser('stats', help='show the totals for a player, or every player')
+    stats_parser.add_argument('path')
+    stats_parser.add_argument('player', nargs='?')
+    bench_parser = commands.add_parser('bench', help='measure hands written per second')
+    bench_parser.add_argument('path')
+    bench_parser.add_argument('--sessions', type=int, default=1000)
+    bench_parser.add_argument('--hands', type=int, default=20)
+    args = parser.parse_args(args)
+
+    if args.command == 'bench':
+        rate, slowest = bench(args.path, args.sessions, args.hands)
+        print(f'{args.sessions * args.hands:,} hands across {args.sessions:,} sessions: {rate:,.0f} hands/sec, '
+              f'slowest record_hand {slowest * 1e6:.0f} us')
+        return 0
+    with SQLiteStore(args.path) as store:
+        if args.player:
+            players = [args.player]
+        else:
+            with store.lock:
+                players = [row[0] for row in store.connection.execute('SELECT name FROM players ORDER BY name')]
+        for player in players:
+            stats = store.player_stats(player)
+            if stats is None:
+                print(f'{player}: no saved games')
+                continue
+            print(f'{player}: stack {stats["stack"]:g}, {stats["sessions"]} sessions, {stats["hands"]} hands, '
+                  f'net {stats["net"]:+g}, {stats["deviations"]}/{stats["decisions"]} decisions off strategy')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,280 @@
+import os
+import sys
+
+from .rules import RuleSet
+
+# action codes stored in the table; 0 means no action is possible
+ACTIONS = (False, 'hit', 'stand', 'double', 'split', 'surrender', 'insure')
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+# table dimensions: player total 0-21, soft flag, pair flag,
+# dealer upcard 0-11 (only 2-11 used), double allowed, split allowed,
+# surrender allowed
+TOTALS = 22
+UPCARDS = 12
+SIZE = TOTALS * 2 * 2 * UPCARDS * 2 * 2 * 2
+
+MAGIC = b'BJST2'
+
+# version of the EVs (ev.py) and the generator (generate_table) behind a
+# generated table: part of the cache file name, so bump it whenever
+# either would generate a different table and the old files are ignored
+GENERATOR_VERSION = 1
+
+# generated tables are saved here, named by the generator version and
+# the hash of their rule set: the user's cache directory by default, as
+# an installed package's own directory may not be writable
+CACHE_DIR = os.environ.get('BLACKJACK_CACHE_DIR') or os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'blackjack'
+    )
+
+
+def state_index(value, soft, pair, upcard, double, split, surrender):
+    return (((((value * 2 + soft) * 2 + pair) * UPCARDS + upcard) * 2 + double) * 2 + split) * 2 + surrender
+
+
+class StrategyTable:
+    """
+    Dense lookup table of the optimal action for every decision state,
+    indexed by (player total, soft, pair, dealer upcard, double allowed,
+    split allowed, surrender allowed). Each entry is one byte holding an
+    index into ACTIONS.
+
+    On disk the table is MAGIC followed by the SIZE entries in row-major
+    order of the index above, so it can be read without this module.
+    """
+
+    def __init__(self, entries):
+        if len(entries) != SIZE:
+            raise ValueError(f"Strategy table must have {SIZE} entries")
+        self.entries = bytes(entries)
+
+    def lookup(self, value, soft, pair, upcard, double, split, surrender):
+        return ACTIONS[self.entries[(((((value * 2 + soft) * 2 + pair) * UPCARDS + upcard) * 2 + double) * 2 + split) * 2 + surrender]]
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(MAGIC + self.entries)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path} is not a strategy table")
+        return cls(data[len(MAGIC):])
+
+
+def reachable_states(rules=None, exhaustive=True):
+    """
+    Yield (table, hand) for every distinct decision a player can face
+    under a rule set (the default rules if None): every hand of up to 21
+    against every dealer upcard, as a first action with and without
+    chips to double/split, and on a hand after a split, both with room
+    for another split and at the most hands allowed. The same Table is
+    reused and modified between yields. States where no action is
+    permitted (e.g. a blackjack) are not decisions and are skipped.
+
+    Hands of 3 or more cards only differ by hard total and whether they
+    hold an ace, so with exhaustive=False one hand is yielded for each.
+    """
+    for table, hand in _candidate_states(rules or RuleSet(), exhaustive):
+        if table.action_permitted('hit', hand):
+            yield table, hand
+
+
+def _candidate_states(rules, exhaustive):
+    from .run import Table, Deck, Hand
+
+    # one card id per blackjack value (2-9, 10 and ace)
+    value_cards = [0, 1, 2, 3, 4, 5, 6, 7, 8, 12]
+
+    seen = set()
+
+    def hands(cards, hard_total, first):
+        # multisets of card values with a hard total (aces as 1) of 21 or less
+        if len(cards) == 2:
+            yield cards
+        elif len(cards) > 2:
+            key = (hard_total, 12 in cards)
+            if exhaustive or key not in seen:
+                seen.add(key)
+                yield cards
+        for i in range(first, len(value_cards)):
+            card = value_cards[i]
+            hard_value = 1 if card == 12 else Deck.get_value(card)
+            if hard_total + hard_value > 21:
+                continue
+            yield from hands(cards + [card], hard_total + hard_value, i)
+
+    # numbers of hands after splitting: one split, and as many as allowed
+    split_hands = sorted({2, rules.max_hands}) if rules.max_hands > 1 else []
+    table = Table(1000, rules=rules)
+    table.reset_hand()
+    table.bet = 10
+    table.bet_placed = True
+    for cards in hands([], 0, 0):
+        for upcard in value_cards:
+            table.dealer_cards = Hand([upcard])
+            # first hand, with and without enough chips to double or split
+            table.hands = [Hand(cards)]
+            table.bets = [10]
+            for stack in [1000, 5]:
+                table.player_stack = stack
+                yield table, 0
+            if len(cards) == 2:
+                # first of the hands after a split
+                for count in split_hands:
+                    table.hands = [Hand(cards)] + [Hand(cards[:1]) for _ in range(count - 1)]
+                    table.bets = [10] * count
+                    for stack in [1000, 5]:
+                        table.player_stack = stack
+                        yield table, 0
+
+
+def decision_state(table, hand=None):
+    """
+    Return the lookup key (total, soft, pair, upcard, double, split,
+    surrender) for the current decision on a hand (by default the
+    active hand)
+    """
+    from .run import Deck
+
+    if hand is None:
+        hand = table.active
+    cards = table.hands[hand]
+    pair = len(cards) == 2 and Deck.get_value(cards[0]) == Deck.get_value(cards[1])
+    return (
+        cards.value,
+        cards.soft,
+        pair,
+        Deck.get_value(table.dealer_cards[0]),
+        table.action_permitted('double', hand),
+        table.action_permitted('split', hand),
+        table.action_permitted('surrender', hand)
+    )
+
+
+def compile_table():
+    """
+    Build the table for the default rules from Table.reference_strategy
+    by evaluating it on every reachable state
+    """
+    entries = bytearray(SIZE)
+    filled = {}
+    for table, hand in reachable_states(exhaustive=False):
+        index = state_index(*decision_state(table, hand))
+        code = ACTION_CODES[table.reference_strategy(hand)]
+        if filled.setdefault(index, code) != code:
+            raise ValueError(f"Strategy depends on more than the table index at {decision_state(table, hand)}")
+        entries[index] = code
+    return StrategyTable(entries)
+
+
+def generate_table(rules):
+    """
+    Build the table for a rule set from the EV-maximising action in
+    every reachable state, with the EVs (see ev.situation_evs) taken from
+    a full shoe less the dealer upcard
+    """
+    from . import ev
+
+    entries = bytearray(SIZE)
+    full_shoe = ev.full_shoe(rules.num_decks)
+    for table, hand in reachable_states(rules, exhaustive=False):
+        state = decision_state(table, hand)
+        index = state_index(*state)
+        if entries[index]:
+            continue
+        comp = ev.remove(full_shoe, table.dealer_cards[0])
+        evs = ev.situation_evs(*state[:4], comp, *state[4:], rules=rules)
+        entries[index] = ACTION_CODES[max(evs, key=evs.get)]
+    return StrategyTable(entries)
+
+
+def verify(strategy_table):
+    """
+    Compare the table with Table.reference_strategy on every reachable
+    state and return the list of mismatches as (state, expected, found)
+    """
+    mismatches = []
+    for table, hand in reachable_states():
+        state = decision_state(table, hand)
+        expected = table.reference_strategy(hand)
+        found = strategy_table.lookup(*state)
+        if found != expected:
+            mismatches += [(state, expected, found)]
+    return mismatches
+
+
+def uses_reference(rules):
+    # Table.reference_strategy is the strategy for the default rules in
+    # any number of decks; the blackjack payout and insurance don't
+    # change how hands are played
+    return rules._replace(num_decks=6, insurance=False, blackjack_payout=1.5) == RuleSet()
+
+
+def cache_path(rules):
+    return os.path.join(CACHE_DIR, f'strategy-v{GENERATOR_VERSION}-{rules.digest()}.bin')
+
+
+def save_cached(strategy_table, path):
+    # write then rename so other processes never read a partial table
+    temporary_path = f'{path}.{os.getpid()}'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        strategy_table.save(temporary_path)
+        os.replace(temporary_path, path)
+    except OSError:
+        # e.g. a read-only cache: don't leave a partial table behind
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+
+
+_tables = {}
+
+
+def table_for(rules):
+    """
+    The table for a rule set: compiled from Table.reference_strategy for
+    the default rules, otherwise generated from exact EVs. Generated
+    tables take seconds to build, so they are saved in CACHE_DIR and
+    loaded from there by later runs; if CACHE_DIR can't be written the
+    table is only kept in memory.
+    """
+    strategy_table = _tables.get(rules)
+    if strategy_table is not None:
+        return strategy_table
+    if uses_reference(rules):
+        strategy_table = compile_table()
+    else:
+        path = cache_path(rules)
+        try:
+            strategy_table = StrategyTable.load(path)
+        except (OSError, ValueError):
+            strategy_table = generate_table(rules)
+            save_cached(strategy_table, path)
+    _tables[rules] = strategy_table
+    return strategy_table
+
+
+def default_table():
+    """
+    The table for the default rules, compiled on first use
+    """
+    return table_for(RuleSet())
+
+
+if __name__ == '__main__':
+    # python3 -m blackjack.strategy verify | save <path>
+    command = sys.argv[1] if len(sys.argv) > 1 else 'verify'
+    if command == 'save':
+        default_table().save(sys.argv[2])
+    else:
+        mismatches = verify(default_table())
+        for state, expected, found in mismatches:
+            print(f'{state}: expected {expected}, found {found}')
+        print(f'{len(mismatches)} mismatches')
+        sys.exit(1 if mismatches else 0)
@@ -1,5 +1,11 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const net = require('net');
+
+// When set, connections are bridged to the Python game server
+// (python3 -m blackjack.server) instead of spawning a run.py process per
+// connection
+const GAME_SERVER_PORT = process.env.GAME_SERVER_PORT;
 
 exports.install = function () {
 
@@ -15,6 +21,29 @@ function socket() {
 
     this.on('open', function (client) {
 
+        if (GAME_SERVER_PORT) {
+            client.tty = net.connect(parseInt(GAME_SERVER_PORT), '127.0.0.1');
+            // decode across chunks, so a box-drawing character split
+            // between two reads isn't mangled
+            client.tty.setEncoding('utf8');
+            // same interface as the pty below; the signal is ignored, as
+            // destroy(err) would emit 'error' with it
+            client.tty.kill = function () {
+                this.destroy();
+            };
+            client.tty.on('close', function () {
+                client.tty = null;
+                client.close();
+            });
+            client.tty.on('error', function (err) {
+                console.log('Game server error: ', err);
+            });
+            client.tty.on('data', function (data) {
+                client.send(data);
+            });
+            return;
+        }
+
         // Spawn terminal
         client.tty = Pty.spawn('python3', ['run.py'], {
             name: 'xterm-color',
@@ -0,0 +1,28 @@
+"""
+Decision analytics from hand logs
+"""
+
+from blackjack.analytics import Analytics
+from blackjack.handlog import HandLogWriter
+from blackjack.replay import Replayer
+from blackjack.simulate import Simulator
+
+
+def test_ingest_log_skips_hands_that_run_the_shoe_dry(tmp_path, monkeypatch):
+    path = str(tmp_path / 'hands.log')
+    with HandLogWriter(path) as log:
+        Simulator(seed=3, hand_log=log).run(20)
+    replay = Replayer.replay
+    calls = []
+
+    def replay_running_dry(self, record):
+        calls.append(record)
+        if len(calls) == 5:
+            raise IndexError('array index out of range')
+        return replay(self, record)
+
+    monkeypatch.setattr(Replayer, 'replay', replay_running_dry)
+    analytics = Analytics()
+    assert analytics.ingest_log(path) == 1
+    assert len(calls) == 20
+    assert analytics.overall.totals()['decisions'] > 0
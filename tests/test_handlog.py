@@ -0,0 +1,44 @@
+"""
+Hand logs written by HandLogWriter and read back by HandLogReader
+"""
+
+import pytest
+
+from blackjack.handlog import HEADER, RECORD, HandLogReader, HandLogWriter
+from blackjack.simulate import Simulator
+
+
+def write_hands(path, hands, seed):
+    with HandLogWriter(str(path)) as log:
+        Simulator(seed=seed, hand_log=log).run(hands)
+
+
+def test_records_round_trip(tmp_path):
+    path = tmp_path / 'hands.log'
+    write_hands(path, 50, 1)
+    reader = HandLogReader(str(path))
+    assert len(reader.records) == 50
+    assert path.stat().st_size == len(HEADER) + 50 * RECORD.size
+    assert (reader.records['num_decks'] == 6).all()
+
+
+def test_appending_after_a_torn_record_keeps_records_aligned(tmp_path):
+    path = tmp_path / 'hands.log'
+    write_hands(path, 20, 1)
+    expected = HandLogReader(str(path)).records.copy()
+    # a crash part way through writing a record
+    with open(path, 'ab') as f:
+        f.write(b'\x01' * (RECORD.size // 2))
+    write_hands(path, 10, 2)
+    records = HandLogReader(str(path)).records
+    assert path.stat().st_size == len(HEADER) + 30 * RECORD.size
+    assert (records[:20] == expected).all()
+    assert (records['num_decks'] == 6).all()
+
+
+def test_writer_rejects_a_file_that_is_not_a_log(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_bytes(b'not a hand log at all')
+    with pytest.raises(ValueError):
+        HandLogWriter(str(path))
+    assert path.read_bytes() == b'not a hand log at all'
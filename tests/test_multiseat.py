@@ -0,0 +1,18 @@
+"""
+Seats sharing a shoe and dealer hand at a MultiSeatTable
+"""
+
+import random
+
+from blackjack.multiseat import MultiSeatTable
+
+
+def test_seats_deal_from_the_one_shoe_shuffled_for_the_table():
+    table = MultiSeatTable([1000] * 3, rng=random.Random(5))
+    # the table's shoe is the first thing drawn from rng
+    assert table.shoe.seed == random.Random(5).getrandbits(64)
+    assert all(seat.shoe is table.shoe for seat in table.seats)
+    table.start_round([10, 10, 10])
+    # a card to each seat, then the upcard, then a second card each
+    assert table.shoe.position >= 7
+    assert table.dealer_cards[0] == table.shoe.cards[3]
@@ -0,0 +1,56 @@
+"""
+Logged hands played again by Replayer and checked against the log
+"""
+
+import pytest
+
+from blackjack import rng
+from blackjack.handlog import HandLogReader, HandLogWriter
+from blackjack.replay import Replayer, replay_log
+from blackjack.rules import RuleSet
+from blackjack.simulate import Simulator
+
+
+def write_log(path, hands, **kwargs):
+    with HandLogWriter(str(path)) as log:
+        Simulator(hand_log=log, **kwargs).run(hands)
+    return str(path)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'seed': 1},
+    {'seed': 2, 'rules': RuleSet(2, max_hands=2, blackjack_payout=1.2)},
+    {'rng': rng.Stream(3, 'philox')},
+])
+def test_logged_hands_replay_identically(tmp_path, kwargs):
+    path = write_log(tmp_path / 'hands.log', 300, **kwargs)
+    report = replay_log(path)
+    assert report['hands'] == 300
+    assert report['failures'] == []
+
+
+def test_changed_fields_are_reported(tmp_path):
+    path = write_log(tmp_path / 'hands.log', 20, seed=1)
+    with HandLogReader(path) as log:
+        record = log.records[0].copy()
+    record['winnings'][0] += 1
+    assert Replayer().check(record.tobytes()) == ['winnings']
+
+
+def test_unfinished_hand_is_an_error(tmp_path):
+    path = write_log(tmp_path / 'hands.log', 50, seed=1)
+    with HandLogReader(path) as log:
+        record = next(record.copy() for record in log.records if record['actions'].any())
+    record['actions'][:] = 0
+    assert Replayer().check(record.tobytes()) == ["Hand not complete after the logged actions"]
+
+
+def test_hand_past_the_end_of_the_shoe_is_an_error(tmp_path):
+    path = write_log(tmp_path / 'hands.log', 20, seed=1)
+    with HandLogReader(path) as log:
+        record = log.records[0].copy()
+    record['position'] = 6 * 52 - 2
+    problems = Replayer().check(record.tobytes())
+    assert len(problems) == 1 and 'runs past the end' in problems[0]
+    with pytest.raises(ValueError):
+        Replayer().shoe_at(int(record['seed']), 6, 6 * 52 - 2, cards=3)
@@ -0,0 +1,108 @@
+"""
+Headless simulation: the fast paths against the Table engine
+"""
+
+import random
+from array import array
+
+import pytest
+
+from blackjack import strategy
+from blackjack.batch_sim import BatchSimulator
+from blackjack.rules import RuleSet
+from blackjack.run import Shoe, Table
+from blackjack.simulate import Simulator, Stats, run_parallel
+
+RULES = [
+    None,
+    RuleSet(2, late_surrender=True, hit_soft_17=True, blackjack_payout=1.2),
+    RuleSet(1, max_hands=2, double_after_split=False),
+    RuleSet(8, max_hands=1),
+]
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # strategy tables generated for the rules aren't written to the user's cache
+    monkeypatch.setattr(strategy, 'CACHE_DIR', str(tmp_path))
+
+
+def table_policy(table, hand):
+    # the optimal strategy as a policy, so every hand goes through the Table
+    return Table.optimal_strategy(table, hand)
+
+
+class SeedList:
+    # deals shoes from a list of seeds, as an rng for Shoe
+    def __init__(self, seeds):
+        self.seeds = iter(seeds)
+
+    def getrandbits(self, k):
+        return next(self.seeds)
+
+
+def without_rate(report):
+    report.pop('hands_per_sec')
+    return report
+
+
+def test_shoe_shuffle_matches_random_shuffle():
+    for num_decks in (1, 6, 8, 10):
+        for seed in range(50):
+            shuffler = random.Random(seed)
+            cards = array('B', range(52)) * num_decks
+            shuffler.shuffle(cards)
+            assert Shoe.shuffle(seed, num_decks) == (cards, shuffler.randint(30, 52 * num_decks))
+
+
+@pytest.mark.parametrize('rules', RULES)
+def test_fast_path_plays_as_the_table(rules):
+    fast = Simulator(seed=7, rules=rules)
+    slow = Simulator(seed=7, rules=rules, policy=table_policy)
+    assert without_rate(fast.run(5000)) == without_rate(slow.run(5000))
+    assert fast.table.shoe.position == slow.table.shoe.position
+    assert fast.table.shoe.running_count == slow.table.shoe.running_count
+    assert fast.table.shoe.rank_counts == slow.table.shoe.rank_counts
+
+
+@pytest.mark.parametrize('rules', RULES)
+def test_one_lane_plays_as_a_simulator(rules):
+    batch = BatchSimulator(seed=7, rules=rules, lanes=1).run(5000)
+    single = Simulator(seed=7, rules=rules).run(5000)
+    assert without_rate(batch) == pytest.approx(without_rate(single))
+    assert batch['net'] == single['net']
+
+
+def test_each_lane_plays_as_a_simulator_on_its_shoes():
+    lanes = 5
+    seeds = [[] for _ in range(lanes)]
+
+    class Recording(BatchSimulator):
+        def new_shoe(self, lane):
+            shoe = super().new_shoe(lane)
+            seeds[lane].append(shoe.seed)
+            return shoe
+
+    batch = Recording(seed=3, lanes=lanes)
+    seeds[0].append(batch.shoes[0].seed)
+    # a short last step, played on the first lanes only
+    report = batch.run(lanes * 400 + 2)
+    stats = Stats()
+    for lane in range(lanes):
+        simulator = Simulator(rng=SeedList(seeds[lane]))
+        simulator.run(401 if lane < 2 else 400)
+        stats.merge(simulator.stats)
+    assert without_rate(report) == pytest.approx(stats.report())
+
+
+def test_lanes_play_the_optimal_strategy_only():
+    with pytest.raises(ValueError):
+        run_parallel(1000, workers=1, policy=table_policy, lanes=4)
+    with pytest.raises(ValueError):
+        run_parallel(1000, workers=1, seats=2, lanes=4)
+
+
+def test_run_parallel_with_no_hands():
+    report = run_parallel(0, workers=2)
+    assert report['hands'] == 0
+    assert report['house_edge'] == 0
@@ -0,0 +1,50 @@
+"""
+The compiled strategy table against Table.reference_strategy
+"""
+
+from blackjack import strategy
+from blackjack.rules import RuleSet
+
+
+def test_default_table_matches_reference_on_every_reachable_state():
+    assert strategy.verify(strategy.default_table()) == []
+
+
+def test_optimal_strategy_matches_reference_on_every_reachable_state():
+    mismatches = []
+    for table, hand in strategy.reachable_states():
+        expected = table.reference_strategy(hand)
+        found = table.optimal_strategy(hand)
+        if found != expected:
+            mismatches.append((strategy.decision_state(table, hand), expected, found))
+    assert mismatches == []
+
+
+def test_reference_rules_in_any_number_of_decks():
+    # the reference strategy is used for the default rules in any shoe
+    assert strategy.uses_reference(RuleSet(2))
+    assert not strategy.uses_reference(RuleSet(hit_soft_17=True))
+
+
+def test_generated_table_is_kept_in_memory_if_the_cache_cant_be_written(tmp_path, monkeypatch):
+    # a cache directory under a regular file can't be created
+    blocker = tmp_path / 'file'
+    blocker.write_bytes(b'')
+    monkeypatch.setattr(strategy, 'CACHE_DIR', str(blocker / 'cache'))
+    monkeypatch.setattr(strategy, '_tables', {})
+    rules = RuleSet(hit_soft_17=True)
+    strategy_table = strategy.table_for(rules)
+    assert strategy.table_for(rules) is strategy_table
+
+
+def test_failed_cache_write_leaves_no_temporary_file(tmp_path, monkeypatch):
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(strategy.MAGIC)
+        raise OSError('disk full')
+
+    monkeypatch.setattr(strategy, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(strategy, '_tables', {})
+    monkeypatch.setattr(strategy.StrategyTable, 'save', save)
+    strategy.table_for(RuleSet(hit_soft_17=True))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,131 @@
+"""
+The Table state machine: start_hand(), step() and settlement
+"""
+
+import random
+from array import array
+
+import pytest
+
+from blackjack.rules import RuleSet
+from blackjack.run import Table
+
+# card id of each rank in the first suit (T for any ten)
+CARDS = {rank: card for card, rank in enumerate('23456789TJQKA')}
+
+
+def table_in_action(seed=0):
+    # a table waiting for the first action of a hand, dealt from seeded shoes
+    rng = random.Random(seed)
+    while True:
+        table = Table(1000, 6, rng)
+        table.start_hand(10)
+        if table.phase == 'action':
+            return table
+
+
+def stacked_table(ranks, rules=None):
+    # a table whose shoe deals ranks first (player, player, dealer, then
+    # in order of drawing), followed by the rest of a shuffled shoe
+    table = Table(1000, rules=rules)
+    table.shoe.cards = array('B', [CARDS[rank] for rank in ranks]) + table.shoe.cards
+    return table
+
+
+def test_start_hand_mid_hand_raises_and_keeps_the_hand():
+    table = table_in_action()
+    state = table.state()
+    with pytest.raises(ValueError):
+        table.start_hand(10)
+    # the hand in play and the chips wagered on it are untouched
+    assert table.state() == state
+    assert table.player_stack == 990
+    while table.phase == 'action':
+        table.step(table.optimal_strategy())
+    assert table.phase == 'complete'
+
+
+def test_start_hand_after_a_hand_is_complete():
+    table = table_in_action()
+    table.step('stand')
+    assert table.phase == 'complete'
+    stack = table.player_stack
+    state = table.start_hand(20)
+    assert state.bets == (20,)
+    assert table.player_stack == stack - 20
+
+
+def test_step_outside_a_hand_raises():
+    table = Table(1000)
+    with pytest.raises(ValueError):
+        table.step('hit')
+
+
+def test_natural_pays_the_blackjack_payout():
+    table = stacked_table('AK9')
+    state = table.start_hand(10)
+    assert state.phase == 'complete'
+    assert state.results[0].winnings == 25
+    table = stacked_table('AK9', RuleSet(blackjack_payout=1.2))
+    assert table.start_hand(10).results[0].winnings == 22
+
+
+def test_split_21_is_not_a_blackjack():
+    # a two-card 21 on a split hand pays even money...
+    table = stacked_table('TT9AT8')
+    table.start_hand(10)
+    table.step('split')
+    table.step('stand')
+    state = table.step('stand')
+    assert [result.winnings for result in state.results] == [20, 20]
+    # ...and loses to a dealer blackjack like the other split hand
+    table = stacked_table('TTAATK')
+    table.start_hand(10)
+    table.step('split')
+    table.step('stand')
+    state = table.step('stand')
+    assert [result.winnings for result in state.results] == [0, 0]
+    assert table.player_stack == 980
+
+
+def test_late_surrender():
+    rules = RuleSet(late_surrender=True)
+    table = stacked_table('T6T7', rules)
+    table.start_hand(10)
+    assert table.step('surrender').results[0].winnings == 5
+    assert table.player_stack == 995
+    # a dealer blackjack takes the whole bet
+    table = stacked_table('T6TA', rules)
+    table.start_hand(10)
+    assert table.step('surrender').results[0].winnings == 0
+    assert table.player_stack == 990
+    assert 'surrender' not in stacked_table('T6T7').start_hand(10).legal_actions
+
+
+def test_insurance_pays_2_to_1_on_a_dealer_blackjack():
+    rules = RuleSet(insurance=True)
+    table = stacked_table('T9AK', rules)
+    table.start_hand(10)
+    table.step('insure')
+    table.step('stand')
+    # the hand is lost and the insurance of 5 returns 15
+    assert table.player_stack == 1000
+    table = stacked_table('T9A7', rules)
+    table.start_hand(10)
+    table.step('insure')
+    table.step('stand')
+    # 19 beats the dealer's soft 18 and the insurance is lost
+    assert table.player_stack == 1005
+    assert 'insure' not in stacked_table('T9AK').start_hand(10).legal_actions
+
+
+def test_dealer_hits_soft_17_only_under_h17():
+    # player 18 against a dealer soft 17 (A, 6), then a 2 for the dealer
+    table = stacked_table('T8A62')
+    table.start_hand(10)
+    assert table.step('stand').results[0].winnings == 20
+    table = stacked_table('T8A62', RuleSet(hit_soft_17=True))
+    table.start_hand(10)
+    state = table.step('stand')
+    assert state.dealer_cards[-1] == CARDS['2']
+    assert state.results[0].winnings == 0